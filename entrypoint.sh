@@ -14,4 +14,5 @@ fi
 
 gunicorn ${WSGI_APP} --bind 0.0.0.0:${DJANGO_PORT} \
                      --log-level debug \
-                     --workers=${NUMBER_OF_WORKERS:-4}
\ No newline at end of file
+                     --workers=${NUMBER_OF_WORKERS:-4} \
+                     --threads=${NUMBER_OF_THREADS:-1}
\ No newline at end of file
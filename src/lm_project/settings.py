@@ -45,7 +45,7 @@ LANGUAGES = [
 
 INSTALLED_APPS = [
     'modeltranslation',
-    'django.contrib.admin',
+    'luchtmans.apps.LuchtmansAdminConfig',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -106,6 +106,24 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+if env('REDIS_HOST', None):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': f"redis://{env('REDIS_HOST')}:{env.int('REDIS_PORT', 6379)}",
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
 LOG_LEVEL = env('LOG_LEVEL', 'INFO')
 LOGGING = {
     "version": 1,
@@ -175,3 +193,15 @@ STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Audit log
+# https://django-easy-audit.readthedocs.io/
+
+# Tables derived from other tables are not audited
+DJANGO_EASY_AUDIT_UNREGISTERED_CLASSES_EXTRA = [
+    'luchtmans.CollectionEdition',
+    'luchtmans.EditionCoPurchase',
+    'luchtmans.CollectionSimilarity',
+    'luchtmans.PriceAggregate',
+    'luchtmans.LedgerEntry',
+]
@@ -24,6 +24,10 @@ urlpatterns = i18n_patterns(
     path('admin/', admin.site.urls),
 )
 
+urlpatterns += [
+    path('api/', include('luchtmans.urls')),
+]
+
 if 'rosetta' in settings.INSTALLED_APPS:
     urlpatterns += [
         re_path(r'^rosetta/', include('rosetta.urls'))
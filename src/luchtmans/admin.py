@@ -1,14 +1,366 @@
+from datetime import MAXYEAR, MINYEAR
+
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.utils import get_fields_from_path
+from django.contrib.admin.views.main import ChangeList, ORDER_VAR
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db.models import Count, Max, Min, Prefetch
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
+from django.urls import path, reverse
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 from django.utils import html
 
 from modeltranslation.admin import TranslationAdmin
 
+from .autocomplete import autocomplete, fold_text
+from .cache import get_or_compute, lookup_choices
+from .entries import ledger_entry, lookup_labels
+from .pagination import EstimatedCountPaginator
+from .search import full_text_search_available, search
+from .spelling import spelling_search
 from .models import (Country, Place, Street, Address, Person, PersonPersonRelation, RelationType, PeriodOfResidence,
                      Religion, PersonReligion, UniqueNameModel, Language, GenreParisianCategory, Work,
                      PersonWorkRelationRole, PersonWorkRelation, Format, STCNGenre, Edition, PersonEditionRelationRole,
-                     PersonEditionRelation, Collection, ItemType, Page, Binding, Item)
+                     PersonEditionRelation, Collection, ItemType, Page, Binding, Item, SearchNameModel)
+
+
+class PrefetchChangeList(ChangeList):
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        return queryset.prefetch_related(*getattr(self.model_admin, 'list_prefetch_related', []))
+
+
+class SearchRankChangeList(PrefetchChangeList):
+    def get_ordering(self, request, queryset):
+        # Order search results by rank, unless the user sorted on a column
+        if 'search_rank' in queryset.query.annotations and ORDER_VAR not in self.params:
+            return ['-search_rank', '-pk']
+        return super().get_ordering(request, queryset)
+
+
+# Query string parameters of KeysetChangeList
+AFTER_VAR = 'after'
+BEFORE_VAR = 'before'
+EXACT_COUNT_VAR = 'exact_count'
+
+
+class KeysetChangeList(PrefetchChangeList):
+    """
+    Changelist for the tables with millions of rows. In the default order, by primary key, a page is fetched by
+    seeking past the last (?after=) or first (?before=) key of the page it was reached from instead of with OFFSET, so
+    deep pages are as fast as the first one. Counts are estimated unless ?exact_count is given, see
+    luchtmans.pagination. Sorted on a column, the changelist pages with OFFSET as usual.
+    """
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        for name in [AFTER_VAR, BEFORE_VAR, EXACT_COUNT_VAR]:
+            lookup_params.pop(name, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # A position only holds for the filters and order it was taken in
+        return super().get_query_string({AFTER_VAR: None, BEFORE_VAR: None} | (new_params or {}), remove)
+
+    def get_results(self, request):
+        ordering = list(self.queryset.query.order_by)
+        pk_name = self.opts.pk.name
+        self.keyset = ordering in [['pk'], ['-pk'], [pk_name], [f'-{pk_name}']]
+        if self.keyset:
+            self.get_keyset_results(request, descending=ordering[0].startswith('-'))
+        else:
+            super().get_results(request)
+        self.count_estimated = self.paginator.estimated
+        self.exact_count_url = self.get_query_string({EXACT_COUNT_VAR: 1}) if self.count_estimated else None
+
+    def get_keyset_results(self, request, descending):
+        try:
+            after, before = [int(request.GET[name]) if request.GET.get(name) else None
+                             for name in [AFTER_VAR, BEFORE_VAR]]
+        except ValueError:
+            raise IncorrectLookupParameters
+        per_page = self.list_per_page
+        queryset = self.queryset
+        if before is not None:
+            # Seek backwards in the reverse order, then put the page back in order
+            queryset = queryset.filter(pk__gt=before) if descending else queryset.filter(pk__lt=before)
+            results = list(queryset.reverse()[:per_page + 1])
+            has_previous, has_next = len(results) > per_page, True
+            results = results[:per_page][::-1]
+        else:
+            if after is not None:
+                queryset = queryset.filter(pk__lt=after) if descending else queryset.filter(pk__gt=after)
+            results = list(queryset[:per_page + 1])
+            has_previous, has_next = after is not None, len(results) > per_page
+            results = results[:per_page]
+
+        self.paginator = self.model_admin.get_paginator(request, self.queryset, per_page)
+        self.result_count = self.paginator.count
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.result_list = results
+        # The page links of the admin's pagination are replaced by the links below
+        self.can_show_all = False
+        self.multi_page = False
+        self.first_url = self.get_query_string() if has_previous else None
+        self.previous_url = self.get_query_string({BEFORE_VAR: results[0].pk}) if has_previous and results else None
+        self.next_url = self.get_query_string({AFTER_VAR: results[-1].pk}) if has_next and results else None
+
+
+class CachedRelatedFieldListFilter(admin.RelatedFieldListFilter):
+    """RelatedFieldListFilter for small lookup tables; the choices are cached until the table changes."""
+
+    def field_choices(self, field, request, model_admin):
+        return lookup_choices(field.related_model, self.field_admin_ordering(field, request, model_admin))
+
+
+# Query string parameters of the facets view of FacetFilterMixin
+FACET_TERM_VAR = 'term'
+FACET_LIMIT_VAR = 'limit'
+
+
+class FacetListFilter(admin.RelatedFieldListFilter):
+    """
+    Filter on a relation to a model with a search_name, like places, or to a lookup table. The sidebar only renders
+    the selected values; the values with the most matching rows are loaded by the browser from the facets view of
+    FacetFilterMixin, counted in one grouped query, and can be searched.
+    """
+    template = 'admin/luchtmans/facet_filter.html'
+
+    def field_choices(self, field, request, model_admin):
+        if not self.lookup_val:
+            return []
+        try:
+            return [(obj.pk, str(obj)) for obj in field.related_model._default_manager.filter(pk__in=self.lookup_val)]
+        except (ValueError, ValidationError):
+            # The changelist reports the invalid value when it filters on it
+            return []
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        opts = changelist.opts
+        self.facets_url = reverse(f'admin:{opts.app_label}_{opts.model_name}_facets', args=[self.field_path]) + (
+            changelist.get_query_string(remove=self.expected_parameters()))
+        return super().choices(changelist)
+
+    def related_queryset(self, term):
+        """The related objects that match the search term."""
+        model = self.field.related_model
+        queryset = model._default_manager.all()
+        if issubclass(model, SearchNameModel):
+            return autocomplete(queryset, term)
+        # Other related models are small lookup tables, searched in their cached and translated labels
+        term = fold_text(term)
+        return queryset.filter(pk__in=[pk for pk, label in lookup_choices(model) if term in fold_text(label)])
+
+    def facet_counts(self, queryset, term='', limit=10):
+        """Return the (pk, count) pairs of the `limit` related objects with the most rows in `queryset`."""
+        if self.field.many_to_many:
+            through = self.field.remote_field.through
+            counts = through.objects.filter(**{f'{self.field.m2m_field_name()}__in': queryset.values('pk')})
+            related = self.field.m2m_reverse_field_name()
+        else:
+            counts, related = queryset, self.field_path
+        counts = counts.filter(**{f'{related}__isnull': False})
+        if term:
+            counts = counts.filter(**{f'{related}__in': self.related_queryset(term).values('pk')})
+        return list(counts.order_by().values(related).annotate(count=Count('pk')).order_by('-count', related)
+                    .values_list(related, 'count')[:limit])
+
+
+class DecadeListFilter(admin.SimpleListFilter):
+    """
+    Filter on the decades in which an interval of interval_model lies, see luchtmans.intervals. Without
+    interval_model the intervals are those of the changelist's model; otherwise the changelist shows the objects that
+    the matching intervals point to with related_field.
+    """
+    title = _("decade")
+    parameter_name = 'decade'
+    interval_model = None
+    related_field = None
+
+    def get_decades(self, model):
+        model = self.interval_model or model
+        return get_or_compute('decades', [model], [], lambda: model.objects.decades())
+
+    def filter_decade(self, queryset, start, end):
+        if self.interval_model is None:
+            return queryset.overlapping(start, end)
+        intervals = self.interval_model.objects.overlapping(start, end)
+        return queryset.filter(pk__in=intervals.values(self.related_field))
+
+    def lookups(self, request, model_admin):
+        return [(str(decade), f'{decade}-{decade + 9}') for decade in self.get_decades(model_admin.model)]
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        try:
+            decade = int(self.value())
+        except ValueError:
+            raise IncorrectLookupParameters(f'Invalid decade {self.value()!r}')
+        return self.filter_decade(queryset, decade, decade + 9)
+
+
+class ResidenceDecadeListFilter(DecadeListFilter):
+    title = _("residence decade")
+    parameter_name = 'residence_decade'
+    interval_model = PeriodOfResidence
+    related_field = 'person'
+
+
+class ReligionDecadeListFilter(DecadeListFilter):
+    title = _("religious affiliation decade")
+    parameter_name = 'religion_decade'
+    interval_model = PersonReligion
+    related_field = 'person'
+
+
+class AliveDecadeListFilter(DecadeListFilter):
+    """Filter persons on the decades in which they may have been alive, see PersonQuerySet.alive_in()."""
+    title = _("alive in")
+    parameter_name = 'alive'
+
+    def get_decades(self, model):
+        def compute():
+            days = Person.objects.aggregate(Min('alive_from'), Max('alive_until'))
+            if days['alive_from__min'] is None:
+                return []
+            return list(range(days['alive_from__min'].year // 10 * 10, days['alive_until__max'].year + 1, 10))
+        return get_or_compute('alive_decades', [Person], [], compute)
+
+    def filter_decade(self, queryset, start, end):
+        if not MINYEAR <= start <= MAXYEAR:
+            raise IncorrectLookupParameters(f'Invalid decade {start!r}')
+        return queryset.alive_in(start, min(end, MAXYEAR))
+
+
+class ListPrefetchRelatedMixin:
+    """
+    Prefetch the lookups in list_prefetch_related on the changelist only, so display methods can read
+    many-to-many and reverse relations with .all() instead of running a query per row.
+    """
+    list_prefetch_related = []
+
+    def get_changelist(self, request, **kwargs):
+        return PrefetchChangeList
+
+
+class KeysetPaginationMixin:
+    """Page through the changelist by primary key and estimate its count, see KeysetChangeList."""
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        return self.paginator(queryset, per_page, orphans, allow_empty_first_page,
+                              exact=EXACT_COUNT_VAR in request.GET)
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+class FacetFilterMixin:
+    """
+    Serve the values of the FacetListFilters in list_filter, with their number of rows for the other filters and the
+    search of the changelist. The values are cached until one of the models the filters refer to changes.
+    """
+
+    class Media:
+        js = ['luchtmans/facets.js']
+
+    def get_urls(self):
+        info = self.opts.app_label, self.opts.model_name
+        return [path('facets/<str:field_path>/', self.admin_site.admin_view(self.facets_view),
+                     name='%s_%s_facets' % info)] + super().get_urls()
+
+    def get_changelist(self, request, **kwargs):
+        changelist = super().get_changelist(request, **kwargs)
+        if not getattr(request, 'facets_only', False):
+            return changelist
+        # The facets view only needs the filtered queryset, not a page of results
+        return type(f'Facet{changelist.__name__}', (changelist,), {'get_results': lambda self, request: None})
+
+    def filter_models(self, request):
+        """The models that the filters of the changelist read."""
+        models = {self.model}
+        for list_filter in self.get_list_filter(request):
+            if isinstance(list_filter, tuple):
+                list_filter = list_filter[0]
+            if isinstance(list_filter, str):
+                for field in get_fields_from_path(self.model, list_filter):
+                    if field.is_relation:
+                        models.add(field.related_model)
+                        if field.many_to_many:
+                            models.add(field.remote_field.through)
+            elif getattr(list_filter, 'interval_model', None):
+                models.add(list_filter.interval_model)
+        return models
+
+    def facets_view(self, request, field_path):
+        """
+        The values of the facet filter on field_path as JSON. Parameters: term (optional, to search the values), limit
+        (default 10, at most 100) and the filters and search of the changelist.
+        """
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        query = request.GET.copy()
+        term = query.pop(FACET_TERM_VAR, [''])[-1]
+        try:
+            limit = max(1, min(int(query.pop(FACET_LIMIT_VAR, [10])[-1]), 100))
+        except ValueError as e:
+            return HttpResponseBadRequest(f'Invalid parameter: {e}')
+        request.GET = query
+        request.facets_only = True
+        try:
+            changelist = self.get_changelist_instance(request)
+        except IncorrectLookupParameters as e:
+            return HttpResponseBadRequest(f'Invalid parameter: {e}')
+        spec = next((spec for spec in changelist.filter_specs
+                     if isinstance(spec, FacetListFilter) and spec.field_path == field_path), None)
+        if spec is None:
+            raise Http404(f'No facet filter on {field_path}')
+
+        def compute():
+            queryset = changelist.get_queryset(request, exclude_parameters=spec.expected_parameters())
+            counts = spec.facet_counts(queryset, term, limit)
+            labels = spec.field.related_model._default_manager.in_bulk([pk for pk, _ in counts])
+            return [{
+                'id': pk,
+                'label': str(labels[pk]),
+                'count': count,
+                'url': changelist.get_query_string({spec.lookup_kwarg: pk}, [spec.lookup_kwarg_isnull]),
+            } for pk, count in counts if pk in labels]
+
+        results = get_or_compute('facets', self.filter_models(request),
+                                 [self.opts.label_lower, field_path, sorted(query.lists()), term, limit], compute)
+        return JsonResponse({'results': results})
+
+
+class FullTextSearchMixin:
+    """Search with the full-text search vector of the model (see luchtmans.search) where the database supports it."""
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not full_text_search_available():
+            return super().get_search_results(request, queryset, search_term)
+        return search(queryset, search_term), False
+
+    def get_changelist(self, request, **kwargs):
+        return SearchRankChangeList
+
+
+class NormalizedSpellingSearchMixin:
+    """Also find objects whose normalized_text matches the search term in another spelling, see luchtmans.spelling."""
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            results |= spelling_search(queryset, search_term)
+        return results, may_have_duplicates
 
 
 @admin.register(Country)
@@ -29,6 +381,7 @@ class StreetAdmin(admin.ModelAdmin):
     list_display = ["name", "place", "country"]
     search_fields = ["name", "place__name"]
     list_filter = ["place"]
+    list_select_related = ["place__country"]
     autocomplete_fields = ["place"]
 
     def country(self, obj):
@@ -40,6 +393,7 @@ class AddressAdmin(admin.ModelAdmin):
     list_display = ["address", "place", "description", "streetname_old"]
     search_fields = ["description", "streetname_old", "house_number"]
     list_filter = ["street__place__name"]
+    list_select_related = ["street__place"]
     autocomplete_fields = ["street"]
 
     @admin.display(description=_("address"))
@@ -67,29 +421,41 @@ class ReligionInline(admin.TabularInline):
 
 
 @admin.register(Person)
-class PersonAdmin(admin.ModelAdmin):
+class PersonAdmin(FacetFilterMixin, FullTextSearchMixin, admin.ModelAdmin):
     list_display = [
         "short_name",
         "sex",
-        "place_of_birth", "date_of_birth",
-        "place_of_death", "date_of_death",
+        "place_of_birth", "birth",
+        "place_of_death", "death",
         "wikidata_link"
     ]
     search_fields = ["short_name", "surname", "first_names"]
     autocomplete_fields = ["place_of_birth", "place_of_death"]
-    list_filter = ["sex", "place_of_birth", "place_of_death", "religious_affiliation"]
+    list_filter = ["sex", ("place_of_birth", FacetListFilter), ("place_of_death", FacetListFilter),
+                   ("religious_affiliation", FacetListFilter), AliveDecadeListFilter, ReligionDecadeListFilter,
+                   ResidenceDecadeListFilter]
+    list_select_related = ["place_of_birth", "place_of_death"]
     inlines = [RelatedPersonInline, ReligionInline]
 
+    @admin.display(description=_("date of birth"), ordering='birth_earliest')
+    def birth(self, obj):
+        return obj.date_of_birth
+
+    @admin.display(description=_("date of death"), ordering='death_latest')
+    def death(self, obj):
+        return obj.date_of_death
+
     def wikidata_link(self, obj):
         wikidata_id = html.escape(obj.wikidata_id)
         return mark_safe(f'<a href="https://www.wikidata.org/wiki/{wikidata_id}">{wikidata_id}</a>')
 
 
 @admin.register(PersonPersonRelation)
-class PersonPersonRelationAdmin(TranslationAdmin):
+class PersonPersonRelationAdmin(KeysetPaginationMixin, ListPrefetchRelatedMixin, TranslationAdmin):
     list_display = ["from_person", "type", "to_person"]
     search_fields = ["from_person__short_name", "to_person__short_name", "types__text"]
     autocomplete_fields = ["from_person", "to_person", "types"]
+    list_prefetch_related = ["types"]
 
     def type(self, obj):
         return ", ".join([_('is {type} of').format(type=type.text) for type in obj.types.all()])
@@ -104,20 +470,66 @@ class RelationTypeAdmin(admin.ModelAdmin):
 @admin.register(PeriodOfResidence)
 class PeriodOfResidenceAdmin(admin.ModelAdmin):
     search_fields = ["person__short_name", "address__street__name", "address__street__place__name"]
+    list_select_related = ["person", "address__street__place"]
     autocomplete_fields = ["person", "address"]
+    list_filter = [DecadeListFilter]
 
 
 @admin.register(Religion)
 class ReligionAdmin(TranslationAdmin):
     search_fields = ["name"]
 
+
+@admin.register(PersonEditionRelation)
+class PersonEditionRelationAdmin(admin.ModelAdmin):
+    list_select_related = ["person", "edition", "role"]
+
+
 # Register empty admin classes in one go
-for model in [PersonWorkRelation, Format, PersonEditionRelation, Collection, ItemType, Page, Binding, Item]:
+for model in [PersonWorkRelation, Format, Collection, ItemType, Page, Binding]:
     base_class = TranslationAdmin if model.__base__ == UniqueNameModel else admin.ModelAdmin
     admin_class = type(model.__name__+'Admin', (base_class,), {})
     admin.site.register(model, admin_class)
 
 
+@admin.register(Item)
+class ItemAdmin(KeysetPaginationMixin, NormalizedSpellingSearchMixin, admin.ModelAdmin):
+    # The columns come from the denormalized ledger entries, so the changelist needs a single join
+    list_display = ['transcription_full', 'collection_title', 'client_name', 'page_label', 'type_name', 'edition_list',
+                    'binding_list', 'language_list', 'date', 'price', 'price_decimal']
+    search_fields = ['transcription_full']
+    list_filter = ['price_needs_review']
+    list_select_related = ['ledger_entry']
+
+    @admin.display(description=_("collection"), ordering='ledger_entry__collection_title')
+    def collection_title(self, obj):
+        return entry.collection_title if (entry := ledger_entry(obj)) else None
+
+    @admin.display(description=_("client"), ordering='ledger_entry__client_name')
+    def client_name(self, obj):
+        return entry.client_name if (entry := ledger_entry(obj)) else None
+
+    @admin.display(description=_("page"), ordering='ledger_entry__volume')
+    def page_label(self, obj):
+        return f'{entry.volume}: {entry.folio}{entry.recto_verso}' if (entry := ledger_entry(obj)) else None
+
+    @admin.display(description=_("type"))
+    def type_name(self, obj):
+        return ", ".join(lookup_labels(ItemType, [entry.type_id])) if (entry := ledger_entry(obj)) else None
+
+    @admin.display(description=_("editions"))
+    def edition_list(self, obj):
+        return ", ".join(entry.edition_titles) if (entry := ledger_entry(obj)) else None
+
+    @admin.display(description=_("bindings"))
+    def binding_list(self, obj):
+        return ", ".join(lookup_labels(Binding, entry.binding_ids)) if (entry := ledger_entry(obj)) else None
+
+    @admin.display(description=_("languages"))
+    def language_list(self, obj):
+        return ", ".join(lookup_labels(Language, entry.language_ids)) if (entry := ledger_entry(obj)) else None
+
+
 @admin.register(Language)
 class LanguageAdmin(TranslationAdmin):
     search_fields = ['name']
@@ -143,20 +555,23 @@ class AuthorInline(admin.TabularInline):
 
 
 @admin.register(Work)
-class WorkAdmin(admin.ModelAdmin):
+class WorkAdmin(FullTextSearchMixin, ListPrefetchRelatedMixin, admin.ModelAdmin):
     list_display = ['title', 'authors_list', 'uncertain', 'language_list', 'viaf_id', 'genre_parisian_category', 'notes']
     search_fields = ['title']
-    list_filter = ['uncertain', 'languages', 'genre_parisian_category']
+    list_filter = ['uncertain', ('languages', CachedRelatedFieldListFilter),
+                   ('genre_parisian_category', CachedRelatedFieldListFilter)]
+    list_select_related = ['genre_parisian_category']
+    list_prefetch_related = ['authors', 'languages']
     autocomplete_fields = ['languages', 'genre_parisian_category']
     inlines = [AuthorInline]
 
     @admin.display(description=_("authors"))
     def authors_list(self, obj):
-        return ", ".join(obj.authors.values_list('short_name', flat=True))
+        return ", ".join(author.short_name for author in obj.authors.all())
 
     @admin.display(description=_("languages"))
     def language_list(self, obj):
-        return ", ".join(obj.languages.values_list('name', flat=True))
+        return ", ".join(language.name for language in obj.languages.all())
 
 
 @admin.register(STCNGenre)
@@ -179,17 +594,25 @@ class PersonEditionRelationRoleAdmin(TranslationAdmin):
 
 
 @admin.register(Edition)
-class EditionAdmin(admin.ModelAdmin):
+class EditionAdmin(FacetFilterMixin, NormalizedSpellingSearchMixin, FullTextSearchMixin, ListPrefetchRelatedMixin,
+                   admin.ModelAdmin):
     list_display = ['title', 'person_list', 'edition_uncertain', 'years', 'place_of_publication_list', 'language_list',
                     'volumes', 'stcn_genre_list', 'notes']
     search_fields = ['short_title', 'title']
-    list_filter = ['edition_uncertain', 'places_of_publication', 'languages', 'stcn_genres']
+    list_filter = ['edition_uncertain', ('places_of_publication', FacetListFilter), ('languages', FacetListFilter),
+                   ('stcn_genres', FacetListFilter), DecadeListFilter]
+    list_prefetch_related = [
+        Prefetch('personeditionrelation_set', queryset=PersonEditionRelation.objects.select_related('person', 'role')),
+        'places_of_publication',
+        'languages',
+        'stcn_genres',
+    ]
     autocomplete_fields = ['places_of_publication', 'languages', 'stcn_genres', 'work']
     inlines = [PersonInline]
 
     @admin.display(description=_("persons"))
     def person_list(self, obj):
-        return ", ".join([f'{relation.person} ({relation.role})' for relation in obj.persons.through.objects.all()])
+        return ", ".join([f'{relation.person} ({relation.role})' for relation in obj.personeditionrelation_set.all()])
 
     @admin.display(description=_("years"))
     def years(self, obj):
@@ -197,12 +620,12 @@ class EditionAdmin(admin.ModelAdmin):
 
     @admin.display(description=_("places"))
     def place_of_publication_list(self, obj):
-        return ", ".join(obj.places_of_publication.values_list('name', flat=True))
+        return ", ".join(place.name for place in obj.places_of_publication.all())
 
     @admin.display(description=_("languages"))
     def language_list(self, obj):
-        return ", ".join(obj.languages.values_list('name', flat=True))
+        return ", ".join(language.name for language in obj.languages.all())
 
     @admin.display(description=_("STCN genres"))
     def stcn_genre_list(self, obj):
-        return ", ".join(obj.stcn_genres.values_list('name', flat=True))
+        return ", ".join(genre.name for genre in obj.stcn_genres.all())
@@ -0,0 +1,276 @@
+"""
+Precomputed price statistics of the items per edition, genre, year and client.
+
+PriceAggregate holds one row per dimension and key (an edition, STCN genre, Parisian genre or client id, or the year of
+Item.date) with the number of items and copies and the total, mean and percentiles of their decimal prices. An item
+counts once per key, also when several of its editions share a genre; items without a decimal price only count in
+the items and copies.
+
+The build_price_aggregates command computes the table from scratch with NumPy. Between builds the receivers below
+collect the keys touched by saved and deleted items and editions, by the editions of items and the genres of editions,
+and by the genre of works, the work of editions and the client of collections, and recompute those keys after commit.
+Recomputing the percentiles of a key means reading all its prices, so keys of more than MAX_ITEMS items are only
+marked stale, to be refreshed with build_price_aggregates --stale; one item moves their statistics very little.
+"""
+import re
+from decimal import Decimal
+from functools import partial
+from itertools import batched
+
+import numpy as np
+from django.db import transaction
+from django.db.models import BigIntegerField, F
+from django.db.models.functions import Cast, Coalesce, Round
+from django.db.models.signals import m2m_changed, post_save, pre_delete, pre_save
+
+from luchtmans.bulk import delete_all
+from luchtmans.cache import bump_version
+from luchtmans.models import Work, Edition, Collection, Item, PriceAggregate
+
+Dimension = PriceAggregate.Dimension
+
+# The path from Item to the key of every dimension
+DIMENSIONS = {
+    Dimension.EDITION: 'editions',
+    Dimension.STCN_GENRE: 'editions__stcn_genres',
+    Dimension.GENRE_PARISIAN_CATEGORY: 'editions__work__genre_parisian_category',
+    Dimension.YEAR: 'date__year',
+    Dimension.CLIENT: 'collection__client',
+}
+# The path from Edition to the keys of the dimensions that go through the editions of items
+EDITION_DIMENSIONS = {
+    Dimension.EDITION: 'pk',
+    Dimension.STCN_GENRE: 'stcn_genres',
+    Dimension.GENRE_PARISIAN_CATEGORY: 'work__genre_parisian_category',
+}
+# The paths to the keys that the own fields of a model decide, for the models whose changes move items between keys
+SAVED_KEYS = {
+    Work: [(Dimension.GENRE_PARISIAN_CATEGORY, 'genre_parisian_category')],
+    Edition: [(Dimension.GENRE_PARISIAN_CATEGORY, 'work__genre_parisian_category')],
+    Collection: [(Dimension.CLIENT, 'client')],
+    Item: [(Dimension.YEAR, 'date__year'), (Dimension.CLIENT, 'collection__client')],
+}
+
+# Keys with more items, like the common genres, are marked stale after a change instead of recomputed at commit
+MAX_ITEMS = 10_000
+
+PERCENTILES = {'minimum': 0, 'p25': 25, 'median': 50, 'p75': 75, 'p90': 90, 'maximum': 100}
+
+COPIES = re.compile(r'\d+')
+
+
+def parse_copies(value):
+    """The number of copies of an item, like '2' or '2 ex.'; 1 where it does not say."""
+    match = COPIES.search(value or '')
+    return int(match[0]) if match else 1
+
+
+def load_items(dimension, keys=None, batch_size=100_000):
+    """Return arrays (key, price in cents or -1, copies) of the items of the dimension, or of its `keys` only."""
+    path = DIMENSIONS[dimension]
+    queryset = Item.objects.filter(**{f'{path}__in': keys} if keys is not None else {f'{path}__isnull': False})
+    # The cents are computed by the database, which is much faster than converting every price to a Decimal
+    cents = Cast(Coalesce(Round(F('price_decimal') * 100), -1), BigIntegerField())
+    # An item counts once per key, also when several of its editions have the same genre
+    rows = {(key, pk): (price, copies) for key, pk, price, copies in queryset.values_list(
+        path, 'pk', cents, 'number_of_copies').iterator(chunk_size=batch_size)}
+    copies = {text: parse_copies(text) for text in {text for _, text in rows.values()}}
+    return (
+        np.fromiter((key for key, _ in rows), dtype=np.int64, count=len(rows)),
+        np.fromiter((price for price, _ in rows.values()), dtype=np.int64, count=len(rows)),
+        np.fromiter((copies[text] for _, text in rows.values()), dtype=np.int64, count=len(rows)),
+    )
+
+
+def aggregate(keys, cents, copies):
+    """
+    Return {field: array} with the statistics of the items per distinct key. `cents` is -1 for items without a price;
+    the percentiles interpolate linearly between prices, like numpy.percentile(), and are NaN without prices.
+    """
+    order = np.lexsort((cents, keys))
+    keys, cents, copies = keys[order], cents[order], copies[order]
+    distinct, starts, items = np.unique(keys, return_index=True, return_counts=True)
+    groups = np.repeat(np.arange(len(distinct)), items)
+    priced = cents >= 0
+    priced_items = np.bincount(groups[priced], minlength=len(distinct))
+    result = {
+        'key': distinct,
+        'items': items,
+        'copies': np.bincount(groups, weights=copies, minlength=len(distinct)).astype(np.int64),
+        'priced_items': priced_items,
+        'total': np.bincount(groups[priced], weights=cents[priced], minlength=len(distinct)),
+    }
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result['mean'] = result['total'] / priced_items
+
+    # Within a key the prices are sorted, after the items without a price
+    first = starts + items - priced_items
+    has_prices = priced_items > 0
+    for name, percentile in PERCENTILES.items():
+        position = first + percentile / 100 * np.maximum(priced_items - 1, 0)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        lower, upper = np.where(has_prices, lower, 0), np.where(has_prices, upper, 0)
+        value = cents[lower] + (cents[upper] - cents[lower]) * (position - lower)
+        result[name] = np.where(has_prices, value, np.nan)
+    return result
+
+
+def to_decimal(cents):
+    """Round cents half up and return guilders, or None for NaN."""
+    return None if np.isnan(cents) else Decimal(int(np.floor(cents + 0.5))).scaleb(-2)
+
+
+def make_aggregates(dimension, statistics):
+    columns = {name: values.tolist() for name, values in statistics.items()}
+    for i in range(len(columns['key'])):
+        yield PriceAggregate(
+            dimension=dimension,
+            key=columns['key'][i],
+            items=columns['items'][i],
+            copies=columns['copies'][i],
+            priced_items=columns['priced_items'][i],
+            total=to_decimal(columns['total'][i]),
+            **{name: to_decimal(columns[name][i]) for name in ['mean', *PERCENTILES]},
+        )
+
+
+def build_price_aggregates(batch_size=10_000, log=print):
+    """Rebuild PriceAggregate from the items."""
+    with transaction.atomic():
+        delete_all(PriceAggregate)
+        for dimension in DIMENSIONS:
+            statistics = aggregate(*load_items(dimension))
+            for batch in batched(make_aggregates(dimension, statistics), batch_size):
+                PriceAggregate.objects.bulk_create(batch)
+            log(f"Created {len(statistics['key'])} price aggregates per {dimension.label}")
+    bump_version(PriceAggregate)
+
+
+def update_price_aggregates(keys, max_items=None):
+    """
+    Recompute the PriceAggregate rows of the (dimension, key) pairs from the items. With `max_items`, keys that had
+    more items are marked stale instead.
+    """
+    with transaction.atomic():
+        for dimension in DIMENSIONS:
+            selected = {key for key_dimension, key in keys if key_dimension == dimension}
+            if max_items is not None:
+                large = PriceAggregate.objects.filter(dimension=dimension, key__in=selected, items__gt=max_items)
+                selected -= set(large.values_list('key', flat=True))
+                large.update(stale=True)
+            for batch in batched(sorted(selected), 1000):
+                PriceAggregate.objects.filter(dimension=dimension, key__in=batch).delete()
+                PriceAggregate.objects.bulk_create(make_aggregates(dimension, aggregate(*load_items(dimension, batch))))
+    bump_version(PriceAggregate)
+
+
+def refresh_stale_price_aggregates(log=print):
+    """Recompute the PriceAggregate rows that were marked stale."""
+    keys = set(PriceAggregate.objects.filter(stale=True).values_list('dimension', 'key'))
+    update_price_aggregates(keys)
+    log(f"Refreshed {len(keys)} price aggregates")
+
+
+def price_aggregates(dimension, keys=None, order_by='items', limit=20):
+    """The price statistics of the `keys` of a dimension, or of the keys that rank highest by `order_by`."""
+    queryset = PriceAggregate.objects.filter(dimension=dimension)
+    if keys is not None:
+        queryset = queryset.filter(key__in=keys)
+    return queryset.order_by(F(order_by).desc(nulls_last=True), 'key')[:limit]
+
+
+def item_keys(item_ids):
+    """Return the (dimension, key) pairs the items count under."""
+    return {(dimension, key) for dimension, path in DIMENSIONS.items() for key in Item.objects.filter(
+        pk__in=item_ids, **{f'{path}__isnull': False}).values_list(path, flat=True).distinct()}
+
+
+def edition_keys(edition_ids):
+    """Return the (dimension, key) pairs of the edition dimensions that the items of the editions count under."""
+    return {(dimension, key) for dimension, path in EDITION_DIMENSIONS.items() for key in Edition.objects.filter(
+        pk__in=edition_ids, **{f'{path}__isnull': False}).values_list(path, flat=True).distinct()}
+
+
+# # # Signal receivers, connected in LuchtmansConfig.ready() # # #
+
+# The receivers pass the keys touched by a transaction, and the items and editions whose keys are looked up after
+# commit, to a callback of that transaction; the keys they counted under before are collected right away. A
+# transaction that is rolled back updates nothing.
+
+def update_changed(keys, items, editions):
+    for batch in batched(items, 1000):
+        keys |= item_keys(batch)
+    for batch in batched(editions, 1000):
+        keys |= edition_keys(batch)
+    if keys:
+        update_price_aggregates(keys, MAX_ITEMS)
+
+
+def schedule_update(keys=(), items=(), editions=()):
+    keys, items, editions = set(keys), set(items), set(editions)
+    if keys or items or editions:
+        transaction.on_commit(partial(update_changed, keys, items, editions))
+
+
+def saved_keys(instance):
+    """The keys that the fields of an item, or of the collection, edition or work of items, make them count under."""
+    paths = SAVED_KEYS[type(instance)]
+    values = type(instance).objects.filter(pk=instance.pk).values_list(*[path for _, path in paths]).first() or ()
+    return {(dimension, key) for (dimension, _), key in zip(paths, values) if key is not None}
+
+
+def remember_keys(sender, instance, **kwargs):
+    if not instance._state.adding:
+        instance._saved_price_keys = saved_keys(instance)
+
+
+def instance_saved(sender, instance, created, **kwargs):
+    old_keys = instance.__dict__.pop('_saved_price_keys', set())
+    if isinstance(instance, Item):
+        # Any field of the item may have changed its price or copies
+        schedule_update(old_keys, items=[instance.pk])
+    elif not created and old_keys != (new_keys := saved_keys(instance)):
+        schedule_update(old_keys | new_keys)
+
+
+def item_deleting(sender, instance, **kwargs):
+    schedule_update(item_keys([instance.pk]))
+
+
+def edition_deleting(sender, instance, **kwargs):
+    schedule_update(edition_keys([instance.pk]))
+
+
+def item_editions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """`instance` is an item and `pk_set` holds editions, or with reverse, an edition and items."""
+    if action == 'pre_clear':
+        edition_ids = [instance.pk] if reverse else list(instance.editions.values_list('pk', flat=True))
+        instance._cleared_price_keys = edition_keys(edition_ids)
+    elif action == 'post_clear':
+        schedule_update(instance.__dict__.pop('_cleared_price_keys', set()))
+    elif action in ('post_add', 'post_remove'):
+        schedule_update(edition_keys([instance.pk] if reverse else pk_set))
+
+
+def edition_genres_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """`instance` is an edition and `pk_set` holds STCN genres, or with reverse, a genre and editions."""
+    if action == 'pre_clear':
+        genre_ids = [instance.pk] if reverse else list(instance.stcn_genres.values_list('pk', flat=True))
+        instance._cleared_price_keys = {(Dimension.STCN_GENRE, genre_id) for genre_id in genre_ids}
+    elif action == 'post_clear':
+        schedule_update(instance.__dict__.pop('_cleared_price_keys', set()))
+    elif action in ('post_add', 'post_remove'):
+        schedule_update((Dimension.STCN_GENRE, genre_id) for genre_id in ([instance.pk] if reverse else pk_set))
+
+
+def connect_signals():
+    for model in SAVED_KEYS:
+        pre_save.connect(remember_keys, sender=model, dispatch_uid=f'luchtmans_analytics_pre_save_{model.__name__}')
+        post_save.connect(instance_saved, sender=model, dispatch_uid=f'luchtmans_analytics_post_save_{model.__name__}')
+    pre_delete.connect(item_deleting, sender=Item, dispatch_uid='luchtmans_analytics_pre_delete_Item')
+    pre_delete.connect(edition_deleting, sender=Edition, dispatch_uid='luchtmans_analytics_pre_delete_Edition')
+    m2m_changed.connect(item_editions_changed, sender=Item.editions.through,
+                        dispatch_uid='luchtmans_analytics_item_editions')
+    m2m_changed.connect(edition_genres_changed, sender=Edition.stcn_genres.through,
+                        dispatch_uid='luchtmans_analytics_edition_genres')
@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.contrib.admin import apps as admin_apps
 
 
 class LuchtmansConfig(AppConfig):
+    default = True
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'luchtmans'
+
+    def ready(self):
+        from luchtmans import analytics, cache, clusters, copurchases, entries, graph
+        analytics.connect_signals()
+        cache.connect_signals()
+        clusters.connect_signals()
+        copurchases.connect_signals()
+        entries.connect_signals()
+        graph.connect_signals()
+
+
+class LuchtmansAdminConfig(admin_apps.AdminConfig):
+    default = False
+    default_site = 'luchtmans.sites.LuchtmansAdminSite'
@@ -0,0 +1,46 @@
+"""
+Autocomplete on a normalized name column.
+
+Models that inherit SearchNameModel keep a lowercased, accent-free copy of their names in `search_name`. On Postgres
+that column has a pg_trgm GIN index (see migration 0012), which serves the substring filter below; on SQLite only
+the B-tree index on the column is available.
+"""
+import re
+import unicodedata
+
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.functions import Length
+
+
+def fold_text(*texts):
+    """Join the texts, strip accents and lowercase the result."""
+    text = unicodedata.normalize('NFKD', ' '.join(text for text in texts if text))
+    return ''.join(char for char in text if not unicodedata.combining(char)).casefold()
+
+
+def normalize_name(*names):
+    """Lowercase the names, strip accents and punctuation and join the distinct words with single spaces."""
+    return ' '.join(dict.fromkeys(re.findall(r'\w+', fold_text(*names))))
+
+
+def autocomplete(queryset, term):
+    """
+    Filter `queryset` on every word of `term` and rank the results: exact matches first, then names starting with the
+    term, then names with a word starting with the term, then names that only contain it.
+    """
+    term = normalize_name(term)
+    if not term:
+        return queryset
+
+    for word in term.split():
+        queryset = queryset.filter(search_name__contains=word)
+
+    return queryset.annotate(
+        match_rank=Case(
+            When(search_name=term, then=Value(0)),
+            When(search_name__startswith=term, then=Value(1)),
+            When(search_name__contains=f' {term}', then=Value(2)),
+            default=Value(3),
+            output_field=IntegerField(),
+        ),
+    ).order_by('match_rank', Length('search_name'), 'search_name', 'pk')
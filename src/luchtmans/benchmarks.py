@@ -0,0 +1,387 @@
+"""
+Benchmarks of the hot paths: admin changelists, autocomplete, search, the relation graph, co-purchases, price
+statistics, ledger entries, exports, spatial queries, residence clusters, relation signals, imports and
+duplicate persons.
+
+Every benchmark is run a number of times against the current database, with a cold cache, inside a transaction that
+is rolled back afterwards, so the data is left as it was. The result records the median and minimum wall time and the
+number of queries, to be saved as a JSON baseline and compared with a later run. Generate the data with the
+generate_dataset command; the cache is cleared between runs, so do not point this at a production cache.
+"""
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import translation
+
+from luchtmans.analytics import MAX_ITEMS, item_keys, update_price_aggregates
+from luchtmans.clusters import update_residence_clusters
+from luchtmans.copurchases import update_co_purchases
+from luchtmans.dedupe import candidate_pairs, merge_groups, merge_persons
+from luchtmans.entries import update_ledger_entries
+from luchtmans.geo import GeoIndex, distance_to
+from luchtmans.graph import RelationGraph
+from luchtmans.ledger import LedgerImporter
+from luchtmans.models import (Person, PersonPersonRelation, RelationType, Collection, Page, ItemType, Edition, Item,
+                              Address)
+from luchtmans.relations import bulk_add_person_relations
+
+BENCHMARKS = {}
+
+
+class BenchmarkSkipped(Exception):
+    pass
+
+
+def benchmark(name):
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+
+@contextmanager
+def rollback():
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def get(client, url, **params):
+    response = client.get(url, params)
+    if response.status_code != 200:
+        raise AssertionError(f'GET {url} returned {response.status_code}')
+    return response
+
+
+def first_pks(model, count):
+    pks = list(model.objects.order_by('pk').values_list('pk', flat=True)[:count])
+    if not pks:
+        raise BenchmarkSkipped(f'No {model._meta.verbose_name_plural}')
+    return pks
+
+
+def register_changelists():
+    for model in admin.site._registry:
+        if model._meta.app_label == 'luchtmans':
+            url = f'admin:luchtmans_{model._meta.model_name}_changelist'
+            benchmark(f'changelist:{model._meta.model_name}')(lambda client, url=url: get(client, reverse(url)))
+
+
+register_changelists()
+
+
+def last_page(model):
+    """The changelist page with the lowest keys, the last one in the default order."""
+    url = f'admin:luchtmans_{model._meta.model_name}_changelist'
+
+    def run(client):
+        get(client, reverse(url), after=first_pks(model, 101)[-1])
+
+    return run
+
+
+benchmark('changelist:item:last_page')(last_page(Item))
+benchmark('changelist:personpersonrelation:last_page')(last_page(PersonPersonRelation))
+
+
+@benchmark('changelist:person:facets')
+def person_facets(client):
+    get(client, reverse('admin:luchtmans_person_facets', args=['place_of_birth']), sex__exact='F')
+
+
+@benchmark('changelist:person:search')
+def person_changelist_search(client):
+    get(client, reverse('admin:luchtmans_person_changelist'), q='luchtmans')
+
+
+@benchmark('changelist:item:search')
+def item_changelist_search(client):
+    get(client, reverse('admin:luchtmans_item_changelist'), q='beschrijvinge leijden')
+
+
+def autocomplete(model_name, field_name, term):
+    def run(client):
+        get(client, reverse('admin:autocomplete'), term=term, app_label='luchtmans', model_name=model_name,
+            field_name=field_name)
+    return run
+
+
+benchmark('autocomplete:person')(autocomplete('periodofresidence', 'person', 'jan luch'))
+benchmark('autocomplete:address')(autocomplete('periodofresidence', 'address', 'rapenburg'))
+benchmark('autocomplete:place')(autocomplete('person', 'place_of_birth', 'lei'))
+benchmark('autocomplete:street')(autocomplete('address', 'street', 'breestr'))
+
+
+@benchmark('api:search')
+def search_api(client):
+    get(client, reverse('luchtmans:search'), q='historie leyden')
+
+
+@benchmark('api:also_bought')
+def also_bought_api(client):
+    get(client, reverse('luchtmans:also_bought'), edition=first_pks(Edition, 1)[0])
+
+
+@benchmark('api:similar_collections')
+def similar_collections_api(client):
+    get(client, reverse('luchtmans:similar_collections'), collection=first_pks(Collection, 1)[0])
+
+
+@benchmark('co_purchases:update')
+def co_purchases_update(client):
+    """Add an edition to 20 items and update the co-purchase tables, as is done after commit."""
+    items = list(Item.objects.order_by('pk').values_list('pk', 'collection_id')[:20])
+    if not items:
+        raise BenchmarkSkipped('No items')
+    edition = Edition.objects.order_by('-pk').values_list('pk', flat=True).first()
+    with rollback():
+        Item.editions.through.objects.bulk_create([Item.editions.through(item_id=item, edition_id=edition)
+                                                   for item, _ in items], ignore_conflicts=True)
+        update_co_purchases({(collection, edition) for _, collection in items})
+
+
+@benchmark('api:price_aggregates')
+def price_aggregates_api(client):
+    get(client, reverse('luchtmans:price_aggregates'), dimension='stcn_genre', order='median')
+
+
+@benchmark('price_aggregates:update')
+def price_aggregates_update(client):
+    """Change the price of 20 items and recompute the price statistics they count in, as is done after commit."""
+    items = first_pks(Item, 20)
+    with rollback():
+        Item.objects.filter(pk__in=items).update(price_decimal=F('price_decimal') + 1)
+        update_price_aggregates(item_keys(items), MAX_ITEMS)
+
+
+@benchmark('ledger_entries:update')
+def ledger_entries_update(client):
+    """Rewrite the ledger entries of 100 items, as is done after commit."""
+    items = first_pks(Item, 100)
+    with rollback():
+        update_ledger_entries(items)
+
+
+@benchmark('export:items')
+def export_items(client):
+    response = get(client, reverse('luchtmans:export', args=['items']), format='csv', years='1770-1779')
+    for _ in response.streaming_content:
+        pass
+
+
+@benchmark('export:editions')
+def export_editions(client):
+    response = get(client, reverse('luchtmans:export', args=['editions']), format='jsonl')
+    for _ in response.streaming_content:
+        pass
+
+
+# The spatial queries around Leiden, the first place of generate_dataset; the scan benchmarks compute the distance to
+# every address instead of using the geohash index or the KD-tree
+GEO_CENTRE = (52.1601, 4.4970)
+GEO_RADIUS = 250
+
+
+def geo_query(query):
+    def run(client):
+        if not Address.objects.filter(latitude__isnull=False).exists():
+            raise BenchmarkSkipped('No addresses with coordinates')
+        list(query())
+    return run
+
+
+benchmark('geo:radius')(geo_query(lambda: Address.objects.within_radius(*GEO_CENTRE, GEO_RADIUS)))
+benchmark('geo:radius:scan')(geo_query(lambda: Address.objects.annotate(distance=distance_to(*GEO_CENTRE))
+                                       .filter(distance__lte=GEO_RADIUS)))
+
+
+def geo_nearest():
+    """The nearest addresses from a KD-tree that is loaded once, like the graph queries (see geo:load)."""
+    loaded = []
+
+    def run(client):
+        if not loaded:
+            loaded.append(GeoIndex.load(Address))
+            if not loaded[0].size:
+                raise BenchmarkSkipped('No addresses with coordinates')
+        ids = loaded[0].nearest(*GEO_CENTRE, 10)
+        list(Address.objects.filter(pk__in=ids).annotate(distance=distance_to(*GEO_CENTRE)).order_by('distance', 'pk'))
+    return run
+
+
+benchmark('geo:nearest')(geo_nearest())
+benchmark('geo:nearest:scan')(geo_query(lambda: Address.objects.annotate(distance=distance_to(*GEO_CENTRE))
+                                        .filter(latitude__isnull=False).order_by('distance', 'pk')[:10]))
+
+
+@benchmark('geo:load')
+def geo_load(client):
+    GeoIndex.load(Address)
+
+
+@benchmark('api:geo')
+def geo_api(client):
+    get(client, reverse('luchtmans:geo'), near=f'{GEO_CENTRE[0]},{GEO_CENTRE[1]}', radius=GEO_RADIUS, limit=100)
+
+
+@benchmark('api:residence_clusters')
+def residence_clusters_api(client):
+    """The clients in western Europe in the 1770s, on a map of about 1500 by 1000 pixels."""
+    get(client, reverse('luchtmans:residence_clusters'), zoom=5, decade=1770, bbox='43,-5,56,20')
+
+
+@benchmark('residence_clusters:update')
+def residence_clusters_update(client):
+    """Recompute the clusters of a decade, as is done after commit when a residence in it changed."""
+    with rollback():
+        update_residence_clusters([1770])
+
+
+@benchmark('graph:load')
+def graph_load(client):
+    RelationGraph.load()
+
+
+def graph_queries(query):
+    """Benchmark `query` on a graph that is loaded once, so the timings leave the loading out (see graph:load)."""
+    loaded = []
+
+    def run(client):
+        if not loaded:
+            loaded.append(RelationGraph.load())
+            if not loaded[0].size:
+                raise BenchmarkSkipped('No person relations')
+        query(loaded[0])
+    return run
+
+
+benchmark('graph:path')(graph_queries(lambda graph: graph.shortest_path(int(graph.person_ids[0]),
+                                                                        int(graph.person_ids[-1]))))
+benchmark('graph:neighbourhood')(graph_queries(lambda graph: graph.neighbourhood(int(graph.person_ids[0]), 2)))
+
+
+@benchmark('graph:components')
+@graph_queries
+def graph_components(graph):
+    graph.changed()
+    graph.component_sizes()
+
+
+benchmark('graph:degrees')(graph_queries(lambda graph: graph.degree_statistics()))
+
+
+@benchmark('signals:person_relation')
+def person_relation_signals(client):
+    """Create a relation with types, change the types and delete it; the receivers maintain the reverse."""
+    persons = first_pks(Person, 2)
+    if len(persons) < 2:
+        raise BenchmarkSkipped('Less than two persons')
+    types = list(RelationType.objects.order_by('pk')[:3])
+    with rollback():
+        relation = PersonPersonRelation.objects.create(from_person_id=persons[0], to_person_id=persons[1])
+        relation.types.set(types)
+        relation.types.set(types[:1])
+        relation.delete()
+
+
+@benchmark('import:person_relations')
+def import_person_relations(client):
+    persons = first_pks(Person, 1000)
+    type_ids = first_pks(RelationType, 1)
+    with rollback():
+        bulk_add_person_relations((persons[i], persons[-i - 1], type_ids) for i in range(len(persons) // 2))
+
+
+@benchmark('import:ledger')
+def import_ledger(client):
+    collection = Collection.objects.first()
+    page = Page.objects.first()
+    item_type = ItemType.objects.first()
+    if not (collection and page and item_type):
+        raise BenchmarkSkipped('No collections, pages or item types')
+    editions = [str(pk) for pk in first_pks(Edition, 10)]
+    rows = [{
+        'collection': str(collection.pk), 'volume': page.volume, 'folio': page.folio,
+        'recto_verso': page.recto_verso, 'type': item_type.name, 'editions': editions[i % len(editions)],
+        'transcription_full': f'Benchmark item {i}', 'price_decimal': '1.05',
+    } for i in range(1000)]
+    with rollback():
+        LedgerImporter().import_rows(rows)
+
+
+@benchmark('dedupe:candidates')
+def dedupe_candidates(client):
+    candidate_pairs()
+
+
+@benchmark('dedupe:merge')
+def dedupe_merge(client):
+    """Merge the 100 best pairs of persons without a collection, with their rows and relations."""
+    clients = set(Collection.objects.values_list('client_id', flat=True))
+    pairs = [pair[:2] for pair in candidate_pairs() if not clients.intersection(pair[:2])][:100]
+    if not pairs:
+        raise BenchmarkSkipped('No duplicate persons')
+    with rollback():
+        merge_persons(merge_groups(pairs))
+
+
+def client_host():
+    """A host name the site accepts, so the benchmarks also run against a deployed configuration."""
+    hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*']
+    return hosts[0] if hosts else 'testserver'
+
+
+def run_benchmarks(names=None, repeat=5, log=print):
+    """Run the benchmarks in `names` (default all) and return {name: {'seconds', 'min_seconds', 'queries'}}."""
+    results = {}
+    with rollback(), translation.override(settings.LANGUAGES[0][0]):
+        user = get_user_model().objects.create_superuser('luchtmans-benchmark', 'benchmark@example.com', None)
+        client = Client(SERVER_NAME=client_host())
+        client.force_login(user)
+
+        for name in names or BENCHMARKS:
+            times = []
+            try:
+                for _ in range(repeat):
+                    cache.clear()
+                    with CaptureQueriesContext(connection) as queries:
+                        start = time.perf_counter()
+                        BENCHMARKS[name](client)
+                        times.append(time.perf_counter() - start)
+            except BenchmarkSkipped as e:
+                log(f'{name}: skipped ({e})')
+                continue
+            results[name] = {
+                'seconds': statistics.median(times),
+                'min_seconds': min(times),
+                'queries': len(queries),
+            }
+            log(f'{name}: {results[name]["seconds"] * 1000:.1f} ms, {len(queries)} queries')
+    return results
+
+
+def compare(baseline, results, threshold=1.25):
+    """
+    Return a description of every benchmark that needs more queries than in the baseline, or got slower than
+    `threshold` times its baseline time.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        if result['queries'] > before['queries']:
+            regressions.append(f'{name}: {before["queries"]} -> {result["queries"]} queries')
+        if result['seconds'] > before['seconds'] * threshold:
+            regressions.append(f'{name}: {before["seconds"] * 1000:.1f} -> {result["seconds"] * 1000:.1f} ms')
+    return regressions
@@ -0,0 +1,11 @@
+"""
+Helpers for the modules that rebuild precomputed tables in bulk: co-purchases, price statistics, ledger entries and
+residence clusters.
+"""
+from django.db import connection
+
+
+def delete_all(model):
+    """Empty the table with one statement; QuerySet.delete() would fetch every row to send its post_delete signal."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
@@ -0,0 +1,105 @@
+"""
+Versioned caching.
+
+Every model has a version number in the cache that is bumped whenever one of its rows is saved or deleted, or one of
+its many-to-many relations changes, once the transaction commits. Cache keys contain the versions of the models their
+value was computed from, so a change makes all keys that depend on the model unreachable and stale data is never
+served.
+"""
+import hashlib
+import time
+from functools import partial
+
+from django.core.cache import cache
+from django.db import models, transaction
+from django.utils import translation
+
+
+CACHE_TIMEOUT = 60 * 60
+
+
+def version_key(model):
+    return f'luchtmans:version:{model._meta.label_lower}'
+
+
+def new_version():
+    # Start from the clock instead of 1, so a version that got evicted never comes back with a number that old keys
+    # are still stored under
+    return time.time_ns()
+
+
+def get_versions(models):
+    keys = [version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_version(*models):
+    for model in models:
+        try:
+            cache.incr(version_key(model))
+        except ValueError:
+            cache.set(version_key(model), new_version(), timeout=None)
+
+
+def make_key(name, models, *parts):
+    models = sorted(set(models), key=lambda model: model._meta.label_lower)
+    versions = '.'.join(str(version) for version in get_versions(models))
+    digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    return f'luchtmans:{name}:{translation.get_language()}:{versions}:{digest}'
+
+
+def get_or_compute(name, models, parts, compute, timeout=CACHE_TIMEOUT):
+    """Return the cached value for `parts`, or compute and cache it. `models` are the models the value depends on."""
+    key = make_key(name, models, *parts)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout)
+    return value
+
+
+def related_models(model, seen=None):
+    """Return the model and every model it refers to through (chains of) foreign keys."""
+    seen = set() if seen is None else seen
+    seen.add(model)
+    for field in model._meta.concrete_fields:
+        if field.is_relation and field.related_model not in seen:
+            related_models(field.related_model, seen)
+    return seen
+
+
+def lookup_choices(model, ordering=()):
+    """Return the (pk, label) pairs of a small lookup table like Language or RelationType."""
+    def compute():
+        queryset = model._default_manager.all()
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        return [(obj.pk, str(obj)) for obj in queryset]
+
+    return get_or_compute('choices', [model], [list(ordering)], compute)
+
+
+# # # Signal receivers, connected in LuchtmansConfig.ready() # # #
+
+
+# Bumped before commit, a concurrent request could cache the rows from before the commit under the new version
+
+def bump_sender_version(sender, using, **kwargs):
+    if sender._meta.app_label == 'luchtmans':
+        transaction.on_commit(partial(bump_version, sender), using=using)
+
+
+def bump_m2m_versions(sender, instance, action, model, using, **kwargs):
+    if action.startswith('post_') and sender._meta.app_label == 'luchtmans':
+        transaction.on_commit(partial(bump_version, sender, type(instance), model), using=using)
+
+
+def connect_signals():
+    models.signals.post_save.connect(bump_sender_version, dispatch_uid='luchtmans_cache_post_save')
+    models.signals.post_delete.connect(bump_sender_version, dispatch_uid='luchtmans_cache_post_delete')
+    models.signals.m2m_changed.connect(bump_m2m_versions, dispatch_uid='luchtmans_cache_m2m_changed')
@@ -0,0 +1,218 @@
+"""
+Precomputed map clusters of where the clients of Luchtmans lived, per decade.
+
+A client is the person of a collection. During a decade a client lived at the addresses of their periods of
+residence that overlap it, at the coordinates of the address, or of its place if the address has none. An open start
+or end year extends the residence over all decades of the ledgers. At every zoom level the map is divided into a grid
+of cells of CELL_SIZE pixels of the web map tiles, and ResidenceCluster holds one row per decade and cell that clients
+lived in, with their number and mean coordinates. A client counts once per cell, also when they moved within it.
+
+The build_residence_clusters command computes the table from scratch with NumPy, and a map viewport reads the cells
+it covers from the unique index on (zoom, decade, x, y). Between builds the receivers below collect the decades
+touched by changed residences, by clients that were given a collection or lost it, and by addresses, streets and
+places whose coordinates changed, and recompute those decades after commit.
+"""
+import math
+from functools import partial
+from itertools import batched
+
+import numpy as np
+from django.db import transaction
+from django.db.models import FloatField, Q
+from django.db.models.functions import Cast, Coalesce
+from django.db.models.signals import post_save, pre_delete, pre_save
+
+from luchtmans.bulk import delete_all
+from luchtmans.cache import bump_version
+from luchtmans.models import Place, Street, Address, PeriodOfResidence, Collection, ResidenceCluster
+
+# The decades of the ledgers; the firm traded from 1683 until 1848
+FIRST_DECADE = 1680
+LAST_DECADE = 1840
+DECADES = range(FIRST_DECADE, LAST_DECADE + 10, 10)
+
+MAX_ZOOM = 16
+# Cells of 32 x 32 pixels, 8 x 8 to a tile of 256 pixels
+CELL_BITS = 3
+CELL_SIZE = 256 >> CELL_BITS
+# Web maps leave out the poles
+MAX_LATITUDE = 85.05112878
+
+# The coordinates of the residence: those of its address, or else of the place of its street
+LATITUDE = Cast(Coalesce('address__latitude', 'address__street__place__latitude'), FloatField())
+LONGITUDE = Cast(Coalesce('address__longitude', 'address__street__place__longitude'), FloatField())
+
+
+def cells(latitudes, longitudes, zoom):
+    """The columns and rows of the cells of the coordinates in the Web Mercator grid of a zoom level."""
+    size = 1 << (zoom + CELL_BITS)
+    latitudes = np.radians(np.clip(latitudes, -MAX_LATITUDE, MAX_LATITUDE))
+    x = (np.asarray(longitudes) + 180) / 360 * size
+    y = (1 - np.log(np.tan(latitudes) + 1 / np.cos(latitudes)) / math.pi) / 2 * size
+    return np.clip(x.astype(np.int64), 0, size - 1), np.clip(y.astype(np.int64), 0, size - 1)
+
+
+def decade_range(start_year, end_year):
+    """The decades of the ledgers that a residence from start_year to end_year (None for open) overlaps."""
+    first = FIRST_DECADE if start_year is None else max(start_year // 10 * 10, FIRST_DECADE)
+    last = LAST_DECADE if end_year is None else min(end_year // 10 * 10, LAST_DECADE)
+    return range(first, last + 1, 10)
+
+
+def load_residences(decades):
+    """Return arrays (client, start year, end year, latitude, longitude) of the residences overlapping the decades."""
+    residences = PeriodOfResidence.objects.filter(person__collection__isnull=False).overlapping(
+        min(decades), max(decades) + 9).filter(Q(address__latitude__isnull=False)
+                                               | Q(address__street__place__latitude__isnull=False))
+    rows = list(residences.values_list('person_id', 'start_year', 'end_year', LATITUDE, LONGITUDE))
+    columns = list(zip(*rows)) or [()] * 5
+    return (
+        np.array(columns[0], dtype=np.int64),
+        # Open years as the first and last decade
+        np.array([FIRST_DECADE if year is None else year for year in columns[1]], dtype=np.int64),
+        np.array([LAST_DECADE + 9 if year is None else year for year in columns[2]], dtype=np.int64),
+        np.array(columns[3], dtype=np.float64),
+        np.array(columns[4], dtype=np.float64),
+    )
+
+
+def make_clusters(decade, clients, latitudes, longitudes):
+    """Yield the ResidenceCluster rows of a decade at all zoom levels, for clients that lived at the coordinates."""
+    x, y = cells(latitudes, longitudes, MAX_ZOOM)
+    for zoom in range(MAX_ZOOM + 1):
+        shift = MAX_ZOOM - zoom
+        zoom_x, zoom_y = x >> shift, y >> shift
+        # One point per client and cell, the first
+        _, first = np.unique(np.column_stack([clients, zoom_x, zoom_y]), axis=0, return_index=True)
+        cell_keys, groups, counts = np.unique(np.column_stack([zoom_x[first], zoom_y[first]]), axis=0,
+                                              return_inverse=True, return_counts=True)
+        groups = groups.reshape(-1)
+        mean_latitudes = np.bincount(groups, weights=latitudes[first]) / counts
+        mean_longitudes = np.bincount(groups, weights=longitudes[first]) / counts
+        for (cell_x, cell_y), count, latitude, longitude in zip(cell_keys.tolist(), counts.tolist(),
+                                                                mean_latitudes.tolist(), mean_longitudes.tolist()):
+            yield ResidenceCluster(zoom=zoom, decade=decade, x=cell_x, y=cell_y, clients=count, latitude=latitude,
+                                   longitude=longitude)
+
+
+def compute_clusters(decades, batch_size):
+    """Write the clusters of the decades, which have none, and return how many."""
+    count = 0
+    clients, starts, ends, latitudes, longitudes = load_residences(decades)
+    for decade in sorted(decades):
+        selected = (starts <= decade + 9) & (ends >= decade)
+        for batch in batched(make_clusters(decade, clients[selected], latitudes[selected], longitudes[selected]),
+                             batch_size):
+            count += len(ResidenceCluster.objects.bulk_create(batch))
+    return count
+
+
+def build_residence_clusters(batch_size=10_000, log=print):
+    """Rebuild ResidenceCluster from the residences of the clients."""
+    with transaction.atomic():
+        delete_all(ResidenceCluster)
+        count = compute_clusters(DECADES, batch_size)
+    bump_version(ResidenceCluster)
+    log(f"Created {count} residence clusters")
+
+
+def update_residence_clusters(decades, batch_size=10_000):
+    """Recompute the ResidenceCluster rows of the decades."""
+    decades = set(decades) & set(DECADES)
+    if not decades:
+        return
+    with transaction.atomic():
+        # In one statement, like delete_all(); the version is bumped below instead of by a signal per row
+        clusters = ResidenceCluster.objects.filter(decade__in=decades)
+        clusters._raw_delete(clusters.db)
+        compute_clusters(decades, batch_size)
+    bump_version(ResidenceCluster)
+
+
+def residence_clusters(zoom, decade, south, west, north, east):
+    """The clusters of a decade at a zoom level whose cells overlap the bounding box, in degrees."""
+    zoom = min(max(zoom, 0), MAX_ZOOM)
+    (west_x, east_x), (north_y, south_y) = (values.tolist() for values in cells([north, south], [west, east], zoom))
+    # A box across the antimeridian has west > east
+    columns = Q(x__range=(west_x, east_x)) if west_x <= east_x else Q(x__gte=west_x) | Q(x__lte=east_x)
+    return ResidenceCluster.objects.filter(columns, zoom=zoom, decade=decade // 10 * 10,
+                                           y__range=(north_y, south_y)).order_by('x', 'y')
+
+
+def residence_decades(residences):
+    """The decades that the client residences of the `residences` queryset overlap."""
+    return {decade for start_year, end_year in residences.filter(person__collection__isnull=False).values_list(
+        'start_year', 'end_year') for decade in decade_range(start_year, end_year)}
+
+
+# # # Signal receivers, connected in LuchtmansConfig.ready() # # #
+
+# The receivers pass the decades touched by a transaction to a callback of that transaction, which recomputes them
+# after commit; a transaction that is rolled back recomputes nothing. The decades that the old state of a residence or
+# collection counted in are collected before it is saved.
+
+# The path from PeriodOfResidence to the objects whose coordinates the clusters use
+LOCATION_PATHS = {
+    Address: 'address',
+    Street: 'address__street',
+    Place: 'address__street__place',
+}
+# The fields of those objects that the coordinates of a residence depend on; an address without coordinates uses
+# those of the place of its street
+LOCATION_FIELDS = {
+    Address: ['latitude', 'longitude', 'street_id'],
+    Street: ['place_id'],
+    Place: ['latitude', 'longitude'],
+}
+
+
+def schedule_update(decades):
+    if decades := set(decades):
+        transaction.on_commit(partial(update_residence_clusters, decades))
+
+
+def saved_decades(instance):
+    """The decades the residence, or the residences of the client of the collection, count in as stored."""
+    if isinstance(instance, PeriodOfResidence):
+        residences = PeriodOfResidence.objects.filter(pk=instance.pk)
+    else:
+        residences = PeriodOfResidence.objects.filter(person__collection=instance.pk)
+    return residence_decades(residences)
+
+
+def remember_decades(sender, instance, **kwargs):
+    if not instance._state.adding:
+        instance._saved_cluster_decades = saved_decades(instance)
+
+
+def instance_saved(sender, instance, **kwargs):
+    schedule_update(instance.__dict__.pop('_saved_cluster_decades', set()) | saved_decades(instance))
+
+
+def instance_deleting(sender, instance, **kwargs):
+    schedule_update(saved_decades(instance))
+
+
+def remember_location(sender, instance, **kwargs):
+    if not instance._state.adding:
+        fields = LOCATION_FIELDS[sender]
+        stored = sender.objects.filter(pk=instance.pk).values_list(*fields).first()
+        instance._cluster_location_changed = stored != tuple(
+            sender._meta.get_field(field).to_python(getattr(instance, field)) for field in fields)
+
+
+def location_saved(sender, instance, **kwargs):
+    # New addresses, streets and places have no residences yet, and saving a corrected name moves none
+    if instance.__dict__.pop('_cluster_location_changed', False):
+        schedule_update(residence_decades(PeriodOfResidence.objects.filter(**{LOCATION_PATHS[sender]: instance.pk})))
+
+
+def connect_signals():
+    for model in [PeriodOfResidence, Collection]:
+        pre_save.connect(remember_decades, sender=model, dispatch_uid=f'luchtmans_clusters_pre_save_{model.__name__}')
+        post_save.connect(instance_saved, sender=model, dispatch_uid=f'luchtmans_clusters_post_save_{model.__name__}')
+        pre_delete.connect(instance_deleting, sender=model,
+                           dispatch_uid=f'luchtmans_clusters_pre_delete_{model.__name__}')
+    for model in LOCATION_PATHS:
+        pre_save.connect(remember_location, sender=model, dispatch_uid=f'luchtmans_clusters_pre_save_{model.__name__}')
+        post_save.connect(location_saved, sender=model, dispatch_uid=f'luchtmans_clusters_post_save_{model.__name__}')
@@ -0,0 +1,316 @@
+"""
+Precomputed purchase statistics: which editions were bought together, and which clients bought alike.
+
+Items link a collection (one per client) to the editions it bought. CollectionEdition holds that collection x edition
+matrix as a sparse table with one row per non-zero cell. From the matrix follow two co-occurrence tables, both kept
+to the TOP entries per row:
+
+    EditionCoPurchase       per edition, the editions bought by most of the same collections ("also bought")
+    CollectionSimilarity    per collection, the collections with the most editions in common, relative to their size
+
+The build_co_purchases command computes all three from scratch with NumPy. Between builds the receivers below collect
+the (collection, edition) cells touched by saved and deleted items, and update those cells after commit. Where a cell
+appears or disappears, the co-occurrence rows of its edition and its collection are recomputed exactly; the rows of
+their partners get the new counts, but a partner whose row lost an entry keeps TOP - 1 entries until the next build.
+"""
+from collections import Counter, defaultdict
+from functools import partial
+from itertools import batched
+
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import Count, Min
+from django.db.models.signals import m2m_changed, post_save, pre_delete, pre_save
+
+from luchtmans.bulk import delete_all
+from luchtmans.cache import bump_version
+from luchtmans.models import Item, CollectionEdition, EditionCoPurchase, CollectionSimilarity
+
+TOP = 20
+
+# The number of co-occurrences counted at once; bounds the memory of a build
+MAX_EXPANSION = 10_000_000
+
+
+def co_occurrences(baskets, members, sources, sizes, top=None, by='count'):
+    """
+    Count how often each source is in the same basket as each other member.
+
+    `baskets` and `members` are arrays of unique (basket, member) pairs, which have to include all pairs of the baskets
+    that hold a source. `sizes` is indexed by member and holds its total number of baskets, for the Jaccard similarity.
+    Return arrays (source, other, count, similarity), and with `top` only the top per source, ranked `by` count or
+    similarity.
+    """
+    order = np.argsort(baskets, kind='stable')
+    baskets, members = baskets[order], members[order]
+    basket_ids, basket_starts, basket_sizes = np.unique(baskets, return_index=True, return_counts=True)
+
+    # The memberships of the sources, grouped by source
+    selected = np.flatnonzero(np.isin(members, sources))
+    selected = selected[np.argsort(members[selected], kind='stable')]
+    source_members = members[selected]
+    source_baskets = np.searchsorted(basket_ids, baskets[selected])
+    expansion = basket_sizes[source_baskets]
+    multiplier = int(members.max(initial=0)) + 1
+
+    results = [tuple(np.zeros(0, dtype=dtype) for dtype in (np.int64, np.int64, np.int64, np.float64))]
+    for chunk in source_chunks(source_members, expansion):
+        starts, counts = basket_starts[source_baskets[chunk]], expansion[chunk]
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        source, other = np.repeat(source_members[chunk], counts), members[positions]
+        different = source != other
+        keys, count = np.unique(source[different] * multiplier + other[different], return_counts=True)
+        source, other = np.divmod(keys, multiplier)
+        similarity = count / (sizes[source] + sizes[other] - count)
+        results.append(keep_top(source, other, count, similarity, top, by))
+    return tuple(np.concatenate(arrays) for arrays in zip(*results))
+
+
+def source_chunks(source_members, expansion):
+    """Split the memberships into slices of about MAX_EXPANSION co-occurrences, without splitting a source."""
+    cumulative = np.cumsum(expansion)
+    start = done = 0
+    for end in [*(np.flatnonzero(np.diff(source_members)) + 1).tolist(), len(source_members)]:
+        if end > start and (cumulative[end - 1] - done >= MAX_EXPANSION or end == len(source_members)):
+            yield slice(start, end)
+            start, done = end, cumulative[end - 1]
+
+
+def keep_top(source, other, count, similarity, top=None, by='count'):
+    """Order the co-occurrences by source and then by `by`, and keep the `top` per source."""
+    order = np.lexsort((other, -(similarity if by == 'similarity' else count), source))
+    arrays = [array[order] for array in (source, other, count, similarity)]
+    if top is None:
+        return arrays
+    keep = np.arange(len(order)) - np.searchsorted(arrays[0], arrays[0]) < top
+    return [array[keep] for array in arrays]
+
+
+class CoOccurrence:
+    """A co-occurrence table of `member_field` objects that share a `basket_field` object in CollectionEdition."""
+
+    def __init__(self, model, member_field, basket_field, count_field, order_by='count'):
+        self.model = model
+        self.member_field = member_field
+        self.basket_field = basket_field
+        self.count_field = count_field
+        self.order_by = order_by
+        self.has_similarity = any(field.name == 'similarity' for field in model._meta.fields)
+
+    def sizes(self, members):
+        counts = CollectionEdition.objects.filter(**{f'{self.member_field}__in': members.tolist()}).values_list(
+            self.member_field).annotate(Count('pk'))
+        return array_map(dict(counts))
+
+    def make(self, source, other, count, similarity):
+        obj = self.model(**{f'{self.member_field}_id': source, 'other_id': other, self.count_field: count})
+        if self.has_similarity:
+            obj.similarity = similarity
+        return obj
+
+    def build(self, baskets, members, sizes, batch_size, log):
+        """Replace the table by the co-occurrences of all members."""
+        rows = co_occurrences(baskets, members, np.unique(members), sizes, TOP, self.order_by)
+        with transaction.atomic():
+            delete_all(self.model)
+            for batch in batched(map(self.make, *[array.tolist() for array in rows]), batch_size):
+                self.model.objects.bulk_create(batch)
+        log(f"Created {len(rows[0])} {self.model._meta.verbose_name_plural}")
+
+    def refresh(self, sources):
+        """Recompute the rows of the `sources`, and update their entries in the rows of the other members."""
+        sources = np.array(sorted(sources), dtype=np.int64)
+        baskets = CollectionEdition.objects.filter(**{f'{self.member_field}__in': sources.tolist()}).values(
+            self.basket_field)
+        pairs = np.array(CollectionEdition.objects.filter(**{f'{self.basket_field}__in': baskets}).values_list(
+            self.basket_field, self.member_field), dtype=np.int64).reshape(-1, 2)
+        source, other, count, similarity = co_occurrences(pairs[:, 0], pairs[:, 1], sources,
+                                                          self.sizes(np.unique(pairs[:, 1])))
+
+        self.model.objects.filter(**{f'{self.member_field}__in': sources.tolist()}).delete()
+        top = keep_top(source, other, count, similarity, TOP, self.order_by)
+        self.model.objects.bulk_create(map(self.make, *[array.tolist() for array in top]))
+
+        # The same pairs seen from the other members, whose rows are only updated where the pair is in their TOP
+        partners = ~np.isin(other, sources)
+        new = {(int(o), int(s)): (int(c), float(sim)) for s, o, c, sim in
+               zip(source[partners], other[partners], count[partners], similarity[partners])}
+        existing = self.model.objects.filter(other__in=sources.tolist()).exclude(
+            **{f'{self.member_field}__in': sources.tolist()})
+        changed, removed = [], []
+        for obj in existing:
+            key = (getattr(obj, f'{self.member_field}_id'), obj.other_id)
+            if key not in new:
+                removed.append(obj.pk)
+                continue
+            count, similarity = new.pop(key)
+            if (getattr(obj, self.count_field), getattr(obj, 'similarity', similarity)) != (count, similarity):
+                setattr(obj, self.count_field, count)
+                if self.has_similarity:
+                    obj.similarity = similarity
+                changed.append(obj)
+        self.model.objects.filter(pk__in=removed).delete()
+        self.model.objects.bulk_update(changed, [self.count_field] + (['similarity'] if self.has_similarity else []))
+        self.add_to_top(new)
+
+    def add_to_top(self, new):
+        """Add the pairs in {(member, other): (count, similarity)} to the rows of members where they rank in the TOP."""
+        score, position = ('similarity', 1) if self.order_by == 'similarity' else (self.count_field, 0)
+        thresholds = {member: (rows, lowest) for member, rows, lowest in self.model.objects.filter(
+            **{f'{self.member_field}__in': {member for member, _ in new}}).values_list(self.member_field).annotate(
+            Count('pk'), Min(score))}
+        new = {(member, other): values for (member, other), values in new.items() if member not in thresholds
+               or thresholds[member][0] < TOP or values[position] >= thresholds[member][1]}
+        if not new:
+            return
+
+        rows = defaultdict(list)
+        for obj in self.model.objects.filter(**{f'{self.member_field}__in': {member for member, _ in new}}):
+            rows[getattr(obj, f'{self.member_field}_id')].append(obj)
+        created, removed = [], []
+        for (member, other), (count, similarity) in new.items():
+            obj = self.make(member, other, count, similarity)
+            ranked = sorted(rows[member] + [obj], key=self.sort_key)
+            rows[member] = ranked[:TOP]
+            if obj in rows[member]:
+                created.append(obj)
+            removed += [dropped.pk for dropped in ranked[TOP:] if dropped.pk]
+        self.model.objects.filter(pk__in=removed).delete()
+        self.model.objects.bulk_create(created)
+
+    def sort_key(self, obj):
+        return -getattr(obj, 'similarity' if self.order_by == 'similarity' else self.count_field), obj.other_id
+
+
+EDITION_CO_PURCHASES = CoOccurrence(EditionCoPurchase, 'edition', 'collection', 'collections')
+COLLECTION_SIMILARITIES = CoOccurrence(CollectionSimilarity, 'collection', 'edition', 'editions', 'similarity')
+
+
+def array_map(mapping):
+    """Turn {id: value} into an array indexed by id, with 0 for missing ids."""
+    array = np.zeros(max(mapping, default=0) + 1, dtype=np.int64)
+    array[list(mapping)] = list(mapping.values())
+    return array
+
+
+def load_matrix(batch_size=100_000):
+    """Return the (collection, edition, items) arrays of the collection x edition matrix, computed from the items."""
+    rows = Item.editions.through.objects.values_list('item__collection_id', 'edition_id')
+    chunks = [np.array(chunk, dtype=np.int64) for chunk in batched(rows.iterator(chunk_size=batch_size), batch_size)]
+    pairs = np.concatenate(chunks) if chunks else np.zeros((0, 2), dtype=np.int64)
+    multiplier = int(pairs[:, 1].max(initial=0)) + 1
+    keys, items = np.unique(pairs[:, 0] * multiplier + pairs[:, 1], return_counts=True)
+    collections, editions = np.divmod(keys, multiplier)
+    return collections, editions, items
+
+
+def build_co_purchases(batch_size=10_000, log=print):
+    """Rebuild CollectionEdition, EditionCoPurchase and CollectionSimilarity from the items."""
+    collections, editions, items = load_matrix()
+    with transaction.atomic():
+        delete_all(CollectionEdition)
+        for batch in batched(zip(collections.tolist(), editions.tolist(), items.tolist()), batch_size):
+            CollectionEdition.objects.bulk_create(CollectionEdition(collection_id=collection, edition_id=edition,
+                                                                    items=count)
+                                                  for collection, edition, count in batch)
+    log(f"Created {len(items)} collection editions")
+    EDITION_CO_PURCHASES.build(collections, editions, np.bincount(editions), batch_size, log)
+    COLLECTION_SIMILARITIES.build(editions, collections, np.bincount(collections), batch_size, log)
+    bump_version(CollectionEdition, EditionCoPurchase, CollectionSimilarity)
+
+
+def update_co_purchases(cells):
+    """Update the (collection id, edition id) cells of the matrix from the items, and the co-occurrences they affect."""
+    collections = {collection for collection, _ in cells}
+    editions = {edition for _, edition in cells}
+    counts = Counter(pair for pair in Item.editions.through.objects.filter(
+        item__collection__in=collections, edition__in=editions).values_list('item__collection_id', 'edition_id')
+        if pair in cells)
+    existing = {(obj.collection_id, obj.edition_id): obj for obj in CollectionEdition.objects.filter(
+        collection__in=collections, edition__in=editions) if (obj.collection_id, obj.edition_id) in cells}
+
+    created = [CollectionEdition(collection_id=collection, edition_id=edition, items=count)
+               for (collection, edition), count in counts.items() if (collection, edition) not in existing]
+    changed = []
+    for cell, obj in existing.items():
+        if cell in counts and obj.items != counts[cell]:
+            obj.items = counts[cell]
+            changed.append(obj)
+    removed = [obj.pk for cell, obj in existing.items() if cell not in counts]
+    CollectionEdition.objects.bulk_create(created)
+    CollectionEdition.objects.bulk_update(changed, ['items'])
+    CollectionEdition.objects.filter(pk__in=removed).delete()
+
+    appeared = {(obj.collection_id, obj.edition_id) for obj in created}
+    disappeared = {cell for cell, obj in existing.items() if cell not in counts}
+    if appeared or disappeared:
+        EDITION_CO_PURCHASES.refresh({edition for _, edition in appeared | disappeared})
+        COLLECTION_SIMILARITIES.refresh({collection for collection, _ in appeared | disappeared})
+    if created or changed or removed:
+        bump_version(CollectionEdition, EditionCoPurchase, CollectionSimilarity)
+
+
+def also_bought(edition_id, limit=10):
+    """The editions bought most often by the clients who bought the edition."""
+    return EditionCoPurchase.objects.filter(edition=edition_id).select_related('other').order_by(
+        '-collections', 'other')[:limit]
+
+
+def similar_collections(collection_id, limit=10):
+    """The collections with the most editions in common with the collection, relative to their size."""
+    return CollectionSimilarity.objects.filter(collection=collection_id).select_related('other').order_by(
+        '-similarity', 'other')[:limit]
+
+
+# # # Signal receivers, connected in LuchtmansConfig.ready() # # #
+
+# The receivers pass the cells touched by a transaction to a callback of that transaction, which updates them after
+# commit; a transaction that is rolled back updates nothing.
+
+def schedule_update(cells):
+    if cells := set(cells):
+        transaction.on_commit(partial(update_co_purchases, cells))
+
+
+def item_edition_cells(**filters):
+    return list(Item.editions.through.objects.filter(**filters).values_list('item__collection_id', 'edition_id'))
+
+
+def remember_collection(sender, instance, **kwargs):
+    if not instance._state.adding:
+        instance._saved_collection_id = Item.objects.filter(pk=instance.pk).values_list(
+            'collection_id', flat=True).first()
+
+
+def item_saved(sender, instance, created, **kwargs):
+    # The counts only change when an item moves to another collection; new items get their editions afterwards
+    old_collection_id = getattr(instance, '_saved_collection_id', instance.collection_id)
+    if not created and old_collection_id != instance.collection_id:
+        cells = item_edition_cells(item=instance.pk)
+        schedule_update(cells + [(old_collection_id, edition) for _, edition in cells])
+
+
+def item_deleting(sender, instance, **kwargs):
+    schedule_update(item_edition_cells(item=instance.pk))
+
+
+def item_editions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """`instance` is an item and `pk_set` holds editions, or with reverse, an edition and items."""
+    if action == 'pre_clear':
+        instance._cleared_cells = item_edition_cells(**{'edition' if reverse else 'item': instance.pk})
+    elif action == 'post_clear':
+        schedule_update(instance.__dict__.pop('_cleared_cells', []))
+    elif action in ('post_add', 'post_remove'):
+        if reverse:
+            collection_ids = Item.objects.filter(pk__in=pk_set).values_list('collection_id', flat=True)
+            schedule_update((collection_id, instance.pk) for collection_id in collection_ids)
+        else:
+            schedule_update((instance.collection_id, edition_id) for edition_id in pk_set)
+
+
+def connect_signals():
+    pre_save.connect(remember_collection, sender=Item, dispatch_uid='luchtmans_copurchases_pre_save')
+    post_save.connect(item_saved, sender=Item, dispatch_uid='luchtmans_copurchases_post_save')
+    pre_delete.connect(item_deleting, sender=Item, dispatch_uid='luchtmans_copurchases_pre_delete')
+    m2m_changed.connect(item_editions_changed, sender=Item.editions.through,
+                        dispatch_uid='luchtmans_copurchases_m2m_changed')
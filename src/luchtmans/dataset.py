@@ -0,0 +1,265 @@
+"""
+Synthetic data at the scale of the full ledgers, for benchmarks.
+
+The generator is seeded, so the same seed and scale give the same data. Places, languages, STCN genres and the other
+lookups are drawn from a Zipf-like distribution: a few are used for most rows, like Leiden, Latin and theology in the
+real ledgers. Rows are written with bulk_create, so the denormalized search and geohash columns are filled here.
+"""
+import math
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import accumulate, batched
+
+from django.db import transaction
+
+from luchtmans.analytics import build_price_aggregates
+from luchtmans.autocomplete import normalize_name
+from luchtmans.cache import bump_version
+from luchtmans.clusters import build_residence_clusters
+from luchtmans.copurchases import build_co_purchases
+from luchtmans.entries import build_ledger_entries
+from luchtmans.geo import METERS_PER_DEGREE, geohash
+from luchtmans.models import (Country, Place, Street, Address, PeriodOfResidence, Person, PersonPersonRelation,
+                              RelationType, Language, Work, STCNGenre, Edition, PersonEditionRelationRole,
+                              PersonEditionRelation, Collection, ItemType, Page, Binding, Item)
+from luchtmans.relations import bulk_add_person_relations
+from luchtmans.search import update_search_vectors
+
+LOOKUP_COUNTS = {
+    'countries': 20,
+    'places': 2_000,
+    'languages': 30,
+    'stcn_genres': 100,
+    'relation_types': 20,
+    'item_types': 10,
+    'bindings': 20,
+}
+
+# Multiplied by the scale
+COUNTS = {
+    'streets': 20_000,
+    'addresses': 100_000,
+    'persons': 200_000,
+    'relations': 500_000,
+    'works': 50_000,
+    'editions': 100_000,
+    'collections': 5_000,
+    'pages': 40_000,
+    'items': 2_000_000,
+}
+
+FIRST_NAMES = ['Johannes', 'Jan', 'Pieter', 'Samuel', 'Elie', 'Abraham', 'Maria', 'Anna', 'Cornelis', 'Hendrik',
+               'Willem', 'Jacob', 'Isaac', 'Catharina', 'Johanna', 'Frederik', 'Daniel', 'Petrus', 'Adriaan', 'Susanna']
+SURNAMES = ['Luchtmans', 'Luzac', 'Elsevier', 'van der Aa', 'Boerhaave', 'Musschenbroek', 'Hemsterhuis', 'de Vries',
+            'van Dijk', 'Bakker', 'Janssen', 'de Jong', 'Visser', 'Smit', 'Meijer', 'de Groot', 'Mulder', 'Bos',
+            'Vos', 'Peters', 'Hendriks', 'van Leeuwen', 'Dekker', 'Brouwer', 'de Wit', 'Dijkstra', 'Verhoeven']
+# Places are drawn within Europe, except the first; addresses lie at most this many meters north, south, east or
+# west of their place
+LEIDEN = (52.1601, 4.4970)
+ADDRESS_SPREAD = 3_000
+TITLE_WORDS = ['beschryving', 'historie', 'verhandeling', 'catalogus', 'opera', 'omnia', 'epistolae', 'institutiones',
+               'medicinae', 'philosophiae', 'theologie', 'der', 'van', 'de', 'stadt', 'leyden', 'nederlanden',
+               'natuurkunde', 'commentarius', 'in', 'novum', 'testamentum', 'bybel', 'gedichten', 'zedekunde']
+
+
+class DatasetGenerator:
+    def __init__(self, scale=1.0, seed=0, batch_size=10_000, log=print):
+        self.counts = LOOKUP_COUNTS | {name: max(1, round(count * scale)) for name, count in COUNTS.items()}
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.log = log
+
+    def skewed(self, population, exponent=1.1):
+        """Return a function that draws k elements of `population`, the first ones far more often than the last."""
+        cum_weights = list(accumulate(1 / (rank + 1) ** exponent for rank in range(len(population))))
+        return lambda k=1: self.random.choices(population, cum_weights=cum_weights, k=k)
+
+    def words(self, population, low, high):
+        return ' '.join(self.random.choices(population, k=self.random.randint(low, high)))
+
+    def create(self, model, objects):
+        """bulk_create `objects` in batches and return their primary keys."""
+        pks = []
+        for batch in batched(objects, self.batch_size):
+            with transaction.atomic():
+                pks += [obj.pk for obj in model.objects.bulk_create(batch)]
+        self.log(f"Created {len(pks)} {model._meta.verbose_name_plural}")
+        return pks
+
+    def lookups(self, model, count, label):
+        return self.create(model, (model(name=f'{label} {i}') for i in range(count)))
+
+    def generate(self):
+        counts = self.counts
+        countries = self.create(Country, (Country(name=f'Country {i}') for i in range(counts['countries'])))
+        random_country = self.skewed(countries)
+        # Drawn apart from the rest, so the other rows are the same as in datasets from before there were coordinates
+        coordinates_random = random.Random(self.seed)
+        coordinates = [LEIDEN] + [(round(coordinates_random.uniform(43, 56), 6),
+                                   round(coordinates_random.uniform(-5, 20), 6)) for _ in range(counts['places'] - 1)]
+        places = self.create(Place, (
+            Place(name=f'Place {i}', name_en=f'Place {i}', country_id=random_country()[0],
+                  search_name=normalize_name(f'Place {i}'), latitude=latitude, longitude=longitude,
+                  geohash=geohash(latitude, longitude))
+            for i, (latitude, longitude) in enumerate(coordinates)
+        ))
+        random_place = self.skewed(places)
+        languages = self.skewed(self.lookups(Language, counts['languages'], 'Language'))
+        stcn_genres = self.skewed(self.lookups(STCNGenre, counts['stcn_genres'], 'STCN genre'))
+        item_types = self.skewed(self.lookups(ItemType, counts['item_types'], 'Item type'))
+        bindings = self.skewed(self.lookups(Binding, counts['bindings'], 'Binding'))
+        relation_types = self.skewed(self.create(RelationType, (
+            RelationType(text=f'Relation type {i}') for i in range(counts['relation_types'])
+        )))
+        role = PersonEditionRelationRole.objects.get_or_create(name='author')[0]
+
+        persons = self.create(Person, self.persons(random_place))
+        random_person = self.skewed(persons, exponent=0.8)
+
+        self.relations(persons, random_person, relation_types)
+
+        works = self.create(Work, (
+            Work(title=self.words(TITLE_WORDS, 2, 8).capitalize(), uncertain=self.random.random() < 0.1)
+            for _ in range(counts['works'])
+        ))
+        editions = self.create(Edition, self.editions(works))
+        self.add_relations(Edition.places_of_publication.through, 'edition_id', 'place_id', editions, random_place)
+        self.add_relations(Edition.languages.through, 'edition_id', 'language_id', editions, languages)
+        self.add_relations(Edition.stcn_genres.through, 'edition_id', 'stcngenre_id', editions, stcn_genres)
+        self.create(PersonEditionRelation, (
+            PersonEditionRelation(edition_id=edition, person_id=random_person()[0], role=role) for edition in editions
+        ))
+
+        collections = self.create(Collection, (
+            Collection(short_title=f'Collection {i}', client_id=person)
+            for i, person in enumerate(self.random.sample(persons, min(counts['collections'], len(persons))))
+        ))
+        pages = self.create(Page, (
+            Page(volume=i // 1000 + 1, folio=str(i % 1000 // 2 + 1), recto_verso='RV'[i % 2])
+            for i in range(counts['pages'])
+        ))
+        items = self.create(Item, self.items(self.skewed(collections, 0.5), pages, item_types))
+        self.add_relations(Item.editions.through, 'item_id', 'edition_id', items, self.skewed(editions, 0.9))
+        self.add_relations(Item.languages.through, 'item_id', 'language_id', items, languages)
+        self.add_relations(Item.binding.through, 'item_id', 'binding_id', items, bindings)
+        addresses = self.addresses(dict(zip(places, coordinates)), random_place)
+        clients = Collection.objects.filter(pk__in=collections).order_by('pk').values_list('client_id', flat=True)
+        self.residences(clients, addresses)
+
+        for model in [Person, Work, Edition, Collection, Item]:
+            update_search_vectors(model.objects.all())
+        # bulk_create sends no signals, so the cached data has to be invalidated here
+        bump_version(Country, Place, Street, Address, PeriodOfResidence, Person, PersonPersonRelation,
+                     PersonPersonRelation.types.through, RelationType, Language, Work, STCNGenre, Edition,
+                     Edition.places_of_publication.through, Edition.languages.through, Edition.stcn_genres.through,
+                     PersonEditionRelation, Collection, ItemType, Page, Binding, Item, Item.editions.through,
+                     Item.languages.through, Item.binding.through)
+        build_co_purchases(self.batch_size, self.log)
+        build_price_aggregates(self.batch_size, self.log)
+        build_ledger_entries(self.batch_size, self.log)
+        build_residence_clusters(self.batch_size, self.log)
+
+    def addresses(self, coordinates, random_place):
+        street_places = [random_place()[0] for _ in range(self.counts['streets'])]
+        streets = self.create(Street, (
+            Street(name=f'Street {i}', place_id=place, search_name=normalize_name(f'Street {i}'))
+            for i, place in enumerate(street_places)
+        ))
+        random_street = self.skewed(list(enumerate(zip(streets, street_places))), exponent=0.5)
+
+        def addresses():
+            for i in range(self.counts['addresses']):
+                (number, (street, place)), = random_street()
+                place_latitude, place_longitude = coordinates[place]
+                spread = ADDRESS_SPREAD / METERS_PER_DEGREE
+                latitude = round(place_latitude + self.random.uniform(-spread, spread), 6)
+                spread /= math.cos(math.radians(place_latitude))
+                longitude = round(place_longitude + self.random.uniform(-spread, spread), 6)
+                house_number = str(i % 200 + 1)
+                yield Address(street_id=street, house_number=house_number, latitude=latitude, longitude=longitude,
+                              geohash=geohash(latitude, longitude),
+                              search_name=normalize_name(f'Street {number}', house_number))
+
+        return self.create(Address, addresses())
+
+    def residences(self, clients, addresses):
+        """One to three periods of residence per client, some without a start or end year."""
+        random_address = self.skewed(addresses, exponent=0.5)
+
+        def residences():
+            for client in clients:
+                for _ in range(self.random.choice([1, 1, 2, 3])):
+                    start_year = self.random.randint(1680, 1840)
+                    end_year = start_year + self.random.randint(0, 30)
+                    yield PeriodOfResidence(
+                        person_id=client, address_id=random_address()[0],
+                        start_year=start_year if self.random.random() < 0.9 else None,
+                        end_year=end_year if self.random.random() < 0.9 else None,
+                    )
+
+        self.create(PeriodOfResidence, residences())
+
+    def persons(self, random_place):
+        for i in range(self.counts['persons']):
+            first_names = self.random.choice(FIRST_NAMES)
+            surname = self.random.choice(SURNAMES)
+            short_name = f'{first_names[0]}. {surname} {i}'
+            born = self.random.randint(1650, 1800)
+            person = Person(
+                short_name=short_name, first_names=first_names, surname=surname,
+                date_of_birth=str(born), date_of_death=str(born + self.random.randint(20, 90)),
+                sex=self.random.choice('FMMMU'), place_of_birth_id=random_place()[0],
+                place_of_death_id=random_place()[0] if self.random.random() < 0.5 else None,
+                search_name=normalize_name(short_name, first_names, surname),
+            )
+            person.parse_dates()
+            yield person
+
+    def relations(self, persons, random_person, relation_types):
+        # Every edge adds a relation and its reverse
+        edges = {}
+        count = min(self.counts['relations'] // 2, len(persons) * (len(persons) - 1) // 2)
+        while len(edges) < count:
+            from_person, to_person = self.random.choice(persons), random_person()[0]
+            if from_person != to_person and (to_person, from_person) not in edges:
+                edges[(from_person, to_person)] = relation_types(self.random.randint(1, 2))
+        created = 0
+        for batch in batched(((*pair, set(types)) for pair, types in edges.items()), self.batch_size):
+            created += bulk_add_person_relations(batch).relations_created
+        self.log(f"Created {created} person relations")
+
+    def editions(self, works):
+        for _ in range(self.counts['editions']):
+            title = self.words(TITLE_WORDS, 3, 12).capitalize()
+            year = self.random.randint(1600, 1800)
+            edition = Edition(
+                title=title, short_title=title[:60], edition_uncertain=self.random.random() < 0.1,
+                year_of_publication_start=year, year_of_publication_end=year + self.random.choice([0, 0, 0, 1, 5]),
+                work_id=self.random.choice(works),
+            )
+            edition.normalized_text = edition.get_normalized_text()
+            yield edition
+
+    def items(self, random_collection, pages, item_types):
+        for _ in range(self.counts['items']):
+            guilders, stuivers = self.random.randint(0, 30), self.random.randint(0, 19)
+            item = Item(
+                collection_id=random_collection()[0], page_id=self.random.choice(pages),
+                transcription_full=self.words(TITLE_WORDS, 2, 8).capitalize(), type_id=item_types()[0],
+                non_book=self.random.random() < 0.05, transcription_incomplete=self.random.random() < 0.1,
+                edition_uncertain=self.random.random() < 0.2, work_in_progress=False,
+                price=f'{guilders}-{stuivers}', price_decimal=Decimal(guilders) + Decimal(stuivers) / 20,
+                date=date(1750, 1, 1) + timedelta(days=self.random.randint(0, 50 * 365)),
+            )
+            item.normalized_text = item.get_normalized_text()
+            yield item
+
+    def add_relations(self, through_model, from_field, to_field, from_ids, random_related):
+        """Link every object to one to three distinct objects drawn by `random_related`."""
+        self.create(through_model, (
+            through_model(**{from_field: from_id, to_field: to_id})
+            for from_id in from_ids
+            for to_id in set(random_related(self.random.choice([1, 1, 1, 2, 3])))
+        ))
@@ -0,0 +1,121 @@
+"""
+Parsing of the free-text dates of birth and death of persons.
+
+The dates are transcribed as found, like '1745-03-02', '2 maart 1745', 'c. 1745', 'before 1790' or '1745/1746'.
+parse_date turns such a text into the earliest and the latest date it can mean, and whether it is uncertain. A year
+without month or day spans the whole year; approximate years ('c.', 'ca.', 'circa', '~', a question mark) are widened
+by CIRCA_YEARS on both sides. Texts that cannot be parsed give no dates and count as uncertain. Widened dates stop at
+the first and last day that a date can have.
+
+lifespan() combines the parsed dates of birth and death into the period in which a person may have been alive. Where
+the birth or death is unknown, MAX_LIFESPAN years before the earliest or after the latest known date is assumed.
+"""
+import calendar
+import re
+from collections import namedtuple
+from datetime import MAXYEAR, MINYEAR, date
+
+ParsedDate = namedtuple('ParsedDate', ['earliest', 'latest', 'uncertain'])
+
+CIRCA_YEARS = 5
+MAX_LIFESPAN = 100
+
+MONTHS = {
+    name: number
+    for number, names in enumerate([
+        ('january', 'januari', 'jan'), ('february', 'februari', 'feb'), ('march', 'maart', 'mar', 'mrt'),
+        ('april', 'apr'), ('may', 'mei'), ('june', 'juni', 'jun'), ('july', 'juli', 'jul'),
+        ('august', 'augustus', 'aug'), ('september', 'sep', 'sept'), ('october', 'oktober', 'oct', 'okt'),
+        ('november', 'nov'), ('december', 'dec'),
+    ], start=1)
+    for name in names
+}
+
+CIRCA = re.compile(r'^(circa|ca|c|approx|about|omstreeks|rond|~)\.?\s*', re.IGNORECASE)
+BEFORE = re.compile(r'^(before|voor|vóór|uiterlijk|<)\s*', re.IGNORECASE)
+AFTER = re.compile(r'^(after|na|>)\s*', re.IGNORECASE)
+ISO_DATE = re.compile(r'^(\d{3,4})(?:-(\d{1,2})(?:-(\d{1,2}))?)?$')
+DUTCH_DATE = re.compile(r'^(\d{1,2})-(\d{1,2})-(\d{4})$')
+WRITTEN_DATE = re.compile(r'^(?:(\d{1,2})\s+)?([a-z]+)\.?\s+(\d{4})$')
+YEAR_RANGE = re.compile(r'^(\d{4})\s*(?:/|-|–|or|of|en)\s*(\d{2,4})$')
+
+
+def year_start(year):
+    """January 1 of the year, or of the first or last year a date can have."""
+    return date(min(max(year, MINYEAR), MAXYEAR), 1, 1)
+
+
+def year_end(year):
+    """December 31 of the year, or of the first or last year a date can have."""
+    return date(min(max(year, MINYEAR), MAXYEAR), 12, 31)
+
+
+def add_days(day, days):
+    """The day `days` days after `day`, or the first or last day a date can have."""
+    return date.fromordinal(min(max(day.toordinal() + days, date.min.toordinal()), date.max.toordinal()))
+
+
+def day_range(year, month=None, day=None):
+    """The first and last day of a year, a month or a single day."""
+    if day:
+        return date(year, month, day), date(year, month, day)
+    if month:
+        return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+    return date(year, 1, 1), date(year, 12, 31)
+
+
+def parse_exact(text):
+    """Parse a single date without qualifiers; return (earliest, latest), or None for anything else."""
+    try:
+        if match := ISO_DATE.match(text):
+            year, month, day = (int(part) if part else None for part in match.groups())
+            return day_range(year, month, day)
+        if match := DUTCH_DATE.match(text):
+            day, month, year = map(int, match.groups())
+            return day_range(year, month, day)
+        if (match := WRITTEN_DATE.match(text)) and match[2] in MONTHS:
+            return day_range(int(match[3]), MONTHS[match[2]], int(match[1]) if match[1] else None)
+    except ValueError:
+        # Impossible dates like 1745-02-30
+        pass
+    return None
+
+
+def parse_date(text):
+    """Parse a free-text date into a ParsedDate; empty texts give ParsedDate(None, None, False)."""
+    text = ' '.join((text or '').split()).casefold()
+    if not text:
+        return ParsedDate(None, None, False)
+
+    uncertain = text.endswith('?')
+    text = text.rstrip('?').strip()
+
+    if match := CIRCA.match(text):
+        if exact := parse_exact(text[match.end():]):
+            earliest, latest = exact
+            return ParsedDate(year_start(earliest.year - CIRCA_YEARS), year_end(latest.year + CIRCA_YEARS), True)
+    elif match := BEFORE.match(text):
+        if exact := parse_exact(text[match.end():]):
+            return ParsedDate(None, add_days(exact[0], -1), True)
+    elif match := AFTER.match(text):
+        if exact := parse_exact(text[match.end():]):
+            return ParsedDate(add_days(exact[1], 1), None, True)
+    elif exact := parse_exact(text):
+        return ParsedDate(*exact, uncertain)
+    elif match := YEAR_RANGE.match(text):
+        # '1745/46' means 1745 or 1746
+        first, last = match[1], match[1][:4 - len(match[2])] + match[2]
+        if first <= last:
+            return ParsedDate(date(int(first), 1, 1), date(int(last), 12, 31), True)
+
+    return ParsedDate(None, None, True)
+
+
+def lifespan(birth, death):
+    """Return the first and last possible day of the life of a person born at `birth` and died at `death`."""
+    known = [day for day in [*birth[:2], *death[:2]] if day is not None]
+    if not known:
+        return None, None
+    alive_from = birth.earliest or year_start(min(known).year - MAX_LIFESPAN)
+    alive_until = death.latest or year_end(max(known).year + MAX_LIFESPAN)
+    return alive_from, alive_until
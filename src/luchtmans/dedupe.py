@@ -0,0 +1,390 @@
+"""
+Finding and merging duplicate persons.
+
+Imports and data entry leave some persons in the database more than once, as 'J. Luzac' and 'Johan Luzac'.
+candidate_pairs() proposes the pairs that may be the same person without comparing every pair. Persons are put in
+blocks by a phonetic key of their surname and the initial of their first names; a person without first names goes in
+every block of their surname. Within a block, persons sorted by year of birth are only compared with the persons born
+at most YEARS years later; persons without a date of birth are compared with their whole block. The names of all
+pairs are then scored at once with NumPy, from the overlap of the letter bigrams of the surnames, with letters that
+sound alike taken as the same, and of the first names, where initials are as good as the names they abbreviate.
+Pairs of persons who died more than YEARS apart, and pairs of two clients, which cannot be merged, are left out.
+
+merge_persons() merges the duplicates into the persons they duplicate in one transaction. Every table that refers to
+persons is updated with one UPDATE per batch of duplicates, after which rows that say the same thing twice are deleted.
+Relations between persons are merged with the relations the kept person already had, in both directions and with the
+types of both, and relations between a person and their duplicate are deleted. Empty fields of the kept person are
+filled in from the duplicates. The duplicates are deleted without signals, so their deletion and the person they were
+merged into are written to the audit log of django-easy-audit directly. The ledger entries, price statistics and
+residence clusters of the moved clients are updated afterwards.
+"""
+import json
+import re
+import zlib
+from collections import defaultdict, namedtuple
+from functools import cache
+from itertools import batched
+
+import numpy as np
+from django.contrib.contenttypes.models import ContentType
+from django.core import serializers
+from django.db import transaction
+from django.db.models import Case, OuterRef, Q, Subquery, Value, When
+from easyaudit.middleware.easyaudit import get_current_user
+from easyaudit.models import CRUDEvent
+
+from luchtmans.analytics import MAX_ITEMS, update_price_aggregates
+from luchtmans.autocomplete import fold_text, normalize_name
+from luchtmans.cache import bump_version
+from luchtmans.clusters import residence_decades, update_residence_clusters
+from luchtmans.models import (Person, PersonPersonRelation, PeriodOfResidence, PersonReligion, PersonWorkRelation,
+                              PersonEditionRelation, Collection, LedgerEntry, PriceAggregate)
+from luchtmans.relations import existing_relation_ids
+from luchtmans.search import update_search_vectors
+from luchtmans.spelling import normalize_spelling
+
+# Compared persons were born, and if both dates are known died, at most this many years apart
+YEARS = 5
+# The least score of a candidate pair
+SCORE_CUTOFF = 0.8
+SURNAME_WEIGHT = 0.6
+# Words of surnames that are left out of the key and the comparison, like in 'van der Aa'
+PARTICLES = {'van', 'der', 'den', 'de', 'ter', 'ten', 'te', 'het', 't', 'in', 'op', 'von', 'la', 'le', 'du', 'des'}
+# Letters that sound alike are taken as the same letter; in the phonetic key, vowels and these are left out after
+# the first letter
+SOUNDS = str.maketrans({letter: group[0] for group in ['bp', 'fvw', 'cgkqx', 'sz', 'dt', 'mn'] for letter in group})
+SILENT = set('aeiouyhj')
+# The bigrams of a name as a set of 128 bits, in two 64 bit words
+SIGNATURE_WORDS = 2
+
+MergeResult = namedtuple('MergeResult', ['persons_merged', 'rows_moved'])
+
+# The fields that make two rows of the same person say the same, per model that refers to persons
+PERSON_ROWS = {
+    PeriodOfResidence: ['address', 'start_year', 'end_year'],
+    PersonReligion: ['religion', 'start_year', 'end_year'],
+    PersonWorkRelation: ['work', 'role'],
+    PersonEditionRelation: ['edition', 'role'],
+}
+# The fields of the kept person that are filled in from a duplicate when empty
+FILLED_FIELDS = ['surname', 'first_names', 'date_of_birth', 'date_of_death', 'sex', 'place_of_birth_id',
+                 'place_of_death_id', 'wikidata_id', 'notes', 'bibliography_sources']
+
+
+class MergeError(ValueError):
+    pass
+
+
+# # # Candidate pairs # # #
+
+
+def split_name(short_name, first_names, surname):
+    """Return the first names and the surname without particles, folded; without a surname, from the short name."""
+    if not surname:
+        words = [word for word in re.findall(r'\w+', fold_text(short_name)) if not word.isdigit()]
+        # The last word and the particles before it
+        start = len(words) - 1
+        while start > 0 and words[start - 1] in PARTICLES:
+            start -= 1
+        first_names, surname = ' '.join(words[:max(start, 0)]), ' '.join(words[max(start, 0):])
+    return fold_names(first_names, surname)
+
+
+@cache
+def fold_names(first_names, surname):
+    surname_words = [word for word in re.findall(r'\w+', fold_text(surname)) if word not in PARTICLES]
+    return normalize_spelling(first_names), normalize_spelling(*surname_words)
+
+
+def phonetic_key(name):
+    letters = [letter for letter in name.translate(SOUNDS) if letter.isalpha()]
+    if not letters:
+        return ''
+    return re.sub(r'(.)\1+', r'\1', letters[0] + ''.join(letter for letter in letters[1:] if letter not in SILENT))
+
+
+def signature(text):
+    """The bigrams of the text as bits in a row of SIGNATURE_WORDS unsigned integers."""
+    bits = 0
+    for i in range(len(text) - 1):
+        bits |= 1 << zlib.crc32(text[i:i + 2].encode()) % (64 * SIGNATURE_WORDS)
+    return [bits >> (64 * word) & (2 ** 64 - 1) for word in range(SIGNATURE_WORDS)]
+
+
+def similarity(signatures, left, right):
+    """The Jaccard similarity of the bigrams of the pairs of rows `left` and `right` of `signatures`."""
+    a, b = signatures[left], signatures[right]
+    shared = np.bitwise_count(a & b).sum(axis=1)
+    total = np.bitwise_count(a | b).sum(axis=1)
+    return shared / np.maximum(total, 1)
+
+
+def middle_year(earliest, latest):
+    return np.nan if earliest is None or latest is None else (earliest.year + latest.year) / 2
+
+
+def load_persons():
+    """Return the pks of the persons and arrays of their names and years, see candidate_pairs()."""
+    clients = set(Collection.objects.values_list('client_id', flat=True))
+    pks, keys, initials, abbreviated, first_signatures, surname_signatures, births, deaths = ([] for _ in range(8))
+    for pk, short_name, first_names, surname, *dates in Person.objects.order_by('pk').values_list(
+            'pk', 'short_name', 'first_names', 'surname', 'birth_earliest', 'birth_latest', 'death_earliest',
+            'death_latest').iterator(chunk_size=10_000):
+        first_names, surname = split_name(short_name, first_names, surname)
+        pks.append(pk)
+        keys.append(phonetic_key(surname))
+        initials.append(first_names[:1])
+        abbreviated.append(all(len(word) == 1 for word in first_names.split()))
+        first_signatures.append(signature(first_names))
+        surname_signatures.append(signature(surname.translate(SOUNDS)))
+        births.append(middle_year(*dates[:2]))
+        deaths.append(middle_year(*dates[2:]))
+    return {
+        'pks': np.array(pks, dtype=np.int64),
+        'keys': keys,
+        'initials': initials,
+        'abbreviated': np.array(abbreviated, dtype=bool),
+        'clients': np.isin(np.array(pks, dtype=np.int64), list(clients)),
+        'first_signatures': np.array(first_signatures, dtype=np.uint64).reshape(-1, SIGNATURE_WORDS),
+        'surname_signatures': np.array(surname_signatures, dtype=np.uint64).reshape(-1, SIGNATURE_WORDS),
+        'births': np.array(births, dtype=np.float64),
+        'deaths': np.array(deaths, dtype=np.float64),
+    }
+
+
+def block_members(keys, initials):
+    """Return arrays (block, person) of the members of the blocks; a person without first names is in every block
+    of their surname."""
+    initials_by_key = defaultdict(set)
+    for key, initial in zip(keys, initials):
+        if key and initial:
+            initials_by_key[key].add(initial)
+    blocks, members = {}, []
+    for person, (key, initial) in enumerate(zip(keys, initials)):
+        if not key:
+            continue
+        for block_initial in [initial] if initial else sorted(initials_by_key[key]) or ['']:
+            members.append((blocks.setdefault((key, block_initial), len(blocks)), person))
+    return np.array(members, dtype=np.int64).reshape(-1, 2).T
+
+
+def block_pairs(blocks, members, births, years):
+    """Return arrays (left, right) of the persons of the same block who were born at most `years` apart, or of whom
+    one has no date of birth."""
+    pairs = []
+    # Sorted by block and year of birth, the persons to compare follow each other
+    known = ~np.isnan(births[members])
+    order = np.lexsort((births[members[known]], blocks[known]))
+    sorted_blocks, sorted_members = blocks[known][order], members[known][order]
+    sorted_births = births[sorted_members]
+    offset = 1
+    while offset < len(sorted_members):
+        close = ((sorted_blocks[offset:] == sorted_blocks[:-offset])
+                 & (sorted_births[offset:] - sorted_births[:-offset] <= years))
+        if not close.any():
+            break
+        pairs.append((sorted_members[:-offset][close], sorted_members[offset:][close]))
+        offset += 1
+    # Persons without a date of birth against their whole block
+    order = np.argsort(blocks, kind='stable')
+    sorted_blocks, sorted_members = blocks[order], members[order]
+    unknown = np.isnan(births[sorted_members])
+    starts = np.searchsorted(sorted_blocks, sorted_blocks[unknown], side='left')
+    counts = np.searchsorted(sorted_blocks, sorted_blocks[unknown], side='right') - starts
+    positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    pairs.append((np.repeat(sorted_members[unknown], counts), sorted_members[positions]))
+    left = np.concatenate([pair[0] for pair in pairs])
+    right = np.concatenate([pair[1] for pair in pairs])
+    # Each pair once, as one number
+    size = len(births)
+    pairs = np.sort((np.minimum(left, right) * size + np.maximum(left, right))[left != right])
+    pairs = pairs[np.concatenate([[True], pairs[1:] != pairs[:-1]])] if len(pairs) else pairs
+    return pairs // size, pairs % size
+
+
+def candidate_pairs(years=YEARS, cutoff=SCORE_CUTOFF):
+    """Return (pk, pk of a possible duplicate, score) tuples, best first; the first pk is the lower one."""
+    persons = load_persons()
+    left, right = block_pairs(*block_members(persons['keys'], persons['initials']), persons['births'], years)
+    deaths = persons['deaths']
+    possible = ~(np.abs(deaths[left] - deaths[right]) > years) & ~(persons['clients'][left]
+                                                                  & persons['clients'][right])
+    left, right = left[possible], right[possible]
+    first_names = np.where(persons['abbreviated'][left] | persons['abbreviated'][right], 1.0,
+                           similarity(persons['first_signatures'], left, right))
+    scores = (SURNAME_WEIGHT * similarity(persons['surname_signatures'], left, right)
+              + (1 - SURNAME_WEIGHT) * first_names)
+    selected = scores >= cutoff
+    left, right, scores = left[selected], right[selected], scores[selected]
+    order = np.lexsort((right, left, -scores))
+    pks = persons['pks']
+    return list(zip(pks[left[order]].tolist(), pks[right[order]].tolist(), np.round(scores[order], 3).tolist()))
+
+
+# # # Merging # # #
+
+
+def merge_groups(pairs):
+    """Return {duplicate pk: pk of the person to keep} for pairs of duplicates; every group of persons linked by pairs
+    is merged into its lowest pk."""
+    parents = {}
+
+    def root(pk):
+        while parents.setdefault(pk, pk) != pk:
+            parents[pk] = parents[parents[pk]]
+            pk = parents[pk]
+        return pk
+
+    for pk, other in pairs:
+        first, second = sorted([root(pk), root(other)])
+        parents[second] = first
+    return {pk: root(pk) for pk in parents if root(pk) != pk}
+
+
+def move_rows(model, field, mapping, batch_size):
+    """Point the `field` of the rows of the model from the duplicates to the kept persons, and return how many."""
+    moved = 0
+    for batch in batched(mapping.items(), batch_size):
+        moved += model.objects.filter(**{f'{field}__in': [pk for pk, _ in batch]}).update(**{field: Case(
+            *[When(**{field: pk}, then=Value(target)) for pk, target in batch])})
+    return moved
+
+
+def delete_repeated(model, fields, person_ids, batch_size):
+    """Delete the rows of the persons that repeat an earlier row of the same person."""
+    seen, repeated = set(), []
+    for batch in batched(sorted(person_ids), batch_size):
+        for pk, *key in model.objects.filter(person__in=batch).order_by('pk').values_list('pk', 'person', *fields):
+            if tuple(key) in seen:
+                repeated.append(pk)
+            seen.add(tuple(key))
+    for batch in batched(repeated, batch_size):
+        rows = model.objects.filter(pk__in=batch)
+        rows._raw_delete(rows.db)
+
+
+def merge_relations(mapping, batch_size):
+    """Merge the relations of the duplicates into those of the kept persons, and return the number of relations."""
+    through_model = PersonPersonRelation.types.through
+    relations = {}
+    for batch in batched(mapping, batch_size):
+        relations.update((pk, (from_id, to_id)) for pk, from_id, to_id in PersonPersonRelation.objects.filter(
+            Q(from_person__in=batch) | Q(to_person__in=batch)).values_list('pk', 'from_person', 'to_person'))
+    types = defaultdict(set)
+    for batch in batched(relations, batch_size):
+        for relation_id, type_id in through_model.objects.filter(personpersonrelation__in=batch).values_list(
+                'personpersonrelation', 'relationtype'):
+            types[relation_id].add(type_id)
+
+    # The relations of the duplicates as relations of the kept persons; those between a person and their duplicate
+    # are dropped
+    merged = defaultdict(list)
+    for pk, (from_id, to_id) in sorted(relations.items()):
+        pair = (mapping.get(from_id, from_id), mapping.get(to_id, to_id))
+        if pair[0] != pair[1]:
+            merged[pair].append(pk)
+    # A pair keeps the relation the kept persons already had, or else the first relation of a duplicate; every pair
+    # of this transaction had a duplicate, so the relations of the kept persons are not among them
+    kept = existing_relation_ids(set(merged), batch_size)
+    kept.update((pair, pks[0]) for pair, pks in merged.items() if pair not in kept)
+    wanted_types = {(kept[pair], type_id) for pair, pks in merged.items() for pk in pks for type_id in types[pk]}
+    deleted = sorted(set(relations) - set(kept.values()))
+    for batch in batched(deleted, batch_size):
+        through_rows = through_model.objects.filter(personpersonrelation__in=batch)
+        through_rows._raw_delete(through_rows.db)
+        rows = PersonPersonRelation.objects.filter(pk__in=batch)
+        rows._raw_delete(rows.db)
+    PersonPersonRelation.objects.bulk_update(
+        [PersonPersonRelation(pk=kept[pair], from_person_id=pair[0], to_person_id=pair[1])
+         for pair, pks in merged.items() if kept[pair] in relations], ['from_person', 'to_person'],
+        batch_size=batch_size)
+    through_model.objects.bulk_create([through_model(personpersonrelation_id=relation_id, relationtype_id=type_id)
+                                       for relation_id, type_id in wanted_types], ignore_conflicts=True,
+                                      batch_size=batch_size)
+    return len(relations)
+
+
+def fill_in(mapping, batch_size):
+    """Fill in the empty fields of the kept persons from their duplicates, the first duplicate first."""
+    persons = Person.objects.in_bulk(set(mapping) | set(mapping.values()))
+    changed = {}
+    for pk in sorted(mapping):
+        target = persons[mapping[pk]]
+        for field in FILLED_FIELDS:
+            if not getattr(target, field) and getattr(persons[pk], field):
+                setattr(target, field, getattr(persons[pk], field))
+                changed[target.pk] = target
+    for person in changed.values():
+        person.parse_dates()
+        person.search_name = normalize_name(*person.get_search_names())[:1024]
+    Person.objects.bulk_update(changed.values(), [*FILLED_FIELDS, *Person.date_fields, 'search_name'],
+                               batch_size=batch_size)
+    for batch in batched(changed, batch_size):
+        update_search_vectors(Person.objects.filter(pk__in=batch))
+
+
+def log_merged(duplicates, mapping):
+    """
+    Record the deletion of the duplicates in the audit log, with the pk of the person each was merged into; the raw
+    delete sends no post_delete signal for django-easy-audit.
+    """
+    user = get_current_user()
+    user_pk = getattr(user, 'pk', None)
+    content_type = ContentType.objects.get_for_model(Person)
+    CRUDEvent.objects.bulk_create([CRUDEvent(
+        event_type=CRUDEvent.DELETE,
+        object_id=str(person.pk),
+        content_type=content_type,
+        object_repr=str(person),
+        object_json_repr=serializers.serialize('json', [person]),
+        changed_fields=json.dumps({'merged_into': mapping[person.pk]}),
+        user_id=user_pk,
+        user_pk_as_string='' if user_pk is None else str(user_pk),
+    ) for person in duplicates])
+
+
+def merge_persons(mapping, batch_size=500):
+    """Merge the persons into others, by a mapping {duplicate pk: pk of the person to keep}."""
+    mapping = dict(mapping)
+    if set(mapping) & set(mapping.values()):
+        raise MergeError("A person cannot both be kept and merged into another")
+    persons, client_ids = set(), []
+    for batch in batched(sorted(set(mapping) | set(mapping.values())), batch_size):
+        persons.update(Person.objects.filter(pk__in=batch).values_list('pk', flat=True))
+        client_ids += Collection.objects.filter(client__in=batch).values_list('client_id', flat=True)
+    if unknown := (set(mapping) | set(mapping.values())) - persons:
+        raise MergeError(f"Unknown persons: {sorted(unknown)}")
+    clients = defaultdict(list)
+    for client_id in client_ids:
+        clients[mapping.get(client_id, client_id)].append(client_id)
+    for target, group_clients in clients.items():
+        if len(group_clients) > 1:
+            raise MergeError(f"Persons {', '.join(map(str, sorted(group_clients)))} each have a collection")
+    moved_clients = {(client_id, target) for target, (client_id,) in clients.items() if client_id != target}
+
+    with transaction.atomic():
+        fill_in(mapping, batch_size)
+        moved = 0
+        for model, fields in PERSON_ROWS.items():
+            moved += move_rows(model, 'person', mapping, batch_size)
+            delete_repeated(model, fields, set(mapping.values()), batch_size)
+        moved += merge_relations(mapping, batch_size)
+        moved += move_rows(Collection, 'client', mapping, batch_size)
+        move_rows(LedgerEntry, 'client', mapping, batch_size)
+        LedgerEntry.objects.filter(client__in=[target for _, target in moved_clients]).update(
+            client_name=Subquery(Person.objects.filter(pk=OuterRef('client')).values('short_name')))
+        for batch in batched(mapping, batch_size):
+            duplicates = Person.objects.filter(pk__in=batch)
+            log_merged(duplicates, mapping)
+            duplicates._raw_delete(duplicates.db)
+
+    # The updates send no signals, so the cached and derived data is updated here
+    bump_version(Person, PersonPersonRelation, PersonPersonRelation.types.through, *PERSON_ROWS, Collection,
+                 LedgerEntry)
+    update_price_aggregates({(PriceAggregate.Dimension.CLIENT, pk) for pair in moved_clients for pk in pair},
+                            MAX_ITEMS)
+    decades = set()
+    for batch in batched(sorted(set(mapping.values())), batch_size):
+        decades |= residence_decades(PeriodOfResidence.objects.filter(person__in=batch))
+    update_residence_clusters(decades)
+    return MergeResult(len(mapping), moved)
@@ -0,0 +1,138 @@
+"""
+Filling in countries, places, addresses and persons from a local Wikidata JSON dump.
+
+Only empty values are filled in, the transcribed and edited data is kept: the names of countries and places in the
+languages of the site from the labels of their entity, the coordinates of countries, places and addresses from its
+coordinate location (P625), and the dates of birth and death of persons from P569 and P570, as texts that
+luchtmans.dates parses. An entity is found by the wikidata_id of the objects, which may also be a link to the entity.
+
+A dump holds some hundred million entities in tens of gigabytes, and is never held in memory. It is decompressed and
+read line by line in this process, which only keeps the lines with the id of an entity that the database refers to;
+those are parsed as JSON in a pool of processes, batch_size lines at a time, while the next batch is read. Memory use
+is bounded by two batches and the set of ids in the database, however large the dump.
+"""
+import multiprocessing
+import re
+from collections import defaultdict
+from functools import partial
+from itertools import batched
+
+from django.conf import settings
+
+from luchtmans.autocomplete import normalize_name
+from luchtmans.cache import bump_version
+from luchtmans.clusters import update_residence_clusters
+from luchtmans.geo import geohash
+from luchtmans.geocoding import RESIDENCE_PATHS, located_residence_decades, to_decimal
+from luchtmans.models import Country, Place, Address, Person, GeoLocation, SearchNameModel
+from luchtmans.wikidata import entity_lines, open_dump, parse_entity
+
+ENRICHED_MODELS = [Country, Place, Address, Person]
+# The translated name fields that labels fill in, see luchtmans.translation
+LABEL_FIELDS = {
+    Country: 'name',
+    Place: 'name',
+}
+ENTITY_ID = re.compile(r'Q\d+')
+
+
+def entity_id(value):
+    """The id of the entity in a wikidata_id, like 'Q43631' or 'https://www.wikidata.org/wiki/Q43631', or None."""
+    ids = ENTITY_ID.findall(value.upper())
+    return ids[-1] if ids else None
+
+
+def wanted_ids(models):
+    """Return {entity id: [(model, pk), ...]} for the objects of the models that have a wikidata_id."""
+    wanted = defaultdict(list)
+    for model in models:
+        for pk, value in model.objects.exclude(wikidata_id='').values_list('pk', 'wikidata_id').iterator():
+            if key := entity_id(value):
+                wanted[key].append((model, pk))
+    return wanted
+
+
+def parse_batches(batches, parse, processes=None):
+    """Yield the parsed lines of the batches, in a pool of `processes` processes, or in this one if that is 1."""
+    if processes == 1:
+        yield from ([parse(line) for line in batch] for batch in batches)
+        return
+    with multiprocessing.Pool(processes) as pool:
+        pending = None
+        for batch in batches:
+            result = pool.map_async(parse, batch)
+            if pending is not None:
+                yield pending.get()
+            pending = result
+        if pending is not None:
+            yield pending.get()
+
+
+def fill_in(obj, entity, languages):
+    """Fill in the empty fields of the object from the parsed entity, and return the names of the changed fields."""
+    fields = []
+    if type(obj) in LABEL_FIELDS:
+        for language in languages:
+            field = f'{LABEL_FIELDS[type(obj)]}_{language}'
+            if entity['labels'][language] and not getattr(obj, field):
+                setattr(obj, field, entity['labels'][language])
+                fields.append(field)
+        if fields and isinstance(obj, SearchNameModel):
+            obj.search_name = normalize_name(*obj.get_search_names())[:1024]
+            fields.append('search_name')
+    if isinstance(obj, GeoLocation) and obj.latitude is None and entity['coordinates']:
+        obj.latitude, obj.longitude = (to_decimal(value) for value in entity['coordinates'])
+        obj.geohash = geohash(obj.latitude, obj.longitude)
+        fields += ['latitude', 'longitude', 'geohash']
+    if isinstance(obj, Person):
+        dates = [(field, entity[key]) for field, key in [('date_of_birth', 'birth'), ('date_of_death', 'death')]
+                 if entity[key] and not getattr(obj, field)]
+        for field, value in dates:
+            setattr(obj, field, value)
+            fields.append(field)
+        if dates:
+            obj.parse_dates()
+            fields += obj.date_fields
+    return fields
+
+
+def enrich(entities, wanted, languages):
+    """Fill in the objects that refer to the parsed entities, and return {model: [pk of a changed object, ...]}."""
+    entities_by_pk = defaultdict(dict)
+    for entity in entities:
+        for model, pk in wanted[entity['id']]:
+            entities_by_pk[model][pk] = entity
+    changed = {}
+    for model, model_entities in entities_by_pk.items():
+        objects, fields = [], set()
+        for obj in model.objects.filter(pk__in=model_entities):
+            if obj_fields := fill_in(obj, model_entities[obj.pk], languages):
+                objects.append(obj)
+                fields.update(obj_fields)
+        if objects:
+            model.objects.bulk_update(objects, sorted(fields))
+            changed[model] = [obj.pk for obj in objects]
+    return changed
+
+
+def enrich_from(path, processes=None, batch_size=500, log=print):
+    """Fill in the objects that refer to entities in a Wikidata dump, and update the clusters of their residences."""
+    wanted = wanted_ids(ENRICHED_MODELS)
+    languages = [language for language, _ in settings.LANGUAGES]
+    found = 0
+    changed = defaultdict(list)
+    with open_dump(path) as file:
+        batches = batched(entity_lines(file, wanted), batch_size)
+        for entities in parse_batches(batches, partial(parse_entity, languages=languages), processes):
+            found += len(entities)
+            for model, pks in enrich(entities, wanted, languages).items():
+                changed[model] += pks
+    log(f"Found {found} of {len(wanted)} entities in the dump")
+    for model in ENRICHED_MODELS:
+        log(f"Filled in {len(changed[model])} {model._meta.verbose_name_plural}")
+    decades = set()
+    for model in RESIDENCE_PATHS:
+        decades |= located_residence_decades(model, changed[model])
+    # bulk_update sends no signals, so the cached data has to be invalidated here
+    bump_version(*[model for model in ENRICHED_MODELS if changed[model]])
+    update_residence_clusters(decades)
@@ -0,0 +1,166 @@
+"""
+The denormalized ledger lines of LedgerEntry, one per item.
+
+Migration 0020 fills the table for the existing items, the build_ledger_entries command rebuilds it from scratch.
+Between builds the receivers below collect the items whose entry changed: saved items, items whose editions, bindings
+or languages changed, and the items of saved collections, clients, pages, editions and works, whose labels the entries
+copy. Their entries are rewritten after commit with one upsert per batch; deleting an item deletes its entry.
+"""
+from collections import defaultdict
+from functools import partial
+from itertools import batched
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+
+from luchtmans.bulk import delete_all
+from luchtmans.cache import bump_version, lookup_choices
+from luchtmans.models import Person, Work, Edition, Collection, Page, Binding, Language, Item, LedgerEntry
+
+# The LedgerEntry fields copied from the item and the objects it refers to
+ITEM_FIELDS = {
+    'item_id': 'pk',
+    'collection_id': 'collection_id',
+    'collection_title': 'collection__short_title',
+    'client_id': 'collection__client_id',
+    'client_name': 'collection__client__short_name',
+    'volume': 'page__volume',
+    'folio': 'page__folio',
+    'recto_verso': 'page__recto_verso',
+    'type_id': 'type_id',
+    **{name: name for name in ['transcription_full', 'non_book', 'transcription_incomplete', 'date', 'date_paid',
+                               'edition_uncertain', 'volumes', 'number_of_copies', 'price', 'price_decimal', 'notes',
+                               'work_in_progress']},
+}
+# The list fields, per many-to-many field of Item
+LIST_FIELDS = [
+    ('editions', {'edition_ids': 'edition_id', 'edition_titles': 'edition__short_title',
+                  'work_titles': 'edition__work__title'}),
+    ('binding', {'binding_ids': 'binding_id'}),
+    ('languages', {'language_ids': 'language_id'}),
+]
+UPDATE_FIELDS = [name for name in ITEM_FIELDS if name != 'item_id'] + [
+    name for _, fields in LIST_FIELDS for name in fields]
+
+# The path from Item to the objects whose labels are copied into the entries
+LABEL_PATHS = {
+    Collection: 'collection',
+    Person: 'collection__client',
+    Page: 'page',
+    Edition: 'editions',
+    Work: 'editions__work',
+}
+
+
+def make_entries(items, entry_model=LedgerEntry):
+    """
+    Return the LedgerEntry objects of the `items` queryset, in four queries. Migrations pass a queryset and
+    entry_model of their historical models.
+    """
+    lists = defaultdict(lambda: defaultdict(list))
+    for field, fields in LIST_FIELDS:
+        through_model = getattr(items.model, field).through
+        for item_id, *values in through_model.objects.filter(item__in=items.values('pk')).order_by('pk').values_list(
+                'item_id', *fields.values()):
+            for name, value in zip(fields, values):
+                lists[item_id][name].append(value)
+    return [entry_model(**dict(zip(ITEM_FIELDS, row)), **lists[row[0]])
+            for row in items.order_by('pk').values_list(*ITEM_FIELDS.values())]
+
+
+def build_ledger_entries(batch_size=10_000, log=print):
+    """Rebuild LedgerEntry from the items."""
+    count = 0
+    with transaction.atomic():
+        delete_all(LedgerEntry)
+        for batch in batched(Item.objects.order_by('pk').values_list('pk', flat=True).iterator(batch_size),
+                             batch_size):
+            items = Item.objects.filter(pk__range=(batch[0], batch[-1]))
+            count += len(LedgerEntry.objects.bulk_create(make_entries(items)))
+    bump_version(LedgerEntry)
+    log(f"Created {count} ledger entries")
+
+
+def update_ledger_entries(item_ids, batch_size=1000):
+    """Rewrite the entries of the items."""
+    for batch in batched(sorted(item_ids), batch_size):
+        LedgerEntry.objects.bulk_create(make_entries(Item.objects.filter(pk__in=batch)), update_conflicts=True,
+                                        unique_fields=['item'], update_fields=UPDATE_FIELDS)
+    bump_version(LedgerEntry)
+
+
+def ledger_entry(item):
+    """The entry of the item, or None if it was not created yet."""
+    return getattr(item, 'ledger_entry', None)
+
+
+def lookup_labels(model, ids):
+    """The translated names of the item types, bindings or languages with the ids, from the cached lookup table."""
+    labels = dict(lookup_choices(model))
+    return [labels[pk] for pk in ids if pk in labels]
+
+
+# # # Signal receivers, connected in LuchtmansConfig.ready() # # #
+
+# The receivers pass the items, or the objects whose items have to be looked up, to a callback of their transaction,
+# which updates the entries of those items after commit; a transaction that is rolled back updates nothing.
+
+def update_changed(item_ids, labels):
+    paths = defaultdict(list)
+    for path, pk in labels:
+        paths[path].append(pk)
+    for path, pks in paths.items():
+        for batch in batched(pks, 1000):
+            item_ids.update(Item.objects.filter(**{f'{path}__in': batch}).values_list('pk', flat=True))
+    if item_ids:
+        update_ledger_entries(item_ids)
+
+
+def schedule_update(item_ids=(), labels=()):
+    item_ids, labels = set(item_ids), set(labels)
+    if item_ids or labels:
+        transaction.on_commit(partial(update_changed, item_ids, labels))
+
+
+def item_saved(sender, instance, **kwargs):
+    schedule_update([instance.pk])
+
+
+def label_saved(sender, instance, created, **kwargs):
+    # New objects have no items yet
+    if not created:
+        schedule_update(labels=[(LABEL_PATHS[sender], instance.pk)])
+
+
+def related_deleting(sender, instance, **kwargs):
+    """The many-to-many rows of a deleted edition, binding or language are deleted without m2m_changed signals."""
+    field = Item._meta.get_field({Edition: 'editions', Binding: 'binding', Language: 'languages'}[sender])
+    schedule_update(field.remote_field.through.objects.filter(**{sender._meta.model_name: instance.pk}).values_list(
+        'item_id', flat=True))
+
+
+def item_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """`instance` is an item and `pk_set` holds editions, bindings or languages, or with reverse, the reverse."""
+    if not reverse:
+        if action.startswith('post_'):
+            schedule_update([instance.pk])
+    elif action == 'pre_clear':
+        instance._cleared_item_ids = list(sender.objects.filter(**{type(instance)._meta.model_name: instance.pk})
+                                          .values_list('item_id', flat=True))
+    elif action == 'post_clear':
+        schedule_update(instance.__dict__.pop('_cleared_item_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        schedule_update(pk_set)
+
+
+def connect_signals():
+    post_save.connect(item_saved, sender=Item, dispatch_uid='luchtmans_entries_post_save_Item')
+    for model in LABEL_PATHS:
+        post_save.connect(label_saved, sender=model, dispatch_uid=f'luchtmans_entries_post_save_{model.__name__}')
+    for model in [Edition, Binding, Language]:
+        pre_delete.connect(related_deleting, sender=model,
+                           dispatch_uid=f'luchtmans_entries_pre_delete_{model.__name__}')
+    for field, _ in LIST_FIELDS:
+        through_model = getattr(Item, field).through
+        m2m_changed.connect(item_relations_changed, sender=through_model,
+                            dispatch_uid=f'luchtmans_entries_m2m_changed_{through_model.__name__}')
@@ -0,0 +1,303 @@
+"""
+Streaming exports of the ledger and the prosopography as CSV, JSON Lines or Parquet.
+
+Every table is read with QuerySet.iterator(chunk_size) over values_list() rows, the many-to-many columns are fetched
+per chunk, and the file is written chunk by chunk: memory use does not grow with the number of rows. Items are read
+from the denormalized ledger entries (see luchtmans.entries), the other tables from their models. In CSV files lists
+are separated by semicolons, like the import_ledger command expects; JSON Lines and Parquet keep them as lists.
+Parquet needs the optional pyarrow package and is written as one row group per chunk.
+"""
+import csv
+import json
+from collections import defaultdict
+from itertools import batched
+
+from django.db.models import Q
+
+from luchtmans.cache import lookup_choices
+from luchtmans.models import (Place, Person, PersonPersonRelation, RelationType, Religion, Language, STCNGenre, Edition,
+                              PersonEditionRelationRole, PersonEditionRelation, ItemType, Binding, Item, LedgerEntry)
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/jsonl',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+class Table:
+    """
+    An exportable table of `model` rows. `columns` maps the column names to a (path, type) or (path, type, labels)
+    tuple. The path is a values_list() path or the name of a many-to-many field of the model, which gives the list of
+    related ids. With a lookup model as `labels`, ids are replaced by the cached labels of that model (see
+    luchtmans.cache.lookup_choices). Types are int, str, bool, date, decimal, int_list and str_list. `collection` and
+    `years` return the filter of the rows for a list of collection ids and for a (start, end) pair of years.
+    """
+
+    def __init__(self, model, columns, collection, years):
+        self.model = model
+        self.columns = {name: (path, type, labels[0] if labels else None)
+                        for name, (path, type, *labels) in columns.items()}
+        self.collection = collection
+        self.years = years
+
+    def queryset(self, collections=None, years=None):
+        queryset = self.model.objects.order_by('pk')
+        if collections is not None:
+            queryset = queryset.filter(self.collection(collections))
+        if years is not None:
+            queryset = queryset.filter(self.years(years))
+        return queryset
+
+    def many_to_many(self, name):
+        field = self.model._meta.get_field(name)
+        return field if field.many_to_many else None
+
+    def related_ids(self, field, pks):
+        """The ids related to the objects with `pks` through a many-to-many field, per object."""
+        ids = defaultdict(list)
+        through = field.remote_field.through
+        for pk, related_id in through.objects.filter(**{f'{field.m2m_field_name()}__in': pks}).order_by(
+                'pk').values_list(field.m2m_field_name(), field.m2m_reverse_field_name()):
+            ids[pk].append(related_id)
+        return ids
+
+    def rows(self, queryset, chunk_size):
+        """
+        Yield lists of at most `chunk_size` rows, each a list of values in the order of the columns. Rows are read
+        with values_list(), and the many-to-many columns with one query per column per chunk.
+        """
+        fields = [self.many_to_many(path) if '__' not in path else None for path, _, _ in self.columns.values()]
+        paths = ['pk'] + [path for (path, _, _), field in zip(self.columns.values(), fields) if field is None]
+        for chunk in batched(queryset.values_list(*paths).iterator(chunk_size=chunk_size), chunk_size):
+            pks = [row[0] for row in chunk]
+            columns = iter(list(zip(*chunk))[1:])
+            values = []
+            for (_, _, labels), field in zip(self.columns.values(), fields):
+                if field is None:
+                    column = next(columns)
+                else:
+                    ids = self.related_ids(field, pks)
+                    column = [ids[pk] for pk in pks]
+                if labels:
+                    labels = dict(lookup_choices(labels))
+                    column = [[labels[pk] for pk in value if pk in labels] if isinstance(value, list)
+                              else labels.get(value) for value in column]
+                values.append(column)
+            yield [list(row) for row in zip(*values)]
+
+
+def bought_editions(collections):
+    return Item.editions.through.objects.filter(item__collection__in=collections).values('edition')
+
+
+def published_editions(years):
+    return Edition.objects.overlapping(*years).values('pk')
+
+
+def alive_persons(years):
+    return Person.objects.alive_in(*years).values('pk')
+
+
+TABLES = {
+    'items': Table(LedgerEntry, {
+        'id': ('item_id', 'int'),
+        'collection_id': ('collection_id', 'int'),
+        'collection': ('collection_title', 'str'),
+        'client_id': ('client_id', 'int'),
+        'client': ('client_name', 'str'),
+        'volume': ('volume', 'int'),
+        'folio': ('folio', 'str'),
+        'recto_verso': ('recto_verso', 'str'),
+        'type': ('type_id', 'str', ItemType),
+        'transcription_full': ('transcription_full', 'str'),
+        'editions': ('edition_ids', 'int_list'),
+        'edition_titles': ('edition_titles', 'str_list'),
+        'work_titles': ('work_titles', 'str_list'),
+        'bindings': ('binding_ids', 'str_list', Binding),
+        'languages': ('language_ids', 'str_list', Language),
+        'non_book': ('non_book', 'bool'),
+        'transcription_incomplete': ('transcription_incomplete', 'bool'),
+        'edition_uncertain': ('edition_uncertain', 'bool'),
+        'work_in_progress': ('work_in_progress', 'bool'),
+        'date': ('date', 'date'),
+        'date_paid': ('date_paid', 'date'),
+        'volumes': ('volumes', 'str'),
+        'number_of_copies': ('number_of_copies', 'str'),
+        'price': ('price', 'str'),
+        'price_decimal': ('price_decimal', 'decimal'),
+        'notes': ('notes', 'str'),
+    }, collection=lambda collections: Q(collection__in=collections),
+        years=lambda years: Q(date__year__range=years)),
+    'editions': Table(Edition, {
+        'id': ('id', 'int'),
+        'stcn_id': ('stcn_id', 'str'),
+        'short_title': ('short_title', 'str'),
+        'title': ('title', 'str'),
+        'work_id': ('work_id', 'int'),
+        'work': ('work__title', 'str'),
+        'edition_uncertain': ('edition_uncertain', 'bool'),
+        'year_of_publication_start': ('year_of_publication_start', 'int'),
+        'year_of_publication_end': ('year_of_publication_end', 'int'),
+        'places_of_publication': ('places_of_publication', 'str_list', Place),
+        'languages': ('languages', 'str_list', Language),
+        'stcn_genres': ('stcn_genres', 'str_list', STCNGenre),
+        'volumes': ('volumes', 'str'),
+        'notes': ('notes', 'str'),
+    }, collection=lambda collections: Q(pk__in=bought_editions(collections)),
+        years=lambda years: Q(pk__in=published_editions(years))),
+    'persons': Table(Person, {
+        'id': ('id', 'int'),
+        'short_name': ('short_name', 'str'),
+        'surname': ('surname', 'str'),
+        'first_names': ('first_names', 'str'),
+        'sex': ('sex', 'str'),
+        'date_of_birth': ('date_of_birth', 'str'),
+        'date_of_death': ('date_of_death', 'str'),
+        'alive_from': ('alive_from', 'date'),
+        'alive_until': ('alive_until', 'date'),
+        'place_of_birth': ('place_of_birth_id', 'str', Place),
+        'place_of_death': ('place_of_death_id', 'str', Place),
+        'religious_affiliations': ('religious_affiliation', 'str_list', Religion),
+        'wikidata_id': ('wikidata_id', 'str'),
+        'notes': ('notes', 'str'),
+    }, collection=lambda collections: Q(collection__in=collections),
+        years=lambda years: Q(pk__in=alive_persons(years))),
+    'person_relations': Table(PersonPersonRelation, {
+        'id': ('id', 'int'),
+        'from_person_id': ('from_person_id', 'int'),
+        'from_person': ('from_person__short_name', 'str'),
+        'types': ('types', 'str_list', RelationType),
+        'to_person_id': ('to_person_id', 'int'),
+        'to_person': ('to_person__short_name', 'str'),
+    }, collection=lambda collections: Q(from_person__collection__in=collections),
+        years=lambda years: Q(from_person__in=alive_persons(years), to_person__in=alive_persons(years))),
+    'person_editions': Table(PersonEditionRelation, {
+        'id': ('id', 'int'),
+        'person_id': ('person_id', 'int'),
+        'person': ('person__short_name', 'str'),
+        'role': ('role_id', 'str', PersonEditionRelationRole),
+        'edition_id': ('edition_id', 'int'),
+        'edition': ('edition__short_title', 'str'),
+    }, collection=lambda collections: Q(edition__in=bought_editions(collections)),
+        years=lambda years: Q(edition__in=published_editions(years))),
+}
+
+
+# # # Writers, which yield the file in chunks of bytes # # #
+
+
+class Buffer:
+    """A file-like object that keeps what is written until it is taken."""
+    closed = False
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+class Text:
+    """Encode what csv.writer writes into a Buffer as UTF-8."""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def write(self, text):
+        return self.buffer.write(text.encode())
+
+
+def csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, list):
+        return '; '.join(str(element) for element in value)
+    return value
+
+
+def write_csv(table, chunks):
+    lines = Buffer()
+    writer = csv.writer(Text(lines))
+    writer.writerow(table.columns)
+    # The header also when nothing matches
+    yield lines.take()
+    for chunk in chunks:
+        writer.writerows([csv_value(value) for value in row] for row in chunk)
+        yield lines.take()
+
+
+def write_jsonl(table, chunks):
+    columns = list(table.columns)
+    for chunk in chunks:
+        yield ''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) + '\n'
+                      for row in chunk).encode()
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def write_parquet(table, chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {
+        'int': pa.int64(), 'str': pa.string(), 'bool': pa.bool_(), 'date': pa.date32(), 'decimal': pa.decimal128(20, 2),
+        'int_list': pa.list_(pa.int64()), 'str_list': pa.list_(pa.string()),
+    }
+    schema = pa.schema([(name, types[type]) for name, (_, type, _) in table.columns.items()])
+    buffer = Buffer()
+    with pq.ParquetWriter(buffer, schema, compression='zstd') as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(zip(*chunk), schema)], schema=schema))
+            yield buffer.take()
+    yield buffer.take()
+
+
+WRITERS = {
+    'csv': write_csv,
+    'jsonl': write_jsonl,
+    'parquet': write_parquet,
+}
+
+
+def export(table_name, format, collections=None, years=None, chunk_size=2000):
+    """
+    Return an iterator over the bytes of the export of a table in a format. Raise ExportError for unknown tables and
+    formats, and for Parquet without pyarrow.
+    """
+    if table_name not in TABLES:
+        raise ExportError(f'Unknown table {table_name!r}, choose from {", ".join(TABLES)}')
+    if format not in WRITERS:
+        raise ExportError(f'Unknown format {format!r}, choose from {", ".join(WRITERS)}')
+    if format == 'parquet' and not parquet_available():
+        raise ExportError('Parquet exports need the pyarrow package, install it with the parquet extra')
+    table = TABLES[table_name]
+    queryset = table.queryset(collections, years)
+    return WRITERS[format](table, table.rows(queryset, chunk_size))
@@ -0,0 +1,122 @@
+"""
+Matching names to the places, streets and houses of a gazetteer, see luchtmans.geocoding.
+
+Names arrive here as keys, already spelling-normalized. A name that is not in the gazetteer is compared with difflib
+to the names that share the most bigrams with it, and matched to the most similar one if that is similar enough.
+Names with different numbers in them, like 'Street 1' and 'Street 2' or '1e Binnenvestgracht' and '2e
+Binnenvestgracht', are never similar.
+
+This module does not import Django, so the processes of the matching pool can import it however they are started.
+"""
+import difflib
+import heapq
+from collections import Counter, defaultdict
+
+# The least difflib ratio of a fuzzy match
+FUZZY_CUTOFF = 0.8
+# The number of names sharing the most bigrams that are compared with difflib
+SHORTLIST = 20
+
+
+def digits(name):
+    return ''.join(character for character in name if character.isdigit())
+
+
+def bigrams(name):
+    return {name[i:i + 2] for i in range(len(name) - 1)} or {name}
+
+
+class Names(dict):
+    """Coordinates by name key, with an index of the bigrams of the names."""
+
+    def __init__(self):
+        super().__init__()
+        self.postings = defaultdict(list)
+        self.numbers = {}
+
+    def add(self, name, coordinates):
+        if name not in self:
+            self[name] = coordinates
+            self.numbers[name] = digits(name)
+            for bigram in bigrams(name):
+                self.postings[bigram].append(name)
+
+    def find(self, names):
+        """The first of the names that is known, or else the known name most like one of them, or None."""
+        names = [name for name in names if name]
+        for name in names:
+            if name in self:
+                return name
+        best, cutoff = None, FUZZY_CUTOFF
+        for name in names:
+            shared = Counter()
+            for bigram in bigrams(name):
+                shared.update(self.postings.get(bigram, ()))
+            number = digits(name)
+            shortlist = heapq.nlargest(SHORTLIST, (candidate for candidate in shared
+                                                   if self.numbers[candidate] == number), key=shared.__getitem__)
+            for candidate in difflib.get_close_matches(name, shortlist, n=1, cutoff=cutoff):
+                best, cutoff = candidate, difflib.SequenceMatcher(None, name, candidate).ratio()
+        return best
+
+
+class Gazetteer:
+    """The (latitude, longitude) of the places, streets and houses of a gazetteer, by name key."""
+
+    def __init__(self):
+        self.wikidata = {}
+        self.places = Names()
+        # Per place name key, '' for streets without a place
+        self.streets = defaultdict(Names)
+        self.street_places = Names()
+        self.houses = {}
+
+    def add_place(self, name, wikidata_id, coordinates):
+        if wikidata_id:
+            self.wikidata[wikidata_id] = coordinates
+        self.places.add(name, coordinates)
+
+    def add_street(self, place, name, house_number, coordinates):
+        if house_number:
+            self.houses[place, name, house_number] = coordinates
+        # A street that is only in the gazetteer with houses is at its first house
+        self.streets[place].add(name, coordinates)
+        self.street_places.add(place, None)
+
+    def match_place(self, wikidata_id, names):
+        """The coordinates of the place with the Wikidata id or one of the names, or None."""
+        if wikidata_id in self.wikidata:
+            return self.wikidata[wikidata_id]
+        name = self.places.find(names)
+        return None if name is None else self.places[name]
+
+    def match_street(self, places, streets):
+        """The (place, street) keys of the first of the streets found in one of the places, or None."""
+        groups = [group for group in dict.fromkeys([self.street_places.find(places), '']) if group in self.streets]
+        for street in streets:
+            for group in groups:
+                name = self.streets[group].find([street])
+                if name is not None:
+                    return group, name
+        return None
+
+    def street_coordinates(self, street, house_number):
+        """The coordinates of the house in a street matched by match_street(), or else of the street."""
+        place, name = street
+        return self.houses.get((place, name, house_number), self.streets[place][name])
+
+
+_gazetteer = None
+
+
+def init_worker(gazetteer):
+    global _gazetteer
+    _gazetteer = gazetteer
+
+
+def match(task):
+    """Match a ('place', wikidata_id, names) or ('street', places, streets) task."""
+    kind, *inputs = task
+    if kind == 'place':
+        return _gazetteer.match_place(*inputs)
+    return _gazetteer.match_street(*inputs)
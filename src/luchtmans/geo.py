@@ -0,0 +1,252 @@
+"""
+Spatial queries on the coordinates of countries, places and addresses, without PostGIS.
+
+Every GeoLocation keeps the geohash of its coordinates in `geohash`: the coordinates as a string of base 32 digits in
+which every digit halves the cell of the digits before it, five times. A cell is a prefix, and the cells of one prefix
+are a range of the strings. The column is indexed together with the coordinates, so a bounding box query reads the
+ranges of the few cells that cover the box from that index and filters the exact box on the coordinates stored next
+to them. A radius query is the bounding box of its circle, filtered on the haversine distance.
+
+Nearest neighbour queries use a KD-tree of the coordinates, kept in memory per model and process by get_index() and
+reloaded when the cache version of the model changes (see luchtmans.cache), like the relation graph of
+luchtmans.graph. The tree holds points on the unit sphere, on which the straight-line distance orders points the same
+way as the distance over the surface.
+
+For example, the addresses within 500 m of the shop, nearest first:
+
+    Address.objects.within_radius(52.1590, 4.4883, 500).order_by('distance')
+"""
+import heapq
+import math
+import threading
+
+import numpy as np
+from django.db import models
+from django.db.models import FloatField, Q, Value
+from django.db.models.functions import ASin, Cast, Cos, Power, Radians, Sin, Sqrt
+
+from luchtmans.cache import get_versions
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Cells of about 5 x 5 m
+GEOHASH_LENGTH = 9
+# The cells that cover a bounding box are the smallest of which at most this many are needed
+MAX_CELLS = 16
+EARTH_RADIUS = 6_371_000
+METERS_PER_DEGREE = EARTH_RADIUS * math.pi / 180
+# Number of points in the leaves of the KD-tree
+LEAF_SIZE = 32
+
+
+def cell_bits(length):
+    """The number of bits of the longitude and the latitude in a geohash of `length` digits."""
+    bits = 5 * length
+    return (bits + 1) // 2, bits // 2
+
+
+def cell_index(latitude, longitude, length):
+    """The column and row of the cell of the coordinates in the grid of geohashes of `length` digits."""
+    longitude_bits, latitude_bits = cell_bits(length)
+    x = min(int((longitude + 180) / 360 * (1 << longitude_bits)), (1 << longitude_bits) - 1)
+    y = min(int((latitude + 90) / 180 * (1 << latitude_bits)), (1 << latitude_bits) - 1)
+    return x, y
+
+
+def encode_cell(x, y, length):
+    """The geohash of a cell; its bits alternate between the longitude and the latitude, starting with longitude."""
+    longitude_bits, latitude_bits = cell_bits(length)
+    value = 0
+    for bit in range(5 * length):
+        if bit % 2 == 0:
+            longitude_bits -= 1
+            value = value << 1 | (x >> longitude_bits) & 1
+        else:
+            latitude_bits -= 1
+            value = value << 1 | (y >> latitude_bits) & 1
+    return ''.join(GEOHASH_ALPHABET[value >> shift & 31] for shift in range(5 * length - 5, -1, -5))
+
+
+def geohash(latitude, longitude, length=GEOHASH_LENGTH):
+    """The geohash of the coordinates, or '' without coordinates."""
+    if latitude is None or longitude is None:
+        return ''
+    return encode_cell(*cell_index(float(latitude), float(longitude), length), length)
+
+
+def next_prefix(prefix):
+    """The first geohash after all geohashes that start with `prefix`, or None if there is none."""
+    prefix = prefix.rstrip(GEOHASH_ALPHABET[-1])
+    if not prefix:
+        return None
+    return prefix[:-1] + GEOHASH_ALPHABET[GEOHASH_ALPHABET.index(prefix[-1]) + 1]
+
+
+def covering_ranges(south, west, north, east):
+    """The (start, end) ranges of the geohashes of the cells that cover a bounding box; end None is unbounded."""
+    for length in range(GEOHASH_LENGTH, 0, -1):
+        x1, y1 = cell_index(south, west, length)
+        x2, y2 = cell_index(north, east, length)
+        if (x2 - x1 + 1) * (y2 - y1 + 1) <= MAX_CELLS:
+            break
+    cells = sorted(encode_cell(x, y, length) for x in range(x1, x2 + 1) for y in range(y1, y2 + 1))
+    # Merge cells that follow each other in geohash order into one range
+    ranges = []
+    for cell in cells:
+        if ranges and ranges[-1][1] == cell:
+            ranges[-1][1] = next_prefix(cell)
+        else:
+            ranges.append([cell, next_prefix(cell)])
+    return [tuple(cell_range) for cell_range in ranges]
+
+
+def distance_to(latitude, longitude):
+    """An expression for the haversine distance in meters from the coordinates of the row to the given ones."""
+    row_latitude = Radians(Cast('latitude', FloatField()))
+    row_longitude = Radians(Cast('longitude', FloatField()))
+    latitude, longitude = math.radians(latitude), math.radians(longitude)
+    a = (Power(Sin((row_latitude - Value(latitude)) / 2), 2)
+         + Cos(row_latitude) * Value(math.cos(latitude)) * Power(Sin((row_longitude - Value(longitude)) / 2), 2))
+    return Value(2 * EARTH_RADIUS, output_field=FloatField()) * ASin(Sqrt(a))
+
+
+def radius_box(latitude, longitude, meters):
+    """The bounding box (south, west, north, east) of the circle around the coordinates."""
+    latitude_delta = meters / METERS_PER_DEGREE
+    south, north = max(latitude - latitude_delta, -90), min(latitude + latitude_delta, 90)
+    cos_latitude = math.cos(math.radians(max(abs(south), abs(north))))
+    longitude_delta = 180 if cos_latitude < 1e-9 else min(latitude_delta / cos_latitude, 180)
+    return south, max(longitude - longitude_delta, -180), north, min(longitude + longitude_delta, 180)
+
+
+class GeoQuerySet(models.QuerySet):
+    """QuerySet for GeoLocation models. Rows without coordinates are never returned by these filters."""
+
+    def within_bbox(self, south, west, north, east):
+        """Rows inside the bounding box, in degrees; a box that crosses the antimeridian has west > east."""
+        if west > east:
+            return self.within_bbox(south, west, north, 180) | self.within_bbox(south, -180, north, east)
+        cells = Q()
+        for start, end in covering_ranges(south, west, north, east):
+            cells |= Q(geohash__gte=start, geohash__lt=end) if end else Q(geohash__gte=start)
+        return self.filter(cells, latitude__range=(south, north), longitude__range=(west, east))
+
+    def within_radius(self, latitude, longitude, meters):
+        """Rows within `meters` of the coordinates, annotated with their `distance` in meters."""
+        return self.within_bbox(*radius_box(latitude, longitude, meters)).annotate(
+            distance=distance_to(latitude, longitude)).filter(distance__lte=meters)
+
+    def nearest(self, latitude, longitude, count=10):
+        """The `count` rows nearest to the coordinates, nearest first, annotated with their `distance` in meters."""
+        index = get_index(self.model)
+        candidates = count
+        while True:
+            ids = index.nearest(latitude, longitude, candidates)
+            # Rows that other filters of the queryset leave out are replaced by more distant ones
+            if self.query.where:
+                ids = list(self.filter(pk__in=ids).values_list('pk', flat=True))
+            if len(ids) >= count or candidates >= index.size:
+                break
+            candidates *= 4
+        return self.filter(pk__in=ids).annotate(distance=distance_to(latitude, longitude)).order_by(
+            'distance', 'pk')[:count]
+
+
+def update_geohashes(queryset, batch_size=2000):
+    """Recompute the geohashes of the objects in `queryset`, for coordinates written without save()."""
+    manager = queryset.model._default_manager
+    batch = []
+    for obj in queryset.only('pk', 'latitude', 'longitude').iterator(chunk_size=batch_size):
+        obj.geohash = geohash(obj.latitude, obj.longitude)
+        batch.append(obj)
+        if len(batch) == batch_size:
+            manager.bulk_update(batch, ['geohash'])
+            batch = []
+    manager.bulk_update(batch, ['geohash'])
+
+
+# # # In-memory KD-tree for nearest neighbour queries # # #
+
+
+def unit_vectors(latitudes, longitudes):
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+    return np.column_stack([np.cos(latitudes) * np.cos(longitudes), np.cos(latitudes) * np.sin(longitudes),
+                            np.sin(latitudes)])
+
+
+class GeoIndex:
+    """
+    A KD-tree of the coordinates of the rows of a model. Node i covers positions lo to hi of the permuted points and
+    splits them at (lo + hi) // 2 on axis axes[i]; its children are nodes 2i + 1 and 2i + 2.
+    """
+
+    def __init__(self, ids, latitudes, longitudes):
+        self.size = len(ids)
+        points = unit_vectors(latitudes, longitudes)
+        order = np.arange(self.size)
+        self.axes = {}
+        self.splits = {}
+        stack = [(0, 0, self.size)]
+        while stack:
+            node, lo, hi = stack.pop()
+            if hi - lo <= LEAF_SIZE:
+                continue
+            axis = int(np.argmax(np.ptp(points[order[lo:hi]], axis=0)))
+            mid = (lo + hi) // 2
+            part = order[lo:hi]
+            order[lo:hi] = part[np.argpartition(points[part, axis], mid - lo)]
+            self.axes[node] = axis
+            self.splits[node] = points[order[mid], axis]
+            stack += [(2 * node + 1, lo, mid), (2 * node + 2, mid, hi)]
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        self.points = points[order]
+
+    @classmethod
+    def load(cls, model):
+        # Cast in the database, converting the decimals in Python takes most of the time
+        rows = np.array(model._default_manager.filter(latitude__isnull=False, longitude__isnull=False).values_list(
+            'pk', Cast('latitude', FloatField()), Cast('longitude', FloatField())), dtype=np.float64).reshape(-1, 3)
+        return cls(rows[:, 0].astype(np.int64), rows[:, 1], rows[:, 2])
+
+    def nearest(self, latitude, longitude, count):
+        """The ids of the `count` points nearest to the coordinates, nearest first."""
+        if not self.size or count <= 0:
+            return []
+        target = unit_vectors([latitude], [longitude])[0]
+        best_distances = np.empty(0)
+        best_positions = np.empty(0, dtype=np.int64)
+        # Nodes ordered by a lower bound of the distance to their points
+        queue = [(0.0, 0, 0, self.size)]
+        while queue:
+            bound, node, lo, hi = heapq.heappop(queue)
+            if len(best_distances) == count and bound >= best_distances[-1]:
+                break
+            if node not in self.axes:
+                distances = np.linalg.norm(self.points[lo:hi] - target, axis=1)
+                best_distances = np.concatenate([best_distances, distances])
+                best_positions = np.concatenate([best_positions, np.arange(lo, hi)])
+                order = np.argsort(best_distances, kind='stable')[:count]
+                best_distances, best_positions = best_distances[order], best_positions[order]
+                continue
+            mid = (lo + hi) // 2
+            offset = target[self.axes[node]] - self.splits[node]
+            near, far = ((2 * node + 1, lo, mid), (2 * node + 2, mid, hi)) if offset < 0 else (
+                (2 * node + 2, mid, hi), (2 * node + 1, lo, mid))
+            heapq.heappush(queue, (bound, *near))
+            heapq.heappush(queue, (max(bound, abs(offset)), *far))
+        return self.ids[best_positions].tolist()
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(model):
+    """Return the GeoIndex of the model for this process, loading it if the model changed since it was loaded."""
+    versions = get_versions([model])
+    with _indexes_lock:
+        index = _indexes.get(model)
+        if index is None or index.versions != versions:
+            index = GeoIndex.load(model)
+            index.versions = versions
+            _indexes[model] = index
+        return index
@@ -0,0 +1,197 @@
+"""
+Coordinates for places and addresses from a local gazetteer.
+
+A gazetteer is a CSV file with the columns of GAZETTEER_FIELDS, or a GeoJSON file of features with those properties
+and a geometry instead of latitude and longitude (a street drawn as a line gets the centre of its points). A row is a
+place, with its Wikidata id if known, or a street in a place, optionally with a house number.
+
+Names are compared after normalize_spelling(), without spaces, so 'Breede Straat' and 'Breedestraat' are the same
+street; names that still differ are matched to the most similar name in the gazetteer with difflib, if it is similar
+enough (see luchtmans.gazetteer). A place is matched by its Wikidata id, or else by one of its names. An address is
+matched by the old name of its street first and the current one second, to a house in the gazetteer or else to the
+street. Streets have no coordinates themselves, they are matched as part of their addresses.
+
+Every place and address keeps a digest of what it was matched on in `geocoded_input`, so a run only matches the rows
+whose names changed since. Rows without a match keep the coordinates they had. Every distinct place and street is
+matched once, in a pool of processes; reading, normalizing and writing happen in the main process.
+"""
+import csv
+import hashlib
+import json
+import multiprocessing
+from decimal import Decimal
+from itertools import batched
+from pathlib import Path
+
+from luchtmans.cache import bump_version
+from luchtmans.clusters import residence_decades, update_residence_clusters
+from luchtmans.gazetteer import Gazetteer, init_worker, match
+from luchtmans.geo import geohash
+from luchtmans.models import Place, Address, PeriodOfResidence
+from luchtmans.spelling import normalize_spelling
+
+GAZETTEER_FIELDS = ['type', 'name', 'place', 'house_number', 'wikidata_id', 'latitude', 'longitude']
+UPDATE_FIELDS = ['latitude', 'longitude', 'geohash', 'geocoded_input']
+# The path from PeriodOfResidence to the geocoded models
+RESIDENCE_PATHS = {
+    Place: 'address__street__place',
+    Address: 'address',
+}
+
+
+class GazetteerError(ValueError):
+    pass
+
+
+def name_key(name):
+    """The form of a name that gazetteer names are compared in."""
+    return normalize_spelling(name or '').replace(' ', '')
+
+
+def house_number_key(house_number):
+    return ''.join((house_number or '').split()).casefold()
+
+
+def geometry_centre(geometry):
+    """The (latitude, longitude) of a GeoJSON point, or the mean of the points of a line or polygon."""
+    points = []
+    stack = [geometry['coordinates']]
+    while stack:
+        coordinates = stack.pop()
+        if coordinates and isinstance(coordinates[0], (int, float)):
+            points.append(coordinates)
+        else:
+            stack.extend(coordinates)
+    if not points:
+        raise ValueError('empty geometry')
+    return sum(point[1] for point in points) / len(points), sum(point[0] for point in points) / len(points)
+
+
+def read_gazetteer(path):
+    """Yield the rows of a CSV or GeoJSON gazetteer as dicts with the GAZETTEER_FIELDS."""
+    path = Path(path)
+    if path.suffix.lower() == '.csv':
+        with path.open(newline='', encoding='utf-8') as file:
+            yield from csv.DictReader(file)
+    elif path.suffix.lower() in ('.geojson', '.json'):
+        with path.open(encoding='utf-8') as file:
+            features = json.load(file).get('features', [])
+        for number, feature in enumerate(features, start=1):
+            try:
+                latitude, longitude = geometry_centre(feature['geometry'])
+            except (KeyError, TypeError, ValueError) as e:
+                raise GazetteerError(f"Feature {number}: invalid geometry ({e})")
+            yield {**feature.get('properties', {}), 'latitude': latitude, 'longitude': longitude}
+    else:
+        raise GazetteerError(f"Unknown gazetteer format {path.suffix!r}, expected .csv or .geojson")
+
+
+def load_gazetteer(path):
+    gazetteer = Gazetteer()
+    for number, row in enumerate(read_gazetteer(path), start=1):
+        try:
+            coordinates = float(row['latitude']), float(row['longitude'])
+        except (KeyError, TypeError, ValueError) as e:
+            raise GazetteerError(f"Row {number}: invalid coordinates ({e})")
+        if row.get('type') == 'place':
+            gazetteer.add_place(name_key(row.get('name')), row.get('wikidata_id'), coordinates)
+        elif row.get('type') == 'street':
+            gazetteer.add_street(name_key(row.get('place')), name_key(row.get('name')),
+                                 house_number_key(row.get('house_number')), coordinates)
+        else:
+            raise GazetteerError(f"Row {number}: unknown type {row.get('type')!r}, expected place or street")
+    return gazetteer
+
+
+def match_all(gazetteer, tasks, processes=None):
+    """Return {task: coordinates or None}, matched in a pool of `processes` processes, or in this one if that is 1."""
+    tasks = list(tasks)
+    if processes == 1 or len(tasks) < 2:
+        init_worker(gazetteer)
+        return dict(zip(tasks, map(match, tasks)))
+    with multiprocessing.Pool(processes, initializer=init_worker, initargs=(gazetteer,)) as pool:
+        return dict(zip(tasks, pool.map(match, tasks)))
+
+
+def place_name_fields():
+    # The name in every language, added by modeltranslation
+    return [field.name for field in Place._meta.fields if field.name.startswith('name')]
+
+
+def name_keys(*names):
+    return tuple(dict.fromkeys(name_key(name) for name in names if name))
+
+
+def place_inputs():
+    """Yield (pk, what to match, stored digest) for every place."""
+    for pk, wikidata_id, stored, *names in Place.objects.order_by('pk').values_list(
+            'pk', 'wikidata_id', 'geocoded_input', *place_name_fields()).iterator():
+        yield pk, (('place', wikidata_id, name_keys(*names)), None), stored
+
+
+def address_inputs():
+    """Yield (pk, what to match, stored digest) for every address."""
+    for pk, old_name, street_name, house_number, stored, *place_names in Address.objects.order_by('pk').values_list(
+            'pk', 'streetname_old', 'street__name', 'house_number', 'geocoded_input',
+            *[f'street__place__{name}' for name in place_name_fields()]).iterator():
+        yield pk, (('street', name_keys(*place_names), name_keys(old_name, street_name)),
+                   house_number_key(house_number)), stored
+
+
+def input_digest(inputs):
+    return hashlib.md5(repr(inputs).encode(), usedforsecurity=False).hexdigest()
+
+
+def to_decimal(value):
+    return None if value is None else Decimal(f'{value:.6f}')
+
+
+def located_residence_decades(model, pks):
+    """The decades of the client residences at the places or addresses with the pks."""
+    decades = set()
+    for batch in batched(pks, 1000):
+        decades |= residence_decades(PeriodOfResidence.objects.filter(**{f'{RESIDENCE_PATHS[model]}__in': batch}))
+    return decades
+
+
+def geocode(gazetteer, model, only_changed=True, processes=None, batch_size=2000, log=print):
+    """
+    Geocode the places or addresses whose names changed, or all of them, and return the pks of those matched. The
+    rest keep their coordinates, which may come from Wikidata, and only store their digest.
+    """
+    rows = []
+    for pk, inputs, stored in place_inputs() if model is Place else address_inputs():
+        digest = input_digest(inputs)
+        if digest != stored or not only_changed:
+            rows.append((pk, inputs, digest))
+    # The addresses in a street share their task, only the house is looked up per address
+    results = match_all(gazetteer, {task for _, (task, _), _ in rows}, processes)
+    matched = []
+    for batch in batched(rows, batch_size):
+        objects, unmatched = [], []
+        for pk, (task, house_number), digest in batch:
+            coordinates = results[task]
+            if coordinates is not None and model is Address:
+                coordinates = gazetteer.street_coordinates(coordinates, house_number)
+            if coordinates is None:
+                unmatched.append(model(pk=pk, geocoded_input=digest))
+                continue
+            latitude, longitude = (to_decimal(value) for value in coordinates)
+            objects.append(model(pk=pk, latitude=latitude, longitude=longitude, geohash=geohash(latitude, longitude),
+                                 geocoded_input=digest))
+        model.objects.bulk_update(objects, UPDATE_FIELDS)
+        model.objects.bulk_update(unmatched, ['geocoded_input'])
+        matched += [obj.pk for obj in objects]
+    log(f"Matched {len(matched)} of {len(rows)} {model._meta.verbose_name_plural} to the gazetteer")
+    return matched
+
+
+def geocode_from(path, models=(Place, Address), only_changed=True, processes=None, batch_size=2000, log=print):
+    """Geocode the places and addresses from a gazetteer file, and update the clusters of their residences."""
+    gazetteer = load_gazetteer(path)
+    decades = set()
+    for model in models:
+        decades |= located_residence_decades(model, geocode(gazetteer, model, only_changed, processes, batch_size, log))
+    # bulk_update sends no signals, so the cached data has to be invalidated here
+    bump_version(*models)
+    update_residence_clusters(decades)
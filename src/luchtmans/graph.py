@@ -0,0 +1,321 @@
+"""
+In-memory graph of the relations between persons.
+
+The PersonPersonRelation table is loaded into NumPy arrays in compressed sparse row (CSR) form: the edges leaving node
+i are at positions indptr[i] to indptr[i + 1] of the edge arrays, which hold the target node, the relation id and the
+relation type of every edge. Every relation has one edge with type -1, which is followed when a query does not ask
+for specific types, and one edge per relation type for queries that do.
+
+get_graph() keeps one graph per process and reloads it when the cache version of the relation tables changes (see
+luchtmans.cache). Relations created, deleted or retyped by the process itself are patched into its graph after
+commit, by re-reading the relations of the persons involved, so the admin does not cause a reload of the whole table
+for every relation it saves.
+"""
+import threading
+import time
+from collections import defaultdict, namedtuple
+from functools import partial
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q, Value
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from luchtmans.cache import get_versions
+from luchtmans.models import PersonPersonRelation
+
+ANY_TYPE = -1
+
+# A patched graph is reloaded after this many refreshes, as the patches make traversal slower
+MAX_PATCHES = 1000
+# Changes committed by another process in the moment between a commit of this process and its refresh of the graph
+# do not show in the cache versions; the graph is reloaded after MAX_AGE seconds to pick those up
+MAX_AGE = 15 * 60
+
+Path = namedtuple('Path', ['persons', 'relations'])
+DegreeStatistics = namedtuple('DegreeStatistics', ['persons', 'relations', 'mean', 'median', 'p90', 'p99', 'max',
+                                                   'top'])
+
+
+def graph_models():
+    return [PersonPersonRelation, PersonPersonRelation.types.through]
+
+
+class RelationGraph:
+    def __init__(self, person_ids, sources, targets, relations, types):
+        """Build the graph from edge arrays; sources and targets are positions in the sorted array person_ids."""
+        self.person_ids = person_ids
+        self.size = len(person_ids)
+        order = np.lexsort((targets, sources))
+        self.indices = targets[order]
+        self.edge_sources = sources[order]
+        self.edge_relations = relations[order]
+        self.edge_types = types[order]
+        self.indptr = np.zeros(self.size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=self.size), out=self.indptr[1:])
+        self.edge_alive = np.ones(len(order), dtype=bool)
+
+        # Patches: edges added after loading and persons that were not in the graph yet
+        self.added = defaultdict(list)
+        self.extra_person_ids = []
+        self.extra_nodes = {}
+        self.patches = 0
+        self.versions = None
+        self.loaded = time.monotonic()
+        self._components = None
+
+    @classmethod
+    def load(cls):
+        relations = np.array(PersonPersonRelation.objects.values_list('id', 'from_person_id', 'to_person_id'),
+                             dtype=np.int64).reshape(-1, 3)
+        typed = np.array(PersonPersonRelation.types.through.objects.values_list('personpersonrelation_id',
+                                                                                'relationtype_id'),
+                         dtype=np.int64).reshape(-1, 2)
+        relations = relations[np.argsort(relations[:, 0])]
+
+        # One untyped edge per relation plus one edge per type
+        rows = np.concatenate([np.arange(len(relations)), np.searchsorted(relations[:, 0], typed[:, 0])])
+        types = np.concatenate([np.full(len(relations), ANY_TYPE, dtype=np.int64), typed[:, 1]])
+        sources, targets = relations[rows, 1], relations[rows, 2]
+        person_ids = np.unique(np.concatenate([sources, targets]))
+        return cls(person_ids, np.searchsorted(person_ids, sources), np.searchsorted(person_ids, targets),
+                   relations[rows, 0], types)
+
+    # # # Nodes # # #
+
+    def node(self, person_id, create=False):
+        """Return the node of a person, or None if the person has no relations."""
+        position = np.searchsorted(self.person_ids, person_id)
+        if position < self.size and self.person_ids[position] == person_id:
+            return int(position)
+        if person_id not in self.extra_nodes and create:
+            self.extra_person_ids.append(person_id)
+            self.extra_nodes[person_id] = self.size + len(self.extra_person_ids) - 1
+        return self.extra_nodes.get(person_id)
+
+    def node_count(self):
+        return self.size + len(self.extra_person_ids)
+
+    def person_id(self, node):
+        return int(self.person_ids[node]) if node < self.size else self.extra_person_ids[node - self.size]
+
+    def person_id_array(self, nodes):
+        all_ids = np.concatenate([self.person_ids, np.array(self.extra_person_ids, dtype=np.int64)])
+        return all_ids[nodes]
+
+    # # # Edges # # #
+
+    def edge_mask(self, positions, types):
+        mask = self.edge_alive[positions]
+        if types is None:
+            return mask & (self.edge_types[positions] == ANY_TYPE)
+        return mask & np.isin(self.edge_types[positions], types)
+
+    def expand(self, nodes, types=None):
+        """Return the sources, targets and relation ids of the edges leaving `nodes`."""
+        loaded = nodes[nodes < self.size]
+        starts = self.indptr[loaded]
+        counts = self.indptr[loaded + 1] - starts
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        mask = self.edge_mask(positions, types)
+        sources = np.repeat(loaded, counts)[mask]
+        targets = self.indices[positions][mask]
+        relations = self.edge_relations[positions][mask]
+
+        return self.with_added_edges(sources, targets, relations, nodes.tolist(), types)
+
+    def with_added_edges(self, sources, targets, relations, nodes, types):
+        """Append the edges leaving `nodes` that were added after loading to the edge arrays."""
+        extra = [(node, target, relation) for node in nodes for target, relation, type in self.added.get(node, ())
+                 if (type == ANY_TYPE if types is None else type in types)]
+        if not extra:
+            return sources, targets, relations
+        extra = np.array(extra, dtype=np.int64)
+        return (np.concatenate([sources, extra[:, 0]]), np.concatenate([targets, extra[:, 1]]),
+                np.concatenate([relations, extra[:, 2]]))
+
+    def all_edges(self, types=None):
+        mask = self.edge_mask(slice(None), types)
+        return self.with_added_edges(self.edge_sources[mask], self.indices[mask], self.edge_relations[mask],
+                                     list(self.added), types)
+
+    # # # Queries # # #
+
+    def breadth_first(self, start, max_depth=None, types=None, stop=None):
+        """Return the distance, parent and parent relation of every node reachable from `start`, -1 elsewhere."""
+        distance = np.full(self.node_count(), -1, dtype=np.int64)
+        parent = np.full(self.node_count(), -1, dtype=np.int64)
+        parent_relation = np.full(self.node_count(), -1, dtype=np.int64)
+        distance[start] = 0
+        frontier = np.array([start], dtype=np.int64)
+        depth = 0
+        while frontier.size and (max_depth is None or depth < max_depth) and (stop is None or distance[stop] < 0):
+            sources, targets, relations = self.expand(frontier, types)
+            new = distance[targets] < 0
+            targets, first = np.unique(targets[new], return_index=True)
+            depth += 1
+            distance[targets] = depth
+            parent[targets] = sources[new][first]
+            parent_relation[targets] = relations[new][first]
+            frontier = targets
+        return distance, parent, parent_relation
+
+    def shortest_path(self, from_person_id, to_person_id, max_depth=None, types=None):
+        """Return the Path with the fewest relations between two persons, or None if they are not connected."""
+        start, stop = self.node(from_person_id), self.node(to_person_id)
+        if start is None or stop is None:
+            return Path([from_person_id], []) if from_person_id == to_person_id else None
+        distance, parent, parent_relation = self.breadth_first(start, max_depth, types, stop)
+        if distance[stop] < 0:
+            return None
+        nodes, relations = [stop], []
+        while nodes[-1] != start:
+            relations.append(int(parent_relation[nodes[-1]]))
+            nodes.append(int(parent[nodes[-1]]))
+        return Path([self.person_id(node) for node in reversed(nodes)], relations[::-1])
+
+    def neighbourhood(self, person_id, k=1, types=None):
+        """Return {person id: number of relations away} for the persons at most k relations away from a person."""
+        start = self.node(person_id)
+        if start is None:
+            return {person_id: 0}
+        distance, _, _ = self.breadth_first(start, k, types)
+        nodes = np.flatnonzero(distance >= 0)
+        return dict(zip(self.person_id_array(nodes).tolist(), distance[nodes].tolist()))
+
+    def components(self):
+        """Return the component label of every node: the lowest node in its connected component."""
+        if self._components is None:
+            sources, targets, _ = self.all_edges()
+            labels = np.arange(self.node_count())
+            while True:
+                new_labels = labels.copy()
+                np.minimum.at(new_labels, sources, labels[targets])
+                np.minimum.at(new_labels, targets, labels[sources])
+                # Pointer jumping: follow the labels of the labels, so long chains converge quickly
+                new_labels = new_labels[new_labels]
+                if np.array_equal(new_labels, labels):
+                    break
+                labels = new_labels
+            self._components = labels
+        return self._components
+
+    def component_sizes(self):
+        """Return the sizes of the connected components, largest first."""
+        sizes = np.bincount(self.components())
+        return np.sort(sizes[sizes > 0])[::-1]
+
+    def component(self, person_id):
+        """Return the ids of the persons connected to a person by any chain of relations."""
+        node = self.node(person_id)
+        if node is None:
+            return [person_id]
+        labels = self.components()
+        return self.person_id_array(np.flatnonzero(labels == labels[node])).tolist()
+
+    def degree_statistics(self, top=10):
+        """Return statistics on the number of relations per person, with the `top` persons with the most."""
+        sources, _, relations = self.all_edges()
+        degrees = np.bincount(sources, minlength=self.node_count())
+        if not degrees.size:
+            return DegreeStatistics(0, 0, 0.0, 0.0, 0.0, 0.0, 0, [])
+        highest = np.argsort(-degrees, kind='stable')[:top]
+        p50, p90, p99 = np.percentile(degrees, [50, 90, 99]).tolist()
+        return DegreeStatistics(
+            self.node_count(), len(relations), float(degrees.mean()), p50, p90, p99, int(degrees.max()),
+            list(zip(self.person_id_array(highest).tolist(), degrees[highest].tolist())),
+        )
+
+    # # # Patches # # #
+
+    def refresh(self, person_ids, relation_ids, rows):
+        """
+        Replace the edges of the persons in `person_ids` and of the relations in `relation_ids` by `rows`, the current
+        (relation id, from person id, to person id, type id) of all their relations.
+        """
+        nodes = [node for node in map(self.node, person_ids) if node is not None]
+        self.edge_alive &= ~(np.isin(self.edge_sources, nodes) | np.isin(self.indices, nodes)
+                             | np.isin(self.edge_relations, list(relation_ids)))
+        nodes = set(nodes)
+        for source, edges in self.added.items():
+            edges[:] = [] if source in nodes else [edge for edge in edges
+                                                   if edge[0] not in nodes and edge[1] not in relation_ids]
+        for relation_id, from_person_id, to_person_id, type_id in rows:
+            source = self.node(from_person_id, create=True)
+            self.added[source].append((self.node(to_person_id, create=True), relation_id, type_id))
+        self.patches += 1
+        self.changed()
+
+    def changed(self):
+        """Forget the components, which are computed once for the current edges."""
+        self._components = None
+
+
+def fetch_relations(person_ids):
+    """Return the edges (relation id, from person id, to person id, type id) of the relations of the persons."""
+    relations = PersonPersonRelation.objects.filter(Q(from_person__in=person_ids) | Q(to_person__in=person_ids))
+    rows = list(relations.values_list('id', 'from_person_id', 'to_person_id', Value(ANY_TYPE)))
+    rows += relations.filter(types__isnull=False).values_list('id', 'from_person_id', 'to_person_id', 'types')
+    return rows
+
+
+_graph = None
+_graph_lock = threading.RLock()
+
+
+def get_graph():
+    """Return the graph of this process, loading it if the relation tables changed since it was loaded."""
+    global _graph
+    versions = get_versions(graph_models())
+    with _graph_lock:
+        if (_graph is None or _graph.versions != versions or _graph.patches > MAX_PATCHES
+                or time.monotonic() - _graph.loaded > MAX_AGE):
+            graph = RelationGraph.load()
+            graph.versions = versions
+            _graph = graph
+        return _graph
+
+
+def refresh_graph(person_ids, relation_ids, reload=False):
+    """Refresh the graph of this process with the relations changed by a committed transaction."""
+    global _graph
+    with _graph_lock:
+        if _graph is None:
+            return
+        if reload:
+            _graph = None
+            return
+        _graph.refresh(person_ids, relation_ids, fetch_relations(person_ids))
+        _graph.versions = get_versions(graph_models())
+
+
+# # # Signal receivers, connected in LuchtmansConfig.ready() # # #
+
+# The receivers pass the persons and relations that changed to a callback of their transaction, which re-reads their
+# relations after commit; each thread only refreshes its own committed changes, and a transaction that is rolled back
+# refreshes nothing. The reverse relations and types are written by the receivers in luchtmans.models, partly without
+# signals, but always between the same two persons, so they are covered as well.
+
+def schedule_refresh(person_ids=(), relation_ids=(), reload=False):
+    transaction.on_commit(partial(refresh_graph, set(person_ids), set(relation_ids), reload))
+
+
+def relation_changed(sender, instance, **kwargs):
+    schedule_refresh([instance.from_person_id, instance.to_person_id], [instance.pk])
+
+
+def relation_types_changed(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # `instance` is a RelationType, which may be used by any number of relations
+        schedule_refresh(reload=True)
+    else:
+        schedule_refresh([instance.from_person_id, instance.to_person_id], [instance.pk])
+
+
+def connect_signals():
+    post_save.connect(relation_changed, sender=PersonPersonRelation, dispatch_uid='luchtmans_graph_post_save')
+    post_delete.connect(relation_changed, sender=PersonPersonRelation, dispatch_uid='luchtmans_graph_post_delete')
+    m2m_changed.connect(relation_types_changed, sender=PersonPersonRelation.types.through,
+                        dispatch_uid='luchtmans_graph_m2m_changed')
@@ -0,0 +1,115 @@
+"""
+Queries on year intervals.
+
+PeriodOfResidence, PersonReligion and Edition have a start and end year. Their managers are IntervalQuerySets, which
+filter on overlap with, containment of and containment in a range of years. The model describes its interval with an
+Interval: the names of the start and end fields, and what a missing year means. For residences and religions an empty
+start or end is open, the period extends indefinitely. An edition without an end year was published in a single year,
+and an edition without a start year has no known publication year at all.
+
+On PostgreSQL the filters compare int4range values, which are served by a GiST index on the same expression (see
+migration 0015). On other databases the filters compare the endpoints themselves, using the B-tree indexes on them.
+"""
+from django.contrib.postgres.fields import IntegerRangeField
+from django.db import connections, models
+from django.db.models import Func, Max, Min, Q, Value
+from django.db.models.functions import Coalesce
+
+
+class YearRange(Func):
+    """Inclusive int4range of two year columns; a NULL bound is unbounded."""
+    template = "int4range(%(expressions)s, '[]')"
+    output_field = IntegerRangeField()
+
+
+class Interval:
+    def __init__(self, start, end, open_ended=True):
+        self.start = start
+        self.end = end
+        self.open_ended = open_ended
+
+    def range(self):
+        if self.open_ended:
+            return YearRange(self.start, self.end)
+        return YearRange(self.start, Coalesce(self.end, self.start))
+
+    def required(self):
+        return Q() if self.open_ended else Q(**{f'{self.start}__isnull': False})
+
+    def start_at_most(self, year):
+        if self.open_ended:
+            return Q(**{f'{self.start}__lte': year}) | Q(**{f'{self.start}__isnull': True})
+        return Q(**{f'{self.start}__lte': year})
+
+    def start_at_least(self, year):
+        return Q(**{f'{self.start}__gte': year})
+
+    def end_at_least(self, year):
+        if self.open_ended:
+            return Q(**{f'{self.end}__gte': year}) | Q(**{f'{self.end}__isnull': True})
+        return Q(**{f'{self.end}__gte': year}) | Q(**{f'{self.end}__isnull': True, f'{self.start}__gte': year})
+
+    def end_at_most(self, year):
+        if self.open_ended:
+            return Q(**{f'{self.end}__lte': year})
+        return Q(**{f'{self.end}__lte': year}) | Q(**{f'{self.end}__isnull': True, f'{self.start}__lte': year})
+
+
+class IntervalQuerySet(models.QuerySet):
+    """QuerySet for models with an `interval` attribute. A year of None leaves that side of the range open."""
+
+    @property
+    def interval(self):
+        return self.model.interval
+
+    def uses_ranges(self):
+        return connections[self.db].vendor == 'postgresql'
+
+    def range_filter(self, lookup, start, end):
+        return self.alias(year_range=self.interval.range()).filter(
+            self.interval.required(), **{f'year_range__{lookup}': YearRange(Value(start), Value(end))}
+        )
+
+    def overlapping(self, start=None, end=None):
+        """Intervals that share at least one year with start-end."""
+        if self.uses_ranges():
+            return self.range_filter('overlap', start, end)
+        q = self.interval.required()
+        if end is not None:
+            q &= self.interval.start_at_most(end)
+        if start is not None:
+            q &= self.interval.end_at_least(start)
+        return self.filter(q)
+
+    def containing(self, start, end=None):
+        """Intervals that cover all of start-end, or only the year start if end is None."""
+        end = start if end is None else end
+        if self.uses_ranges():
+            return self.range_filter('contains', start, end)
+        return self.filter(self.interval.required() & self.interval.start_at_most(start)
+                           & self.interval.end_at_least(end))
+
+    def within(self, start=None, end=None):
+        """Intervals that lie entirely inside start-end."""
+        if self.uses_ranges():
+            return self.range_filter('contained_by', start, end)
+        q = self.interval.required()
+        if start is not None:
+            q &= self.interval.start_at_least(start)
+        if end is not None:
+            q &= self.interval.end_at_most(end)
+        return self.filter(q)
+
+    def active_in(self, year):
+        """Intervals that include the year."""
+        return self.containing(year)
+
+    def decades(self):
+        """The first years of the decades from the earliest to the latest year in the queryset."""
+        years = self.aggregate(Min(self.interval.start), Min(self.interval.end),
+                               Max(self.interval.start), Max(self.interval.end))
+        first = min((year for key, year in years.items() if key.endswith('__min') and year is not None), default=None)
+        last = max((year for key, year in years.items() if key.endswith('__max') and year is not None), default=None)
+        if first is None:
+            return []
+        return list(range(first // 10 * 10, last + 1, 10))
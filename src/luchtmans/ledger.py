@@ -0,0 +1,219 @@
+"""
+Bulk import of transcribed ledger rows.
+
+Every row describes one Item. The columns are:
+
+    collection                  Collection id or short title
+    client                      Person id, only needed to create a collection that does not exist yet
+    volume, folio, recto_verso  the Page; pages that do not exist yet are created
+    type                        ItemType name, in any language; unknown names are created
+    bindings, languages         Binding and Language names, separated by semicolons; unknown names are created
+    editions                    Edition ids or STCN identifiers, separated by semicolons
+    transcription_full, volumes, number_of_copies, price, notes
+    price_decimal               decimal guilders; when empty it is parsed from price, see luchtmans.prices
+    non_book, transcription_incomplete, edition_uncertain, work_in_progress     booleans (1, true, yes, ja)
+    date, date_paid             ISO dates
+
+In JSON Lines files the list columns may also be JSON arrays. Foreign keys are resolved through lookup maps that
+are filled per chunk with one query per model, and items and their many-to-many rows are written with bulk_create.
+"""
+import csv
+import json
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from luchtmans.analytics import schedule_update as schedule_price_aggregate_update
+from luchtmans.cache import bump_version
+from luchtmans.copurchases import schedule_update as schedule_co_purchase_update
+from luchtmans.entries import schedule_update as schedule_ledger_entry_update
+from luchtmans.models import Collection, Page, ItemType, Binding, Language, Edition, Item
+from luchtmans.search import update_search_vectors
+
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'ja', 'j', 'x'}
+
+
+class LedgerRowError(ValueError):
+    def __init__(self, index, row, error):
+        super().__init__(f'{error!r} in {row!r}')
+        self.index = index
+
+
+def read_rows(file, format='csv', delimiter=','):
+    """Yield the rows of a CSV or JSON Lines file as dicts."""
+    if format == 'jsonl':
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        yield from csv.DictReader(file, delimiter=delimiter)
+
+
+def split_list(value):
+    if isinstance(value, list):
+        values = value
+    else:
+        values = (value or '').split(';')
+    return [str(value).strip() for value in values if str(value).strip()]
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().casefold() in TRUE_VALUES
+
+
+def parse_date(value):
+    return date.fromisoformat(value.strip()) if value and value.strip() else None
+
+
+def parse_decimal(value):
+    if value is None or not str(value).strip():
+        return None
+    try:
+        return Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f'Invalid decimal {value!r}')
+
+
+def page_key(row):
+    return int(row['volume']), str(row['folio']).strip(), str(row.get('recto_verso') or Page.RECTO).strip().upper()
+
+
+class LedgerImporter:
+    """
+    Imports chunks of ledger rows. The lookup maps are kept between chunks, so every collection, page, name and
+    edition is only looked up once per import.
+    """
+    name_columns = {ItemType: 'type', Binding: 'bindings', Language: 'languages'}
+
+    def __init__(self):
+        self.collections = {}
+        self.pages = {}
+        self.names = {}
+        self.editions = {}
+
+    def import_rows(self, rows):
+        """Import a chunk of rows in one transaction and return the number of items created."""
+        with transaction.atomic():
+            self.resolve_collections(rows)
+            self.resolve_pages(rows)
+            for model, column in self.name_columns.items():
+                self.resolve_names(model, [name for row in rows for name in split_list(row.get(column))])
+            self.resolve_editions(rows)
+
+            items = []
+            for index, row in enumerate(rows):
+                try:
+                    items.append(self.build_item(row))
+                except (KeyError, ValueError, TypeError) as e:
+                    raise LedgerRowError(index, row, e)
+            Item.objects.bulk_create(items)
+
+            self.add_relations(Item.editions.through, 'edition_id', items, [
+                [self.editions[key] for key in split_list(row.get('editions'))] for row in rows
+            ])
+            self.add_relations(Item.binding.through, 'binding_id', items, [
+                [self.names[Binding][name.casefold()] for name in split_list(row.get('bindings'))] for row in rows
+            ])
+            self.add_relations(Item.languages.through, 'language_id', items, [
+                [self.names[Language][name.casefold()] for name in split_list(row.get('languages'))] for row in rows
+            ])
+            update_search_vectors(Item.objects.filter(pk__in=[item.pk for item in items]))
+            # bulk_create sends no signals, so the co-purchases, price statistics and ledger entries are updated here
+            schedule_co_purchase_update((item.collection_id, self.editions[key])
+                                        for item, row in zip(items, rows) for key in split_list(row.get('editions')))
+            schedule_price_aggregate_update(items=[item.pk for item in items])
+            schedule_ledger_entry_update([item.pk for item in items])
+
+            transaction.on_commit(lambda: bump_version(
+                Item, Page, Item.editions.through, Item.binding.through, Item.languages.through,
+            ))
+        return len(items)
+
+    def resolve_collections(self, rows):
+        keys = {str(row['collection']).strip() for row in rows} - self.collections.keys()
+        if not keys:
+            return
+        ids = [int(key) for key in keys if key.isdigit()]
+        for collection in Collection.objects.filter(pk__in=ids).only('pk'):
+            self.collections[str(collection.pk)] = collection.pk
+        for pk, short_title in Collection.objects.filter(short_title__in=keys).values_list('pk', 'short_title'):
+            self.collections[short_title] = pk
+
+        # Create the collections that are still missing from the first row that names them
+        for row in rows:
+            key = str(row['collection']).strip()
+            if key not in self.collections:
+                if not row.get('client'):
+                    raise LedgerRowError(rows.index(row), row, KeyError(f'Unknown collection {key!r} without client'))
+                self.collections[key] = Collection.objects.create(short_title=key, client_id=int(row['client'])).pk
+
+    def resolve_pages(self, rows):
+        keys = {page_key(row) for row in rows} - self.pages.keys()
+        if not keys:
+            return
+        pages = Page.objects.filter(volume__in={volume for volume, _, _ in keys}, folio__in={key[1] for key in keys})
+        for pk, volume, folio, recto_verso in pages.values_list('pk', 'volume', 'folio', 'recto_verso'):
+            self.pages.setdefault((volume, folio, recto_verso), pk)
+
+        new_pages = [Page(volume=volume, folio=folio, recto_verso=recto_verso)
+                     for volume, folio, recto_verso in keys - self.pages.keys()]
+        for page in Page.objects.bulk_create(new_pages):
+            self.pages[(page.volume, page.folio, page.recto_verso)] = page.pk
+
+    def resolve_names(self, model, names):
+        if model not in self.names:
+            self.names[model] = {}
+            for obj in model.objects.all():
+                for name in {obj.name, obj.name_en, obj.name_nl}:
+                    if name:
+                        self.names[model][name.casefold()] = obj.pk
+        for name in names:
+            if name.casefold() not in self.names[model]:
+                self.names[model][name.casefold()] = model.objects.create(name=name).pk
+
+    def resolve_editions(self, rows):
+        keys = {key for row in rows for key in split_list(row.get('editions'))} - self.editions.keys()
+        if not keys:
+            return
+        ids = [int(key) for key in keys if key.isdigit()]
+        for pk in Edition.objects.filter(pk__in=ids).values_list('pk', flat=True):
+            self.editions[str(pk)] = pk
+        for pk, stcn_id in Edition.objects.filter(stcn_id__in=keys).values_list('pk', 'stcn_id'):
+            self.editions[stcn_id] = pk
+
+    def build_item(self, row):
+        item = Item(
+            collection_id=self.collections[str(row['collection']).strip()],
+            page_id=self.pages[page_key(row)],
+            type_id=self.names[ItemType][row['type'].strip().casefold()],
+            transcription_full=row['transcription_full'],
+            non_book=parse_bool(row.get('non_book')),
+            transcription_incomplete=parse_bool(row.get('transcription_incomplete')),
+            edition_uncertain=parse_bool(row.get('edition_uncertain')),
+            work_in_progress=parse_bool(row.get('work_in_progress')),
+            date=parse_date(row.get('date')),
+            date_paid=parse_date(row.get('date_paid')),
+            volumes=row.get('volumes') or '1',
+            number_of_copies=row.get('number_of_copies') or '1',
+            price=row.get('price') or '',
+            price_decimal=parse_decimal(row.get('price_decimal')),
+            notes=row.get('notes') or '',
+        )
+        item.normalized_text = item.get_normalized_text()
+        item.parse_price()
+        for key in split_list(row.get('editions')):
+            if key not in self.editions:
+                raise KeyError(f'Unknown edition {key!r}')
+        return item
+
+    def add_relations(self, through_model, field, items, related_ids):
+        """Add many-to-many rows from every item to the ids in the matching list of `related_ids`."""
+        through_model.objects.bulk_create([
+            through_model(item_id=item.pk, **{field: pk})
+            for item, ids in zip(items, related_ids)
+            for pk in dict.fromkeys(ids)
+        ])
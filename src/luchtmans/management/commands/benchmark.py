@@ -0,0 +1,49 @@
+import json
+import platform
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from luchtmans.benchmarks import BENCHMARKS, compare, run_benchmarks
+from luchtmans.models import Person, Edition, Item
+
+
+class Command(BaseCommand):
+    help = ("Time the hot paths (admin changelists, autocomplete, search, relation signals and imports) and count "
+            "their queries. Save the results as a JSON baseline with --output and compare a later run to it with "
+            "--compare; the command fails if a benchmark needs more queries or got slower than --threshold times "
+            "the baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('benchmarks', nargs='*', help="Benchmarks to run (default all): "
+                                                          + ", ".join(BENCHMARKS))
+        parser.add_argument('--repeat', type=int, default=5, help="Number of runs per benchmark")
+        parser.add_argument('--output', type=Path, help="Write the results to this JSON file")
+        parser.add_argument('--compare', type=Path, help="JSON file with the results to compare with")
+        parser.add_argument('--threshold', type=float, default=1.25, help="Slowdown factor that counts as regression")
+
+    def handle(self, *args, **options):
+        unknown = set(options['benchmarks']) - BENCHMARKS.keys()
+        if unknown:
+            raise CommandError(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+        results = run_benchmarks(options['benchmarks'], options['repeat'], self.stdout.write)
+
+        if options['output']:
+            options['output'].write_text(json.dumps({
+                'date': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'rows': {model._meta.model_name: model.objects.count() for model in [Person, Edition, Item]},
+                'repeat': options['repeat'],
+                'results': results,
+            }, indent=2))
+
+        if options['compare']:
+            baseline = json.loads(options['compare'].read_text())['results']
+            regressions = compare(baseline, results, options['threshold'])
+            if regressions:
+                raise CommandError(f"{len(regressions)} regressions:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from luchtmans.copurchases import build_co_purchases
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the collection x edition matrix, the edition co-purchases and the collection similarities from the "
+            "items")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10_000, help="Number of rows written at once")
+
+    def handle(self, *args, **options):
+        build_co_purchases(options['batch_size'], log=self.stdout.write)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from luchtmans.entries import build_ledger_entries
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized ledger entries, which the item list and exports read, from the items"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10_000, help="Number of items read and written at once")
+
+    def handle(self, *args, **options):
+        build_ledger_entries(options['batch_size'], log=self.stdout.write)
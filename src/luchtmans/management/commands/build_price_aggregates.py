@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from luchtmans.analytics import build_price_aggregates, refresh_stale_price_aggregates
+
+
+class Command(BaseCommand):
+    help = "Rebuild the price statistics per edition, genre, year and client from the items"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10_000, help="Number of rows written at once")
+        parser.add_argument('--stale', action='store_true',
+                            help="Only recompute the statistics that were marked stale after changes to their items")
+
+    def handle(self, *args, **options):
+        if options['stale']:
+            refresh_stale_price_aggregates(log=self.stdout.write)
+        else:
+            build_price_aggregates(options['batch_size'], log=self.stdout.write)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from luchtmans.clusters import build_residence_clusters
+
+
+class Command(BaseCommand):
+    help = "Rebuild the map clusters of where the clients lived per decade from their periods of residence"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10_000, help="Number of clusters written at once")
+
+    def handle(self, *args, **options):
+        build_residence_clusters(options['batch_size'], log=self.stdout.write)
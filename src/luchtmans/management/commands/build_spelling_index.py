@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from luchtmans.models import Edition, Item
+
+SPELLING_MODELS = {
+    'edition': Edition,
+    'item': Item,
+}
+
+
+class Command(BaseCommand):
+    help = "Rebuild the spelling-normalized text of editions and items, for instance after changing SPELLING_RULES"
+
+    def add_arguments(self, parser):
+        parser.add_argument('types', nargs='*', choices=[[], *SPELLING_MODELS], help="Models to rebuild (default all)")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Number of rows read and written at once")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for type in options['types'] or SPELLING_MODELS:
+            model = SPELLING_MODELS[type]
+            changed = []
+            updated = 0
+            queryset = model.objects.only('pk', 'normalized_text', *model.spelling_fields)
+            for obj in queryset.iterator(chunk_size=batch_size):
+                normalized_text = obj.get_normalized_text()
+                if obj.normalized_text != normalized_text:
+                    obj.normalized_text = normalized_text
+                    changed.append(obj)
+                if len(changed) == batch_size:
+                    updated += model.objects.bulk_update(changed, ['normalized_text'])
+                    changed = []
+            updated += model.objects.bulk_update(changed, ['normalized_text'])
+            self.stdout.write(f"Updated {updated} {model._meta.verbose_name_plural}")
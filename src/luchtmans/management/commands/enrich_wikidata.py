@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from luchtmans.enrichment import enrich_from
+
+
+class Command(BaseCommand):
+    help = ("Fill in the empty names of countries and places, the missing coordinates of countries, places and "
+            "addresses, and the empty dates of birth and death of persons from the entities of their wikidata_id in "
+            "a Wikidata JSON dump (.json, .json.gz or .json.bz2), like latest-all.json.bz2 of dumps.wikimedia.org.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="Wikidata JSON dump")
+        parser.add_argument('--processes', type=int, help="Number of parsing processes (default one per CPU)")
+        parser.add_argument('--batch-size', type=int, default=500, help="Number of entities parsed at once")
+
+    def handle(self, *args, **options):
+        try:
+            enrich_from(options['file'], processes=options['processes'], batch_size=options['batch_size'],
+                        log=self.stdout.write)
+        except (OSError, EOFError, ValueError) as e:  # including truncated archives and invalid JSON
+            raise CommandError(e)
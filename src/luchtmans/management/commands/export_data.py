@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from luchtmans.export import FORMATS, TABLES, ExportError, export
+
+
+class Command(BaseCommand):
+    help = ("Export a full table as CSV, JSON Lines or Parquet, see luchtmans.export. Rows are read and written in "
+            "chunks, so memory use does not grow with the size of the table.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', choices=list(TABLES), help="Table to export")
+        parser.add_argument('--format', choices=list(FORMATS), default='csv', help="File format (default: csv)")
+        parser.add_argument('--output', help="File to write to (default: standard output, not for Parquet)")
+        parser.add_argument('--collection', type=int, action='append',
+                            help="Only export rows of this collection; can be repeated")
+        parser.add_argument('--years', help="Only export rows of a year or a range of years like 1770-1790")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Number of rows read and written at once")
+
+    def handle(self, *args, **options):
+        if options['format'] == 'parquet' and not options['output']:
+            raise CommandError("Parquet exports need --output")
+        years = None
+        if options['years']:
+            start, _, end = options['years'].partition('-')
+            try:
+                years = int(start), int(end or start)
+            except ValueError:
+                raise CommandError(f"Invalid years {options['years']!r}")
+        try:
+            content = export(options['table'], options['format'], options['collection'], years,
+                             options['chunk_size'])
+            if options['output']:
+                with open(options['output'], 'wb') as file:
+                    for chunk in content:
+                        file.write(chunk)
+            else:
+                # Chunks end with a complete row, so they can be decoded one by one
+                for chunk in content:
+                    self.stdout.write(chunk.decode(), ending='')
+        except ExportError as e:
+            raise CommandError(e)
@@ -0,0 +1,35 @@
+import csv
+from itertools import batched
+
+from django.core.management.base import BaseCommand
+
+from luchtmans.dedupe import SCORE_CUTOFF, YEARS, candidate_pairs
+from luchtmans.models import Person
+
+
+class Command(BaseCommand):
+    help = ("Write the pairs of persons that may be the same person as CSV with the columns person, duplicate, score, "
+            "person_name and duplicate_name, best first, see luchtmans.dedupe. Review the file and pass it to "
+            "merge_persons.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help="File to write to (default: standard output)")
+        parser.add_argument('--cutoff', type=float, default=SCORE_CUTOFF,
+                            help=f"Least score of a pair, from 0 to 1 (default {SCORE_CUTOFF})")
+        parser.add_argument('--years', type=int, default=YEARS,
+                            help=f"Most years between the births of a pair (default {YEARS})")
+
+    def handle(self, *args, **options):
+        pairs = candidate_pairs(options['years'], options['cutoff'])
+        names = {}
+        for batch in batched({pk for pair in pairs for pk in pair[:2]}, 1000):
+            names.update(Person.objects.filter(pk__in=batch).values_list('pk', 'short_name'))
+        file = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else self.stdout
+        try:
+            writer = csv.writer(file, lineterminator='\n')
+            writer.writerow(['person', 'duplicate', 'score', 'person_name', 'duplicate_name'])
+            writer.writerows((pk, other, score, names[pk], names[other]) for pk, other, score in pairs)
+        finally:
+            if options['output']:
+                file.close()
+                self.stdout.write(f"Found {len(pairs)} possible duplicates")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from luchtmans.dataset import COUNTS, DatasetGenerator
+from luchtmans.models import Person
+
+
+class Command(BaseCommand):
+    help = ("Fill an empty database with synthetic ledger data for benchmarks: "
+            + ", ".join(f"{count:,} {name}" for name, count in COUNTS.items()) + " at scale 1")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0, help="Multiply the number of rows by this factor")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed; the same seed gives the same data")
+        parser.add_argument('--batch-size', type=int, default=10000, help="Number of rows written per transaction")
+
+    def handle(self, *args, **options):
+        if Person.objects.exists():
+            raise CommandError("The database already contains data; generate the dataset into an empty database")
+        DatasetGenerator(options['scale'], options['seed'], options['batch_size'], self.stdout.write).generate()
+        self.stdout.write(self.style.SUCCESS("Done"))
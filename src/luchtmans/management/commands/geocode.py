@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from luchtmans.geocoding import geocode_from
+from luchtmans.models import Place, Address
+
+MODELS = {
+    'place': Place,
+    'address': Address,
+}
+
+
+class Command(BaseCommand):
+    help = ("Fill in the coordinates of places and addresses from a local gazetteer: a CSV file with the columns "
+            "type (place or street), name, place, house_number, wikidata_id, latitude and longitude, or a GeoJSON "
+            "file of features with those properties. Only rows whose names changed since they were last geocoded "
+            "are matched, unless --all is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="CSV or GeoJSON gazetteer")
+        parser.add_argument('--model', choices=MODELS, action='append',
+                            help="Geocode only places or addresses; can be given twice (default both)")
+        parser.add_argument('--all', action='store_true',
+                            help="Match all rows, for instance after the gazetteer changed")
+        parser.add_argument('--processes', type=int, help="Number of matching processes (default one per CPU)")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Number of rows written at once")
+
+    def handle(self, *args, **options):
+        models = [MODELS[name] for name in dict.fromkeys(options['model'] or MODELS)]
+        try:
+            geocode_from(options['file'], models, only_changed=not options['all'], processes=options['processes'],
+                         batch_size=options['batch_size'], log=self.stdout.write)
+        except (OSError, ValueError) as e:  # including GazetteerError
+            raise CommandError(e)
@@ -0,0 +1,65 @@
+import json
+import os
+import time
+from itertools import batched, islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from luchtmans.ledger import LedgerImporter, LedgerRowError, read_rows
+
+
+class Command(BaseCommand):
+    help = ("Import ledger items from a CSV or JSON Lines file, see luchtmans.ledger for the columns. Every chunk is "
+            "written in its own transaction; with --checkpoint an interrupted import continues after the last "
+            "chunk that was written.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="CSV or JSON Lines file to import")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help="File format (default: from the file extension)")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Number of rows written per transaction")
+        parser.add_argument('--delimiter', default=',', help="CSV field delimiter")
+        parser.add_argument('--checkpoint', type=Path,
+                            help="File that keeps track of the rows imported so far, to resume an interrupted import")
+
+    def read_checkpoint(self, path, file):
+        if not path or not path.exists():
+            return 0
+        checkpoint = json.loads(path.read_text())
+        if checkpoint['file'] != str(Path(file).resolve()):
+            raise CommandError(f"Checkpoint {path} belongs to {checkpoint['file']}")
+        return checkpoint['rows']
+
+    def write_checkpoint(self, path, file, rows):
+        temporary_path = path.with_name(path.name + '.tmp')
+        temporary_path.write_text(json.dumps({'file': str(Path(file).resolve()), 'rows': rows}))
+        os.replace(temporary_path, path)
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or ('jsonl' if options['file'].endswith(('.jsonl', '.ndjson')) else 'csv')
+        skip = done = self.read_checkpoint(options['checkpoint'], options['file'])
+        if skip:
+            self.stdout.write(f"Resuming after row {skip}")
+
+        importer = LedgerImporter()
+        created = 0
+        start = time.perf_counter()
+        with open(options['file'], newline='', encoding='utf-8') as file:
+            rows = islice(read_rows(file, file_format, options['delimiter']), skip, None)
+            for batch in batched(rows, options['batch_size']):
+                try:
+                    created += importer.import_rows(batch)
+                except LedgerRowError as e:
+                    raise CommandError(f"Row {done + e.index + 1}: {e}")
+                except (KeyError, ValueError) as e:
+                    raise CommandError(f"Rows {done + 1}-{done + len(batch)}: {e!r}")
+                done += len(batch)
+                if options['checkpoint']:
+                    self.write_checkpoint(options['checkpoint'], options['file'], done)
+                self.stdout.write(f"Row {done}: {created / (time.perf_counter() - start):.0f} rows/s")
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {created} items in {elapsed:.1f} s ({created / elapsed if elapsed else 0:.0f} rows/s)"
+        ))
@@ -0,0 +1,47 @@
+import csv
+from itertools import batched
+
+from django.core.management.base import BaseCommand, CommandError
+
+from luchtmans.models import RelationType
+from luchtmans.relations import bulk_add_person_relations
+
+
+class Command(BaseCommand):
+    help = ("Import PersonPersonRelations from a CSV file with the columns from_person, to_person and types. "
+            "Persons are given by id, types by id or text, separated by semicolons. Reverse relations and reverse "
+            "types are created as well; relations and types that already exist are skipped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="CSV file to import")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Number of rows written per transaction")
+        parser.add_argument('--delimiter', default=',', help="CSV field delimiter")
+
+    def handle(self, *args, **options):
+        relation_types = {}
+        for relation_type in RelationType.objects.all():
+            relation_types[str(relation_type.pk)] = relation_type.pk
+            for text in {relation_type.text, relation_type.text_en, relation_type.text_nl}:
+                if text:
+                    relation_types[text.casefold()] = relation_type.pk
+
+        def edges(reader):
+            for row in reader:
+                try:
+                    type_ids = [relation_types[text.strip().casefold()]
+                                for text in row['types'].split(';') if text.strip()]
+                    yield int(row['from_person']), int(row['to_person']), type_ids
+                except (KeyError, ValueError) as e:
+                    raise CommandError(f"Line {reader.line_num}: cannot read {row!r} ({e!r})")
+
+        relations_created = types_created = 0
+        with open(options['file'], newline='', encoding='utf-8') as file:
+            reader = csv.DictReader(file, delimiter=options['delimiter'])
+            for batch in batched(edges(reader), options['batch_size']):
+                result = bulk_add_person_relations(batch)
+                relations_created += result.relations_created
+                types_created += result.types_created
+                self.stdout.write(f"Line {reader.line_num}: {relations_created} relations and "
+                                  f"{types_created} relation types created")
+
+        self.stdout.write(self.style.SUCCESS(f"Created {relations_created} relations and {types_created} relation types"))
@@ -0,0 +1,42 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from luchtmans.dedupe import MergeError, merge_groups, merge_persons
+
+
+class Command(BaseCommand):
+    help = ("Merge duplicate persons, see luchtmans.dedupe: either the persons given by id into the first of them, "
+            "or the pairs in the person and duplicate columns of a CSV file written by find_duplicate_persons, "
+            "where every group of linked persons is merged into the lowest id. All merges happen in one "
+            "transaction.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('persons', nargs='*', type=int, help="The id of the person to keep and of its duplicates")
+        parser.add_argument('--file', help="CSV file with pairs of duplicates")
+        parser.add_argument('--min-score', type=float, help="Only merge the pairs in the file with this score or more")
+        parser.add_argument('--batch-size', type=int, default=500, help="Number of duplicates updated at once")
+
+    def handle(self, *args, **options):
+        if bool(options['persons']) == bool(options['file']):
+            raise CommandError("Give either the ids of persons or --file")
+        if options['file']:
+            pairs = []
+            with open(options['file'], newline='', encoding='utf-8') as file:
+                reader = csv.DictReader(file)
+                for row in reader:
+                    try:
+                        if options['min_score'] is None or float(row['score']) >= options['min_score']:
+                            pairs.append((int(row['person']), int(row['duplicate'])))
+                    except (KeyError, TypeError, ValueError) as e:
+                        raise CommandError(f"Line {reader.line_num}: cannot read {row!r} ({e!r})")
+            mapping = merge_groups(pairs)
+        else:
+            target, *duplicates = options['persons']
+            mapping = {pk: target for pk in duplicates if pk != target}
+        try:
+            result = merge_persons(mapping, options['batch_size'])
+        except MergeError as e:
+            raise CommandError(e)
+        self.stdout.write(self.style.SUCCESS(
+            f"Merged {result.persons_merged} persons, moving {result.rows_moved} rows"))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from luchtmans.models import Person
+
+
+class Command(BaseCommand):
+    help = ("Parse the dates of birth and death of all persons into the earliest, latest and uncertain columns, for "
+            "instance after a bulk import or a change to the parser")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help="Number of rows read and written at once")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        changed = []
+        updated = 0
+        queryset = Person.objects.only('pk', 'date_of_birth', 'date_of_death', *Person.date_fields)
+        for person in queryset.iterator(chunk_size=batch_size):
+            before = [getattr(person, field) for field in Person.date_fields]
+            person.parse_dates()
+            if [getattr(person, field) for field in Person.date_fields] != before:
+                changed.append(person)
+            if len(changed) == batch_size:
+                updated += Person.objects.bulk_update(changed, Person.date_fields)
+                changed = []
+        updated += Person.objects.bulk_update(changed, Person.date_fields)
+        self.stdout.write(f"Updated {updated} persons")
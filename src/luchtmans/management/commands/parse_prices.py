@@ -0,0 +1,82 @@
+import json
+import os
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from luchtmans.analytics import schedule_update as schedule_price_aggregate_update
+from luchtmans.cache import bump_version
+from luchtmans.entries import schedule_update as schedule_ledger_entry_update
+from luchtmans.models import Item
+from luchtmans.prices import parse_prices
+
+
+class Command(BaseCommand):
+    help = ("Fill the empty decimal prices of items from their price, see luchtmans.prices, and flag the prices that "
+            "cannot be parsed for review. Every batch is written in its own transaction; items that were filled or "
+            "flagged are skipped when the command is run again, and with --checkpoint a run with --all continues "
+            "after the last batch that was written.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help="Also parse the prices of items with a decimal price, and replace it if they parse")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Number of rows read and written at once")
+        parser.add_argument('--checkpoint', type=Path,
+                            help="File that keeps track of the last item parsed, to resume an interrupted run")
+
+    def read_checkpoint(self, path):
+        if not path or not path.exists():
+            return 0
+        return json.loads(path.read_text())['pk']
+
+    def write_checkpoint(self, path, pk):
+        temporary_path = path.with_name(path.name + '.tmp')
+        temporary_path.write_text(json.dumps({'pk': pk}))
+        os.replace(temporary_path, path)
+
+    def handle(self, *args, **options):
+        queryset = Item.objects.order_by('pk')
+        if not options['all']:
+            queryset = queryset.filter(price_decimal__isnull=True, price_needs_review=False)
+        last_pk = self.read_checkpoint(options['checkpoint'])
+        if last_pk:
+            self.stdout.write(f"Resuming after item {last_pk}")
+
+        done = updated = flagged = 0
+        start = time.perf_counter()
+        while rows := list(queryset.filter(pk__gt=last_pk).values_list(
+                'pk', 'price', 'price_decimal', 'price_needs_review')[:options['batch_size']]):
+            decimals, unparseable = parse_prices([price for _, price, _, _ in rows])
+            # The same few prices make up most of a batch, so the items are updated per value
+            changed = defaultdict(list)
+            for (pk, _, old_decimal, old_review), decimal, review in zip(rows, decimals, unparseable.tolist()):
+                # Keep a decimal price that was entered by hand where the price does not parse
+                decimal = old_decimal if decimal is None else decimal
+                review = review and decimal is None
+                if (decimal, review) != (old_decimal, old_review):
+                    changed[decimal, review].append(pk)
+                    flagged += review
+
+            last_pk = rows[-1][0]
+            with transaction.atomic():
+                for (decimal, review), pks in changed.items():
+                    for i in range(0, len(pks), 1000):
+                        updated += Item.objects.filter(pk__in=pks[i:i + 1000]).update(
+                            price_decimal=decimal, price_needs_review=review)
+                # update() sends no signals, so the price statistics and ledger entries are updated here
+                changed_pks = [pk for pks in changed.values() for pk in pks]
+                schedule_price_aggregate_update(items=changed_pks)
+                schedule_ledger_entry_update(changed_pks)
+                if options['checkpoint']:
+                    transaction.on_commit(lambda pk=last_pk: self.write_checkpoint(options['checkpoint'], pk))
+            bump_version(Item)
+            done += len(rows)
+            self.stdout.write(f"Item {last_pk}: {done / (time.perf_counter() - start):.0f} rows/s")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Parsed {done} prices in {time.perf_counter() - start:.1f} s: updated {updated} items, "
+            f"{flagged} flagged for review"
+        ))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from luchtmans.search import full_text_search_available, update_search_vectors
+from luchtmans.views import SEARCH_MODELS
+
+
+class Command(BaseCommand):
+    help = "Recompute the full-text search vectors, for instance after a bulk import. Only does work on PostgreSQL."
+
+    def add_arguments(self, parser):
+        parser.add_argument('types', nargs='*', choices=[[], *SEARCH_MODELS], help="Models to update (default all)")
+        parser.add_argument('--batch-size', type=int, default=10000, help="Number of rows updated per statement")
+
+    def handle(self, *args, **options):
+        if not full_text_search_available():
+            self.stdout.write("Full-text search needs PostgreSQL, nothing to do")
+            return
+
+        for type in options['types'] or SEARCH_MODELS:
+            model = SEARCH_MODELS[type]
+            pks = list(model.objects.order_by('pk').values_list('pk', flat=True))
+            for start in range(0, len(pks), options['batch_size']):
+                batch = pks[start:start + options['batch_size']]
+                update_search_vectors(model.objects.filter(pk__gte=batch[0], pk__lte=batch[-1]))
+            self.stdout.write(f"Updated {len(pks)} {model._meta.verbose_name_plural}")
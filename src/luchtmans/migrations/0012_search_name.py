@@ -0,0 +1,70 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:29
+
+from django.db import migrations, models
+
+from luchtmans.autocomplete import normalize_name
+from luchtmans.operations import PostgresRunSQL
+
+
+def fill_search_names(apps, schema_editor):
+    search_names = {
+        'Person': lambda person: [person.short_name, person.first_names, person.surname],
+        'Place': lambda place: [place.name, place.name_en, place.name_nl],
+        'Street': lambda street: [street.name],
+        'Address': lambda address: [address.street.name, address.house_number, address.streetname_old,
+                                    address.description],
+    }
+    for model_name, get_search_names in search_names.items():
+        model = apps.get_model('luchtmans', model_name)
+        queryset = model.objects.select_related('street') if model_name == 'Address' else model.objects.all()
+        batch = []
+        for obj in queryset.iterator(chunk_size=2000):
+            obj.search_name = normalize_name(*get_search_names(obj))[:1024]
+            batch.append(obj)
+            if len(batch) == 2000:
+                model.objects.bulk_update(batch, ['search_name'])
+                batch = []
+        model.objects.bulk_update(batch, ['search_name'])
+
+
+def trigram_index(table):
+    return PostgresRunSQL(
+        f'CREATE INDEX {table}_search_name_trgm ON {table} USING gin (search_name gin_trgm_ops);',
+        f'DROP INDEX {table}_search_name_trgm;',
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('luchtmans', '0011_alter_binding_options_alter_collection_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='address',
+            name='search_name',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=1024),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='search_name',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=1024),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='search_name',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=1024),
+        ),
+        migrations.AddField(
+            model_name='street',
+            name='search_name',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=1024),
+        ),
+        migrations.RunPython(fill_search_names, migrations.RunPython.noop),
+        PostgresRunSQL('CREATE EXTENSION IF NOT EXISTS pg_trgm;', migrations.RunSQL.noop),
+        trigram_index('luchtmans_address'),
+        trigram_index('luchtmans_person'),
+        trigram_index('luchtmans_place'),
+        trigram_index('luchtmans_street'),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:31
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+from luchtmans.operations import PostgresRunSQL
+
+
+def search_vector_sql(table, fields):
+    """Backfill the search vector of `table` and index it"""
+    vector = ' || '.join(f"setweight(to_tsvector('simple', coalesce({field}, '')), '{weight}')"
+                         for field, weight in fields)
+    return PostgresRunSQL(
+        [f'UPDATE {table} SET search_vector = {vector};',
+         f'CREATE INDEX {table}_search_vector ON {table} USING gin (search_vector);'],
+        f'DROP INDEX {table}_search_vector;',
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('luchtmans', '0012_search_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='edition',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='work',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        search_vector_sql('luchtmans_collection', [('short_title', 'A'), ('all_headers', 'B')]),
+        search_vector_sql('luchtmans_edition', [('title', 'A'), ('short_title', 'A')]),
+        search_vector_sql('luchtmans_item', [('transcription_full', 'A')]),
+        search_vector_sql('luchtmans_person', [('short_name', 'A'), ('surname', 'A'), ('first_names', 'B')]),
+        search_vector_sql('luchtmans_work', [('title', 'A')]),
+    ]
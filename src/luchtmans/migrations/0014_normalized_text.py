@@ -0,0 +1,53 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:34
+
+from django.db import migrations, models
+
+from luchtmans.operations import PostgresRunSQL
+from luchtmans.spelling import normalize_spelling
+
+
+def fill_normalized_texts(apps, schema_editor):
+    spelling_fields = {
+        'Edition': ['title', 'short_title'],
+        'Item': ['transcription_full'],
+    }
+    for model_name, fields in spelling_fields.items():
+        model = apps.get_model('luchtmans', model_name)
+        batch = []
+        for obj in model.objects.only('pk', *fields).iterator(chunk_size=2000):
+            obj.normalized_text = normalize_spelling(*[getattr(obj, field) for field in fields])
+            batch.append(obj)
+            if len(batch) == 2000:
+                model.objects.bulk_update(batch, ['normalized_text'])
+                batch = []
+        model.objects.bulk_update(batch, ['normalized_text'])
+
+
+def trigram_index(table):
+    return PostgresRunSQL(
+        f'CREATE INDEX {table}_normalized_text_trgm ON {table} USING gin (normalized_text gin_trgm_ops);',
+        f'DROP INDEX {table}_normalized_text_trgm;',
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('luchtmans', '0013_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='edition',
+            name='normalized_text',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='normalized_text',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(fill_normalized_texts, migrations.RunPython.noop),
+        trigram_index('luchtmans_edition'),
+        trigram_index('luchtmans_item'),
+    ]
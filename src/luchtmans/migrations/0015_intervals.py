@@ -0,0 +1,75 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:41
+
+from django.db import migrations, models
+
+from luchtmans.operations import PostgresRunSQL
+
+
+def swap_reversed_years(apps, schema_editor):
+    # Rows with the years in the wrong order would violate the new check constraints
+    intervals = {
+        'PeriodOfResidence': ('start_year', 'end_year'),
+        'PersonReligion': ('start_year', 'end_year'),
+        'Edition': ('year_of_publication_start', 'year_of_publication_end'),
+    }
+    for model_name, (start, end) in intervals.items():
+        model = apps.get_model('luchtmans', model_name)
+        model.objects.filter(**{f'{start}__gt': models.F(end)}).update(**{start: models.F(end), end: models.F(start)})
+
+
+def range_index(table, start, end):
+    return PostgresRunSQL(
+        f"CREATE INDEX {table}_year_range ON {table} USING gist (int4range({start}, {end}, '[]'));",
+        f"DROP INDEX {table}_year_range;",
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('luchtmans', '0014_normalized_text'),
+    ]
+
+    operations = [
+        migrations.RunPython(swap_reversed_years, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='edition',
+            index=models.Index(fields=['year_of_publication_start', 'year_of_publication_end'], name='luchtmans_e_year_of_7cb83e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='edition',
+            index=models.Index(fields=['year_of_publication_end'], name='luchtmans_e_year_of_9e366f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='periodofresidence',
+            index=models.Index(fields=['start_year', 'end_year'], name='luchtmans_p_start_y_ddaa59_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='periodofresidence',
+            index=models.Index(fields=['end_year'], name='luchtmans_p_end_yea_175514_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='personreligion',
+            index=models.Index(fields=['start_year', 'end_year'], name='luchtmans_p_start_y_c0539b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='personreligion',
+            index=models.Index(fields=['end_year'], name='luchtmans_p_end_yea_be560e_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='edition',
+            constraint=models.CheckConstraint(condition=models.Q(('year_of_publication_start__lte', models.F('year_of_publication_end')), ('year_of_publication_start__isnull', True), ('year_of_publication_end__isnull', True), _connector='OR'), name='edition_start_year_before_end_year'),
+        ),
+        migrations.AddConstraint(
+            model_name='periodofresidence',
+            constraint=models.CheckConstraint(condition=models.Q(('start_year__lte', models.F('end_year')), ('start_year__isnull', True), ('end_year__isnull', True), _connector='OR'), name='periodofresidence_start_year_before_end_year'),
+        ),
+        migrations.AddConstraint(
+            model_name='personreligion',
+            constraint=models.CheckConstraint(condition=models.Q(('start_year__lte', models.F('end_year')), ('start_year__isnull', True), ('end_year__isnull', True), _connector='OR'), name='personreligion_start_year_before_end_year'),
+        ),
+        range_index('luchtmans_periodofresidence', 'start_year', 'end_year'),
+        range_index('luchtmans_personreligion', 'start_year', 'end_year'),
+        range_index('luchtmans_edition', 'year_of_publication_start',
+                    'COALESCE(year_of_publication_end, year_of_publication_start)'),
+    ]
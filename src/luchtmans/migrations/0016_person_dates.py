@@ -0,0 +1,89 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:46
+
+from django.db import migrations, models
+
+from luchtmans.dates import lifespan, parse_date
+
+
+def parse_person_dates(apps, schema_editor):
+    Person = apps.get_model('luchtmans', 'Person')
+    fields = ['birth_earliest', 'birth_latest', 'birth_uncertain', 'death_earliest', 'death_latest', 'death_uncertain',
+              'alive_from', 'alive_until']
+    batch = []
+    for person in Person.objects.only('pk', 'date_of_birth', 'date_of_death').iterator(chunk_size=2000):
+        birth, death = parse_date(person.date_of_birth), parse_date(person.date_of_death)
+        person.birth_earliest, person.birth_latest, person.birth_uncertain = birth
+        person.death_earliest, person.death_latest, person.death_uncertain = death
+        person.alive_from, person.alive_until = lifespan(birth, death)
+        batch.append(person)
+        if len(batch) == 2000:
+            Person.objects.bulk_update(batch, fields)
+            batch = []
+    Person.objects.bulk_update(batch, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('luchtmans', '0015_intervals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='person',
+            name='alive_from',
+            field=models.DateField(editable=False, null=True, verbose_name='alive from'),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='alive_until',
+            field=models.DateField(editable=False, null=True, verbose_name='alive until'),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='birth_earliest',
+            field=models.DateField(editable=False, null=True, verbose_name='earliest date of birth'),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='birth_latest',
+            field=models.DateField(editable=False, null=True, verbose_name='latest date of birth'),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='birth_uncertain',
+            field=models.BooleanField(default=False, editable=False, verbose_name='date of birth is uncertain'),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='death_earliest',
+            field=models.DateField(editable=False, null=True, verbose_name='earliest date of death'),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='death_latest',
+            field=models.DateField(editable=False, null=True, verbose_name='latest date of death'),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='death_uncertain',
+            field=models.BooleanField(default=False, editable=False, verbose_name='date of death is uncertain'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['birth_earliest'], name='luchtmans_p_birth_e_5a1031_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['death_latest'], name='luchtmans_p_death_l_37fb70_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['alive_from', 'alive_until'], name='luchtmans_p_alive_f_dca831_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['alive_until'], name='luchtmans_p_alive_u_455158_idx'),
+        ),
+        migrations.RunPython(parse_person_dates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('luchtmans', '0016_person_dates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionEdition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('items', models.PositiveIntegerField(verbose_name='items')),
+                ('collection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='luchtmans.collection', verbose_name='collection')),
+                ('edition', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='luchtmans.edition', verbose_name='edition')),
+            ],
+            options={
+                'verbose_name': 'collection edition',
+                'verbose_name_plural': 'collection editions',
+                'indexes': [models.Index(fields=['edition', 'collection'], name='luchtmans_c_edition_579280_idx')],
+                'unique_together': {('collection', 'edition')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CollectionSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('editions', models.PositiveIntegerField(verbose_name='editions in common')),
+                ('similarity', models.FloatField(verbose_name='similarity')),
+                ('collection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='luchtmans.collection', verbose_name='collection')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='luchtmans.collection', verbose_name='other collection')),
+            ],
+            options={
+                'verbose_name': 'collection similarity',
+                'verbose_name_plural': 'collection similarities',
+                'indexes': [models.Index(fields=['collection', '-similarity'], name='luchtmans_c_collect_3df2a6_idx')],
+                'unique_together': {('collection', 'other')},
+            },
+        ),
+        migrations.CreateModel(
+            name='EditionCoPurchase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collections', models.PositiveIntegerField(verbose_name='collections')),
+                ('edition', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='luchtmans.edition', verbose_name='edition')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='luchtmans.edition', verbose_name='other edition')),
+            ],
+            options={
+                'verbose_name': 'edition co-purchase',
+                'verbose_name_plural': 'edition co-purchases',
+                'indexes': [models.Index(fields=['edition', '-collections'], name='luchtmans_e_edition_9d7559_idx')],
+                'unique_together': {('edition', 'other')},
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('luchtmans', '0017_co_purchases'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='price_needs_review',
+            field=models.BooleanField(default=False, editable=False, verbose_name='price needs review'),
+        ),
+        migrations.AlterField(
+            model_name='item',
+            name='price_decimal',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True, verbose_name='decimal price'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(condition=models.Q(('price_needs_review', True)), fields=['price_needs_review'], name='item_price_needs_review'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('luchtmans', '0018_price_review'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('edition', 'edition'), ('stcn_genre', 'STCN genre'), ('genre_parisian_category', 'genre (Parisian category)'), ('year', 'year'), ('client', 'client')], max_length=30, verbose_name='dimension')),
+                ('key', models.BigIntegerField(verbose_name='key')),
+                ('items', models.PositiveIntegerField(verbose_name='items')),
+                ('copies', models.PositiveIntegerField(verbose_name='copies')),
+                ('priced_items', models.PositiveIntegerField(verbose_name='items with a price')),
+                ('total', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='total')),
+                ('mean', models.DecimalField(decimal_places=2, max_digits=10, null=True, verbose_name='mean')),
+                ('minimum', models.DecimalField(decimal_places=2, max_digits=10, null=True, verbose_name='minimum')),
+                ('p25', models.DecimalField(decimal_places=2, max_digits=10, null=True, verbose_name='25th percentile')),
+                ('median', models.DecimalField(decimal_places=2, max_digits=10, null=True, verbose_name='median')),
+                ('p75', models.DecimalField(decimal_places=2, max_digits=10, null=True, verbose_name='75th percentile')),
+                ('p90', models.DecimalField(decimal_places=2, max_digits=10, null=True, verbose_name='90th percentile')),
+                ('maximum', models.DecimalField(decimal_places=2, max_digits=10, null=True, verbose_name='maximum')),
+                ('stale', models.BooleanField(default=False, verbose_name='stale')),
+            ],
+            options={
+                'verbose_name': 'price aggregate',
+                'verbose_name_plural': 'price aggregates',
+                'indexes': [models.Index(fields=['dimension', '-items'], name='luchtmans_p_dimensi_aa32e2_idx'), models.Index(condition=models.Q(('stale', True)), fields=['stale'], name='price_aggregate_stale')],
+                'unique_together': {('dimension', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:16
+
+from itertools import batched
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from luchtmans.entries import make_entries
+
+
+def fill_ledger_entries(apps, schema_editor):
+    Item = apps.get_model('luchtmans', 'Item')
+    LedgerEntry = apps.get_model('luchtmans', 'LedgerEntry')
+    for batch in batched(Item.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=2000), 2000):
+        items = Item.objects.filter(pk__range=(batch[0], batch[-1]))
+        LedgerEntry.objects.bulk_create(make_entries(items, LedgerEntry))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('luchtmans', '0019_price_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ledger_entry', serialize=False, to='luchtmans.item', verbose_name='item')),
+                ('collection_title', models.CharField(max_length=256, verbose_name='collection')),
+                ('client_name', models.CharField(max_length=256, verbose_name='client')),
+                ('volume', models.IntegerField(verbose_name='volume')),
+                ('folio', models.CharField(max_length=256, verbose_name='folio')),
+                ('recto_verso', models.CharField(max_length=1, verbose_name='recto or verso')),
+                ('transcription_full', models.CharField(max_length=256, verbose_name='full transcription')),
+                ('non_book', models.BooleanField(verbose_name='non book')),
+                ('transcription_incomplete', models.BooleanField(verbose_name='transcription is incomplete')),
+                ('date', models.DateField(null=True, verbose_name='date')),
+                ('date_paid', models.DateField(null=True, verbose_name='date_paid')),
+                ('edition_uncertain', models.BooleanField(verbose_name='edition is uncertain')),
+                ('volumes', models.CharField(max_length=10, verbose_name='volumes')),
+                ('number_of_copies', models.CharField(max_length=10, verbose_name='number of copies')),
+                ('price', models.CharField(max_length=20, verbose_name='price')),
+                ('price_decimal', models.DecimalField(decimal_places=2, max_digits=20, null=True, verbose_name='decimal price')),
+                ('notes', models.TextField(verbose_name='notes')),
+                ('work_in_progress', models.BooleanField(verbose_name='work in progress')),
+                ('edition_ids', models.JSONField(default=list, verbose_name='editions')),
+                ('edition_titles', models.JSONField(default=list, verbose_name='edition titles')),
+                ('work_titles', models.JSONField(default=list, verbose_name='work titles')),
+                ('binding_ids', models.JSONField(default=list, verbose_name='bindings')),
+                ('language_ids', models.JSONField(default=list, verbose_name='languages')),
+                ('client', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='luchtmans.person', verbose_name='client')),
+                ('collection', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='luchtmans.collection', verbose_name='collection')),
+                ('type', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='luchtmans.itemtype', verbose_name='type')),
+            ],
+            options={
+                'verbose_name': 'ledger entry',
+                'verbose_name_plural': 'ledger entries',
+                'indexes': [models.Index(fields=['volume', 'folio', 'recto_verso'], name='luchtmans_l_volume_41eb2b_idx'), models.Index(fields=['collection', 'date'], name='luchtmans_l_collect_0dbab8_idx'), models.Index(fields=['date'], name='luchtmans_l_date_7118ef_idx')],
+            },
+        ),
+        migrations.RunPython(fill_ledger_entries, migrations.RunPython.noop),
+    ]
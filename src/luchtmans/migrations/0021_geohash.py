@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+from luchtmans.geo import update_geohashes
+
+
+def fill_geohashes(apps, schema_editor):
+    for model_name in ['Country', 'Place', 'Address']:
+        model = apps.get_model('luchtmans', model_name)
+        update_geohashes(model.objects.filter(latitude__isnull=False, longitude__isnull=False))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('luchtmans', '0020_ledger_entries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='address',
+            name='geohash',
+            field=models.CharField(blank=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='country',
+            name='geohash',
+            field=models.CharField(blank=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='geohash',
+            field=models.CharField(blank=True, editable=False, max_length=12),
+        ),
+        migrations.AddIndex(
+            model_name='address',
+            index=models.Index(fields=['geohash', 'latitude', 'longitude'], name='address_geohash'),
+        ),
+        migrations.AddIndex(
+            model_name='country',
+            index=models.Index(fields=['geohash', 'latitude', 'longitude'], name='country_geohash'),
+        ),
+        migrations.AddIndex(
+            model_name='place',
+            index=models.Index(fields=['geohash', 'latitude', 'longitude'], name='place_geohash'),
+        ),
+        migrations.RunPython(fill_geohashes, migrations.RunPython.noop),
+    ]
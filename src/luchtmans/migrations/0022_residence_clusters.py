@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('luchtmans', '0021_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResidenceCluster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zoom', models.PositiveSmallIntegerField(verbose_name='zoom level')),
+                ('decade', models.SmallIntegerField(verbose_name='decade')),
+                ('x', models.PositiveIntegerField()),
+                ('y', models.PositiveIntegerField()),
+                ('clients', models.PositiveIntegerField(verbose_name='clients')),
+                ('latitude', models.FloatField(verbose_name='latitude')),
+                ('longitude', models.FloatField(verbose_name='longitude')),
+            ],
+            options={
+                'verbose_name': 'residence cluster',
+                'verbose_name_plural': 'residence clusters',
+                'unique_together': {('zoom', 'decade', 'x', 'y')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('luchtmans', '0022_residence_clusters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='address',
+            name='geocoded_input',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='country',
+            name='geocoded_input',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='geocoded_input',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('luchtmans', '0023_geocoded_input'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='address',
+            name='wikidata_id',
+            field=models.CharField(blank=True, db_index=True, max_length=256),
+        ),
+        migrations.AlterField(
+            model_name='country',
+            name='wikidata_id',
+            field=models.CharField(blank=True, db_index=True, max_length=256),
+        ),
+        migrations.AlterField(
+            model_name='person',
+            name='wikidata_id',
+            field=models.CharField(blank=True, db_index=True, max_length=256),
+        ),
+        migrations.AlterField(
+            model_name='place',
+            name='wikidata_id',
+            field=models.CharField(blank=True, db_index=True, max_length=256),
+        ),
+        migrations.AlterField(
+            model_name='work',
+            name='wikidata_id',
+            field=models.CharField(blank=True, db_index=True, max_length=256),
+        ),
+    ]
@@ -1,16 +1,48 @@
-from django.db import models
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date
+
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
 from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.utils.translation import gettext_lazy as _
 from django.dispatch import receiver
 
+from luchtmans.autocomplete import normalize_name
+from luchtmans.cache import bump_version
+from luchtmans.dates import lifespan, parse_date
+from luchtmans.geo import GeoQuerySet, geohash
+from luchtmans.intervals import Interval, IntervalQuerySet
+from luchtmans.prices import parse_price
+from luchtmans.search import update_search_vectors
+from luchtmans.spelling import normalize_spelling
+
 
 # # # START Helper classes and functions # # #
 
 
+relation_signals_suppressed = ContextVar('relation_signals_suppressed', default=False)
+
+
+@contextmanager
+def suppress_relation_signals():
+    """
+    Keep the symmetrical relation receivers from running for saves and deletes made inside this block. The flag is
+    a context variable, so other threads and async tasks keep their signal handling.
+    """
+    token = relation_signals_suppressed.set(True)
+    try:
+        yield
+    finally:
+        relation_signals_suppressed.reset(token)
+
+
 def post_save_relation_creator(sender, relation_fields, other_fields=()):
     @receiver(post_save, sender=sender)
     def post_save_relation(sender, instance, created, **kwargs):
         """Create/update a/the symmetrical relation"""
+        if relation_signals_suppressed.get():
+            return
         relation_fields_swapped = {
             relation_fields[0]: getattr(instance, relation_fields[1]),
             relation_fields[1]: getattr(instance, relation_fields[0]),
@@ -19,14 +51,15 @@ def post_save_relation_creator(sender, relation_fields, other_fields=()):
         other_field_values = {field: getattr(instance, field) for field in other_fields}
 
         opposite_objects = sender.objects.filter(**relation_fields_swapped)
-        if not opposite_objects.exists():
-            sender.objects.create(**{**relation_fields_swapped, **other_field_values})
-            return
+        with suppress_relation_signals():
+            if not opposite_objects.exists():
+                sender.objects.create(**{**relation_fields_swapped, **other_field_values})
+                return
 
-        sender.objects.filter(id=opposite_objects[0].id).update(**other_field_values)
+            sender.objects.filter(id=opposite_objects[0].id).update(**other_field_values)
 
-        # Delete superfluous objects
-        sender.objects.filter(id__in=opposite_objects[1:].values_list('id', flat=True)).delete()
+            # Delete superfluous objects
+            sender.objects.filter(id__in=opposite_objects[1:].values_list('id', flat=True)).delete()
 
     return post_save_relation
 
@@ -35,56 +68,72 @@ def post_delete_relation_creator(sender, relation_fields):
     @receiver(post_delete, sender=sender)
     def post_delete_relation(sender, instance, **kwargs):
         """Delete the symmetrical relation"""
+        if relation_signals_suppressed.get():
+            return
         relation_fields_swapped = {
             relation_fields[0]: getattr(instance, relation_fields[1]),
             relation_fields[1]: getattr(instance, relation_fields[0]),
         }
-        sender.objects.filter(**relation_fields_swapped).delete()
+        with suppress_relation_signals():
+            sender.objects.filter(**relation_fields_swapped).delete()
 
     return post_delete_relation
 
 
-def copy_reverse_many_to_many_objects(base_obj, other_obj, many_to_many_fields, reverse_field_name, calling_function):
-    """
-    Takes the many-to-many objects from base_obj en adds the reverse of those objects to the other_obj.
-    """
-    # Prevent recursively calling m2m_changed signal
-    calling_function = globals()[calling_function]
-    m2m_changed.disconnect(calling_function, sender=PersonPersonRelation.types.through)
-
-    for field in many_to_many_fields:
-        base_m2m_objects = getattr(base_obj, field).all()
-        other_m2m_relation = getattr(other_obj, field)
-        other_m2m_relation.clear()
-        for base_m2m_object in base_m2m_objects:
-            reverse_obj = getattr(base_m2m_object, reverse_field_name)
-            other_m2m_relation.add(reverse_obj)
-
-    m2m_changed.connect(calling_function, sender=PersonPersonRelation.types.through)
-
-
 def m2m_changed_relation_creator(sender, relation_fields, relation_type_fields, m2m_relation_name, reverse_field_name='reverse'):
+    relation_field, type_field = (f'{field}_id' for field in relation_type_fields)
+
     @receiver(m2m_changed, sender=sender)
-    def m2m_changed_relation(sender, instance, **kwargs):
-        relation_fields_swapped = {
-            relation_fields[0]: getattr(instance, relation_fields[1]),
-            relation_fields[1]: getattr(instance, relation_fields[0]),
-        }
-        reverse = instance._meta.model.objects.get(**relation_fields_swapped)
-        sender.objects.filter(**{relation_type_fields[0]: reverse}).delete()
-        types_for_reverse = []
-        for type in getattr(instance, m2m_relation_name).all():
-            reverse_type = getattr(type, reverse_field_name)
-            relation_type = reverse_type if reverse_type else type
-            types_for_reverse.append(sender(**{relation_type_fields[0]: reverse,
-                                               relation_type_fields[1]: relation_type}))
-        sender.objects.bulk_create(types_for_reverse)
+    def m2m_changed_relation(sender, instance, action, reverse, model, pk_set, **kwargs):
+        """Apply the added/removed types of a relation to the symmetrical relation"""
+        if relation_signals_suppressed.get():
+            return
+        if reverse and action == 'pre_clear':
+            # post_clear has no pk_set, so remember the relations that are about to lose this type
+            instance._cleared_relation_ids = list(sender.objects.filter(**{type_field: instance.pk})
+                                                  .values_list(relation_field, flat=True))
+            return
+        if action not in ('post_add', 'post_remove', 'post_clear'):
+            return
+
+        if reverse:
+            # `instance` is a type, `pk_set` holds the relations it was added to or removed from
+            relation_model = model
+            relation_ids = instance.__dict__.pop('_cleared_relation_ids', []) if action == 'post_clear' else pk_set
+            reverse_type_ids = {getattr(instance, f'{reverse_field_name}_id') or instance.pk}
+            swapped_pairs = relation_model.objects.filter(pk__in=relation_ids).values_list(
+                f'{relation_fields[1]}_id', f'{relation_fields[0]}_id')
+        else:
+            relation_model = instance._meta.model
+            swapped_pairs = [(getattr(instance, f'{relation_fields[1]}_id'),
+                              getattr(instance, f'{relation_fields[0]}_id'))]
+            reverse_type_ids = None
+            if action != 'post_clear':
+                reverse_type_ids = {reverse_id or type_id for type_id, reverse_id in
+                                    model.objects.filter(pk__in=pk_set).values_list('pk', reverse_field_name)}
+
+        swapped_filter = models.Q()
+        for from_id, to_id in swapped_pairs:
+            swapped_filter |= models.Q(**{f'{relation_fields[0]}_id': from_id, f'{relation_fields[1]}_id': to_id})
+        if not swapped_filter:
+            return
+        reverse_relation_ids = relation_model.objects.filter(swapped_filter).values_list('pk', flat=True)
+
+        if action == 'post_add':
+            sender.objects.bulk_create([sender(**{relation_field: relation_id, type_field: type_id})
+                                        for relation_id in reverse_relation_ids for type_id in reverse_type_ids],
+                                       ignore_conflicts=True)
+        else:
+            reverse_types = sender.objects.filter(**{f'{relation_field}__in': reverse_relation_ids})
+            if reverse_type_ids is not None:
+                reverse_types = reverse_types.filter(**{f'{type_field}__in': reverse_type_ids})
+            reverse_types.delete()
 
     return m2m_changed_relation
 
 
 class Wikidata(models.Model):
-    wikidata_id = models.CharField(max_length=256, blank=True)
+    wikidata_id = models.CharField(max_length=256, blank=True, db_index=True)
 
     class Meta:
         abstract = True
@@ -93,10 +142,23 @@ class Wikidata(models.Model):
 class GeoLocation(models.Model):
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True, editable=False)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True, editable=False)
+    # Kept from the coordinates, see luchtmans.geo; every child model indexes it with the coordinates
+    geohash = models.CharField(max_length=12, blank=True, editable=False)
+    # A digest of the names the coordinates were matched on, see luchtmans.geocoding
+    geocoded_input = models.CharField(max_length=32, blank=True, editable=False)
+
+    objects = GeoQuerySet.as_manager()
 
     class Meta:
         abstract = True
 
+    def save(self, *args, **kwargs):
+        self.geohash = geohash(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
+
 
 class UniqueNameModel(models.Model):
     name = models.CharField(_("name"), max_length=256, unique=True)
@@ -108,6 +170,60 @@ class UniqueNameModel(models.Model):
         return self.name
 
 
+class SearchNameModel(models.Model):
+    """Keeps a normalized copy of the names of an object in search_name, for the autocomplete views."""
+    search_name = models.CharField(max_length=1024, blank=True, editable=False, db_index=True)
+
+    class Meta:
+        abstract = True
+
+    def get_search_names(self):
+        """Return the names to search the object by; subclasses without a single name field must override this."""
+        return [self.name]
+
+    def get_search_name(self):
+        return normalize_name(*self.get_search_names())[:1024]
+
+    def save(self, *args, **kwargs):
+        self.search_name = self.get_search_name()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'search_name'}
+        super().save(*args, **kwargs)
+
+
+class SearchVectorModel(models.Model):
+    """Keeps a full-text search vector of search_vector_fields in search_vector, see luchtmans.search."""
+    search_vector = SearchVectorField(null=True, editable=False)
+    search_vector_fields = ()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_search_vectors(type(self)._default_manager.filter(pk=self.pk))
+
+
+class NormalizedSpellingModel(models.Model):
+    """Keeps a spelling-normalized copy of spelling_fields in normalized_text, see luchtmans.spelling."""
+    normalized_text = models.TextField(blank=True, editable=False)
+    spelling_fields = ()
+
+    class Meta:
+        abstract = True
+
+    def get_normalized_text(self):
+        return normalize_spelling(*[getattr(self, field) for field in self.spelling_fields])
+
+    def save(self, *args, **kwargs):
+        self.normalized_text = self.get_normalized_text()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'normalized_text'}
+        super().save(*args, **kwargs)
+
+
 # # # END Helper classes and functions # # #
 
 
@@ -118,12 +234,13 @@ class Country(Wikidata, GeoLocation):
         verbose_name = _("country")
         verbose_name_plural = _("countries")
         ordering = ['name']
+        indexes = [models.Index(fields=['geohash', 'latitude', 'longitude'], name='country_geohash')]
 
     def __str__(self):
         return self.name
 
 
-class Place(Wikidata, GeoLocation):
+class Place(Wikidata, GeoLocation, SearchNameModel):
     name = models.CharField(_("name"), max_length=256)
     country = models.ForeignKey(Country, models.PROTECT)
 
@@ -131,12 +248,17 @@ class Place(Wikidata, GeoLocation):
         verbose_name = _("place")
         verbose_name_plural = _("places")
         ordering = ['name']
+        indexes = [models.Index(fields=['geohash', 'latitude', 'longitude'], name='place_geohash')]
 
     def __str__(self):
         return self.name
 
+    def get_search_names(self):
+        # The name in every language, added by modeltranslation
+        return [getattr(self, field.name) for field in self._meta.fields if field.name.startswith('name')]
+
 
-class Street(models.Model):
+class Street(SearchNameModel):
     name = models.CharField(_("name"), max_length=1024)
     place = models.ForeignKey(Place, models.PROTECT)
 
@@ -147,8 +269,19 @@ class Street(models.Model):
     def __str__(self):
         return f'{self.name}'
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # The street name is part of the search names of its addresses, which are written in one query without signals
+        addresses = list(self.address_set.only('pk', 'house_number', 'streetname_old', 'description'))
+        for address in addresses:
+            address.street = self
+            address.search_name = address.get_search_name()
+        if addresses:
+            Address.objects.bulk_update(addresses, ['search_name'])
+            transaction.on_commit(lambda: bump_version(Address))
 
-class Address(Wikidata, GeoLocation):
+
+class Address(Wikidata, GeoLocation, SearchNameModel):
     description = models.CharField(_("description"), max_length=256, default='')
     streetname_old = models.CharField(_("old street name"), max_length=256, blank=True)
     house_number = models.CharField(_("house number"), max_length=256)
@@ -157,10 +290,14 @@ class Address(Wikidata, GeoLocation):
     class Meta:
         verbose_name = _("address")
         verbose_name_plural = _("addresses")
+        indexes = [models.Index(fields=['geohash', 'latitude', 'longitude'], name='address_geohash')]
 
     def __str__(self):
         return f'{self.street} {self.house_number}, {self.street.place}'
 
+    def get_search_names(self):
+        return [self.street.name, self.house_number, self.streetname_old, self.description]
+
 
 class Religion(models.Model):
     name = models.CharField(_("name"), max_length=255, unique=True)
@@ -174,7 +311,17 @@ class Religion(models.Model):
         return self.name
 
 
-class Person(Wikidata):
+class PersonQuerySet(models.QuerySet):
+    def alive_in(self, start, end=None):
+        """
+        Persons that may have been alive at some time in the years start to end (or only in start). Persons without
+        any parsed date of birth or death are left out.
+        """
+        return self.filter(alive_from__lte=date(start if end is None else end, 12, 31),
+                           alive_until__gte=date(start, 1, 1))
+
+
+class Person(Wikidata, SearchNameModel, SearchVectorModel):
     """Represents a person."""
 
     class GenderChoices(models.TextChoices):
@@ -189,6 +336,15 @@ class Person(Wikidata):
     first_names = models.CharField(_("first names"), max_length=256, blank=True)
     date_of_birth = models.CharField(_("date of birth"), max_length=50, blank=True)
     date_of_death = models.CharField(_("date of death"), max_length=50, blank=True)
+    # Parsed from date_of_birth and date_of_death on save, see luchtmans.dates
+    birth_earliest = models.DateField(_("earliest date of birth"), null=True, editable=False)
+    birth_latest = models.DateField(_("latest date of birth"), null=True, editable=False)
+    birth_uncertain = models.BooleanField(_("date of birth is uncertain"), default=False, editable=False)
+    death_earliest = models.DateField(_("earliest date of death"), null=True, editable=False)
+    death_latest = models.DateField(_("latest date of death"), null=True, editable=False)
+    death_uncertain = models.BooleanField(_("date of death is uncertain"), default=False, editable=False)
+    alive_from = models.DateField(_("alive from"), null=True, editable=False)
+    alive_until = models.DateField(_("alive until"), null=True, editable=False)
     sex = models.CharField(_("sex"), max_length=1, choices=GenderChoices.choices, blank=True)
     place_of_birth = models.ForeignKey(Place, models.PROTECT, blank=True, null=True, related_name="birthplace_of")
     place_of_death = models.ForeignKey(Place, models.PROTECT, blank=True, null=True, related_name="deathplace_of")
@@ -205,13 +361,41 @@ class Person(Wikidata):
         verbose_name=_("religious affiliation")
     )
 
+    search_vector_fields = (('short_name', 'A'), ('surname', 'A'), ('first_names', 'B'))
+    date_fields = ['birth_earliest', 'birth_latest', 'birth_uncertain',
+                   'death_earliest', 'death_latest', 'death_uncertain', 'alive_from', 'alive_until']
+
+    objects = PersonQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("person")
         verbose_name_plural = _("persons")
+        indexes = [
+            models.Index(fields=['birth_earliest']),
+            models.Index(fields=['death_latest']),
+            models.Index(fields=['alive_from', 'alive_until']),
+            models.Index(fields=['alive_until']),
+        ]
 
     def __str__(self):
         return self.short_name
 
+    def get_search_names(self):
+        return [self.short_name, self.first_names, self.surname]
+
+    def parse_dates(self):
+        birth, death = parse_date(self.date_of_birth), parse_date(self.date_of_death)
+        self.birth_earliest, self.birth_latest, self.birth_uncertain = birth
+        self.death_earliest, self.death_latest, self.death_uncertain = death
+        self.alive_from, self.alive_until = lifespan(birth, death)
+
+    def save(self, *args, **kwargs):
+        self.parse_dates()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, *self.date_fields}
+        super().save(*args, **kwargs)
+
 
 class RelationType(models.Model):
     text = models.CharField(_("text"), max_length=255, unique=True)
@@ -264,9 +448,21 @@ class PeriodOfResidence(models.Model):
     start_year = models.IntegerField(_("start year"), blank=True, null=True)
     end_year = models.IntegerField(_("end year"), blank=True, null=True)
 
+    interval = Interval('start_year', 'end_year')
+    objects = IntervalQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("period of residence")
         verbose_name_plural = _("periods of residence")
+        indexes = [
+            models.Index(fields=['start_year', 'end_year']),
+            models.Index(fields=['end_year']),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(start_year__lte=models.F('end_year'))
+                                   | models.Q(start_year__isnull=True) | models.Q(end_year__isnull=True),
+                                   name='periodofresidence_start_year_before_end_year'),
+        ]
 
     def __str__(self):
         from_string = f" from {self.start_year}" if self.start_year else ""
@@ -281,6 +477,20 @@ class PersonReligion(models.Model):
     start_year = models.IntegerField(_("start year"), blank=True, null=True)
     end_year = models.IntegerField(_("end year"), blank=True, null=True)
 
+    interval = Interval('start_year', 'end_year')
+    objects = IntervalQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['start_year', 'end_year']),
+            models.Index(fields=['end_year']),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(start_year__lte=models.F('end_year'))
+                                   | models.Q(start_year__isnull=True) | models.Q(end_year__isnull=True),
+                                   name='personreligion_start_year_before_end_year'),
+        ]
+
     def __str__(self):
         return f'{self.person.short_name} was {self.religion.name.lower()}'
 
@@ -299,7 +509,7 @@ class GenreParisianCategory(UniqueNameModel):
         verbose_name_plural = _("genre Parisian categories")
 
 
-class Work(Wikidata, models.Model):
+class Work(Wikidata, SearchVectorModel):
     authors = models.ManyToManyField(
         Person,
         through="PersonWorkRelation",
@@ -318,6 +528,8 @@ class Work(Wikidata, models.Model):
                                                 verbose_name=_("genre Parisian category"))
     notes = models.TextField(_("notes"), blank=True)
 
+    search_vector_fields = (('title', 'A'),)
+
     class Meta:
         verbose_name = _("work")
         verbose_name_plural = _("works")
@@ -357,7 +569,7 @@ class STCNGenre(UniqueNameModel):
         verbose_name_plural = _("STCN genres")
 
 
-class Edition(models.Model):
+class Edition(NormalizedSpellingModel, SearchVectorModel):
     stcn_id = models.CharField(_("STCN identifier"), max_length=256, blank=True)
     persons = models.ManyToManyField(
         Person,
@@ -390,9 +602,27 @@ class Edition(models.Model):
     short_title = models.CharField(_("short title"), max_length=256)
     work = models.ForeignKey(Work, on_delete=models.PROTECT, verbose_name=_("work"))
 
+    search_vector_fields = (('title', 'A'), ('short_title', 'A'))
+    spelling_fields = ('title', 'short_title')
+
+    # Without an end year the edition was published in the start year
+    interval = Interval('year_of_publication_start', 'year_of_publication_end', open_ended=False)
+    objects = IntervalQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("edition")
         verbose_name_plural = _("editions")
+        indexes = [
+            models.Index(fields=['year_of_publication_start', 'year_of_publication_end']),
+            models.Index(fields=['year_of_publication_end']),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(year_of_publication_start__lte=models.F('year_of_publication_end'))
+                | models.Q(year_of_publication_start__isnull=True) | models.Q(year_of_publication_end__isnull=True),
+                name='edition_start_year_before_end_year',
+            ),
+        ]
 
     def __str__(self):
         return self.short_title
@@ -418,16 +648,21 @@ class PersonEditionRelation(models.Model):
         return _('{person} is {role} of {edition}').format(person=self.person, role=self.role, edition=self.edition)
 
 
-class Collection(models.Model):
+class Collection(SearchVectorModel):
     short_title = models.CharField(_("short title"), max_length=256)
     all_headers = models.TextField(_("all headers"), blank=True)
     client = models.OneToOneField(Person, related_name="collection", on_delete=models.PROTECT, verbose_name=_("client"))
     notes = models.TextField(_("notes"), blank=True)
 
+    search_vector_fields = (('short_title', 'A'), ('all_headers', 'B'))
+
     class Meta:
         verbose_name = _("collection")
         verbose_name_plural = _("collections")
 
+    def __str__(self):
+        return self.short_title
+
 
 class ItemType(UniqueNameModel):
 
@@ -459,7 +694,7 @@ class Binding(UniqueNameModel):
         verbose_name_plural = _("bindings")
 
 
-class Item(models.Model):
+class Item(NormalizedSpellingModel, SearchVectorModel):
     collection = models.ForeignKey(Collection, on_delete=models.PROTECT, verbose_name=_("collection"))
     transcription_full = models.CharField(_("full transcription"), max_length=256)
     type = models.ForeignKey(ItemType, on_delete=models.PROTECT, verbose_name=_("type"))
@@ -475,10 +710,213 @@ class Item(models.Model):
     binding = models.ManyToManyField(Binding, blank=True, verbose_name=_("bindings"))
     languages = models.ManyToManyField(Language, blank=True, verbose_name=_("languages"))
     price = models.CharField(_("price"), max_length=20, blank=True)
-    price_decimal = models.DecimalField(_("decimal price"), max_digits=20, decimal_places=2, blank=True)
+    # Parsed from price on save if left empty or if only price changed, see luchtmans.prices
+    price_decimal = models.DecimalField(_("decimal price"), max_digits=20, decimal_places=2, blank=True, null=True)
+    price_needs_review = models.BooleanField(_("price needs review"), default=False, editable=False)
     notes = models.TextField(_("notes"), blank=True)
     work_in_progress = models.BooleanField(_("work in progress"))
 
+    search_vector_fields = (('transcription_full', 'A'),)
+    spelling_fields = ('transcription_full',)
+    price_fields = ['price_decimal', 'price_needs_review']
+
     class Meta:
         verbose_name = _("item")
         verbose_name_plural = _("items")
+        indexes = [
+            models.Index(fields=['price_needs_review'], condition=models.Q(price_needs_review=True),
+                         name='item_price_needs_review'),
+        ]
+
+    def __str__(self):
+        return self.transcription_full
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_price()
+        return instance
+
+    def remember_price(self):
+        # The stored price and decimal price, to tell a changed price from a decimal price that an editor entered
+        self._stored_price = self.__dict__.get('price'), self.__dict__.get('price_decimal')
+
+    def parse_price(self):
+        """
+        Parse price_decimal from price if it is empty, or if price changed since the item was loaded and
+        price_decimal did not; a price that cannot be parsed is flagged for review.
+        """
+        stored_price, stored_decimal = getattr(self, '_stored_price', (None, None))
+        price_changed = (stored_price is not None and self.price_decimal == stored_decimal
+                         and self.price != stored_price)
+        unparseable = False
+        if self.price_decimal is None or price_changed:
+            self.price_decimal, unparseable = parse_price(self.price)
+        self.price_needs_review = unparseable
+
+    def save(self, *args, **kwargs):
+        self.parse_price()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, *self.price_fields}
+        super().save(*args, **kwargs)
+        self.remember_price()
+
+
+# Precomputed purchase statistics, maintained by luchtmans.copurchases
+
+
+class CollectionEdition(models.Model):
+    """The collection x edition matrix: how many items of a collection are copies of an edition."""
+    collection = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name='+', verbose_name=_("collection"))
+    edition = models.ForeignKey(Edition, on_delete=models.CASCADE, related_name='+', verbose_name=_("edition"))
+    items = models.PositiveIntegerField(_("items"))
+
+    class Meta:
+        verbose_name = _("collection edition")
+        verbose_name_plural = _("collection editions")
+        unique_together = ['collection', 'edition']
+        indexes = [models.Index(fields=['edition', 'collection'])]
+
+
+class EditionCoPurchase(models.Model):
+    """The editions most often bought by the clients who bought an edition."""
+    edition = models.ForeignKey(Edition, on_delete=models.CASCADE, related_name='+', verbose_name=_("edition"))
+    other = models.ForeignKey(Edition, on_delete=models.CASCADE, related_name='+', verbose_name=_("other edition"))
+    collections = models.PositiveIntegerField(_("collections"))
+
+    class Meta:
+        verbose_name = _("edition co-purchase")
+        verbose_name_plural = _("edition co-purchases")
+        unique_together = ['edition', 'other']
+        indexes = [models.Index(fields=['edition', '-collections'])]
+
+
+class CollectionSimilarity(models.Model):
+    """The collections with the most editions in common with a collection, relative to their size (Jaccard)."""
+    collection = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name='+',
+                                   verbose_name=_("collection"))
+    other = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name='+',
+                              verbose_name=_("other collection"))
+    editions = models.PositiveIntegerField(_("editions in common"))
+    similarity = models.FloatField(_("similarity"))
+
+    class Meta:
+        verbose_name = _("collection similarity")
+        verbose_name_plural = _("collection similarities")
+        unique_together = ['collection', 'other']
+        indexes = [models.Index(fields=['collection', '-similarity'])]
+
+
+class PriceAggregate(models.Model):
+    """Price statistics of the items of an edition, a genre, a year or a client, see luchtmans.analytics."""
+
+    class Dimension(models.TextChoices):
+        EDITION = 'edition', _("edition")
+        STCN_GENRE = 'stcn_genre', _("STCN genre")
+        GENRE_PARISIAN_CATEGORY = 'genre_parisian_category', _("genre (Parisian category)")
+        YEAR = 'year', _("year")
+        CLIENT = 'client', _("client")
+
+    dimension = models.CharField(_("dimension"), max_length=30, choices=Dimension.choices)
+    # The id of the edition, genre or client, or the year
+    key = models.BigIntegerField(_("key"))
+    items = models.PositiveIntegerField(_("items"))
+    copies = models.PositiveIntegerField(_("copies"))
+    priced_items = models.PositiveIntegerField(_("items with a price"))
+    total = models.DecimalField(_("total"), max_digits=14, decimal_places=2)
+    mean = models.DecimalField(_("mean"), max_digits=10, decimal_places=2, null=True)
+    minimum = models.DecimalField(_("minimum"), max_digits=10, decimal_places=2, null=True)
+    p25 = models.DecimalField(_("25th percentile"), max_digits=10, decimal_places=2, null=True)
+    median = models.DecimalField(_("median"), max_digits=10, decimal_places=2, null=True)
+    p75 = models.DecimalField(_("75th percentile"), max_digits=10, decimal_places=2, null=True)
+    p90 = models.DecimalField(_("90th percentile"), max_digits=10, decimal_places=2, null=True)
+    maximum = models.DecimalField(_("maximum"), max_digits=10, decimal_places=2, null=True)
+    # Set when items changed that count under a key too large to recompute right away
+    stale = models.BooleanField(_("stale"), default=False)
+
+    class Meta:
+        verbose_name = _("price aggregate")
+        verbose_name_plural = _("price aggregates")
+        unique_together = ['dimension', 'key']
+        indexes = [
+            models.Index(fields=['dimension', '-items']),
+            models.Index(fields=['stale'], condition=models.Q(stale=True), name='price_aggregate_stale'),
+        ]
+
+
+# Denormalized ledger lines, maintained by luchtmans.entries
+
+
+class LedgerEntry(models.Model):
+    """
+    An item as a flat ledger line, with the labels of its collection, client, page, editions and works copied in, so
+    ledger lines can be listed and exported from one table. The item type, bindings and languages are kept as ids,
+    because their names are translated.
+    """
+    item = models.OneToOneField(Item, primary_key=True, on_delete=models.CASCADE, related_name='ledger_entry',
+                                verbose_name=_("item"))
+    collection = models.ForeignKey(Collection, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+',
+                                   verbose_name=_("collection"))
+    collection_title = models.CharField(_("collection"), max_length=256)
+    client = models.ForeignKey(Person, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+',
+                               verbose_name=_("client"))
+    client_name = models.CharField(_("client"), max_length=256)
+    volume = models.IntegerField(_("volume"))
+    folio = models.CharField(_("folio"), max_length=256)
+    recto_verso = models.CharField(_("recto or verso"), max_length=1)
+    type = models.ForeignKey(ItemType, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+',
+                             verbose_name=_("type"))
+    transcription_full = models.CharField(_("full transcription"), max_length=256)
+    non_book = models.BooleanField(_("non book"))
+    transcription_incomplete = models.BooleanField(_("transcription is incomplete"))
+    date = models.DateField(_("date"), null=True)
+    date_paid = models.DateField(_("date_paid"), null=True)
+    edition_uncertain = models.BooleanField(_("edition is uncertain"))
+    volumes = models.CharField(_("volumes"), max_length=10)
+    number_of_copies = models.CharField(_("number of copies"), max_length=10)
+    price = models.CharField(_("price"), max_length=20)
+    price_decimal = models.DecimalField(_("decimal price"), max_digits=20, decimal_places=2, null=True)
+    notes = models.TextField(_("notes"))
+    work_in_progress = models.BooleanField(_("work in progress"))
+    edition_ids = models.JSONField(_("editions"), default=list)
+    edition_titles = models.JSONField(_("edition titles"), default=list)
+    work_titles = models.JSONField(_("work titles"), default=list)
+    binding_ids = models.JSONField(_("bindings"), default=list)
+    language_ids = models.JSONField(_("languages"), default=list)
+
+    class Meta:
+        verbose_name = _("ledger entry")
+        verbose_name_plural = _("ledger entries")
+        indexes = [
+            models.Index(fields=['volume', 'folio', 'recto_verso']),
+            models.Index(fields=['collection', 'date']),
+            models.Index(fields=['date']),
+        ]
+
+    def __str__(self):
+        return self.transcription_full
+
+
+# Map clusters of the residences of clients, maintained by luchtmans.clusters
+
+
+class ResidenceCluster(models.Model):
+    """
+    The clients who lived in a cell of the map grid of a zoom level during a decade, with the mean of their
+    coordinates, see luchtmans.clusters.
+    """
+    zoom = models.PositiveSmallIntegerField(_("zoom level"))
+    # The first year of the decade
+    decade = models.SmallIntegerField(_("decade"))
+    # The column and row of the cell, from the west and the north
+    x = models.PositiveIntegerField()
+    y = models.PositiveIntegerField()
+    clients = models.PositiveIntegerField(_("clients"))
+    latitude = models.FloatField(_("latitude"))
+    longitude = models.FloatField(_("longitude"))
+
+    class Meta:
+        verbose_name = _("residence cluster")
+        verbose_name_plural = _("residence clusters")
+        unique_together = ['zoom', 'decade', 'x', 'y']
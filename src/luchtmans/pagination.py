@@ -0,0 +1,55 @@
+"""
+Counting and paging through tables with millions of rows.
+
+COUNT(*) reads the whole table or index, so on large changelists the count is taken from the query planner instead:
+EXPLAIN on PostgreSQL, and for unfiltered querysets the statistics of ANALYZE on SQLite. Small estimates are replaced
+by an exact count, which is cheap there and more useful than an estimate.
+"""
+import json
+
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
+
+# Below this estimate, rows are counted
+EXACT_COUNT_BELOW = 10_000
+
+
+def estimated_count(queryset):
+    """Return the number of rows of the queryset as estimated by the database, or None if it has no estimate."""
+    queryset = queryset.order_by()
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]['Plan']['Plan Rows']
+    if connection.vendor == 'sqlite' and not queryset.query.where:
+        if 'sqlite_stat1' not in connection.introspection.table_names(include_views=False):
+            return None
+        with connection.cursor() as cursor:
+            # The first number of the statistics of an index is the number of rows in it; partial indexes have fewer
+            cursor.execute('SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s',
+                           [queryset.model._meta.db_table])
+            return cursor.fetchone()[0]
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """A Paginator that estimates the count of large querysets, unless `exact`. `estimated` tells which it did."""
+
+    def __init__(self, *args, exact=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.exact = exact
+        self.estimated = False
+
+    @cached_property
+    def count(self):
+        if not self.exact:
+            estimate = estimated_count(self.object_list)
+            if estimate is not None and estimate >= EXACT_COUNT_BELOW:
+                self.estimated = True
+                return estimate
+        return super().count
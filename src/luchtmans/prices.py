@@ -0,0 +1,132 @@
+"""
+Parsing of the prices in the ledgers, in guilders, stuivers and penningen.
+
+One guilder is 20 stuivers and one stuiver is 16 penningen. The prices are transcribed as found, in notations like:
+
+    3-4-8, f 3:4:8, ƒ 3.4.8     3 guilders, 4 stuivers and 8 penningen
+    -15, - : 15, 0-15           15 stuivers
+    3-, f 3, 3                  3 guilders
+    3 gl 4 st 8 p, 12 st, 8 d   labelled amounts; d (denarius) is a penning
+    3-4½                        4½ stuivers; ½, ¼ and ¾ may follow any amount
+    3,50                        decimal guilders
+    gratis, nihil               nothing
+
+parse_prices() converts a batch of such texts to decimal guilders, rounded to cents. The ledgers repeat the same few
+thousand notations over and over, so every distinct text is parsed once and the amounts are mapped back onto the batch
+with NumPy. Amounts are counted in UNITS per guilder, in which both a quarter penning and a cent are whole numbers.
+"""
+import re
+from decimal import Decimal
+
+import numpy as np
+
+STUIVERS_PER_GUILDER = 20
+PENNINGEN_PER_STUIVER = 16
+UNITS = 6400
+CENT = UNITS // 100
+
+UNIT_NAMES = {
+    'guilder': ('guldens', 'gulden', 'gld', 'gl', 'fl', 'f', 'ƒ', 'g'),
+    'stuiver': ('stuivers', 'stuiver', 'stuyvers', 'stuyver', 'st', 's'),
+    'penning': ('penningen', 'penning', 'penn', 'pen', 'p', 'd'),
+}
+UNIT_VALUES = {
+    'guilder': UNITS,
+    'stuiver': UNITS // STUIVERS_PER_GUILDER,
+    'penning': UNITS // STUIVERS_PER_GUILDER // PENNINGEN_PER_STUIVER,
+}
+FREE = {'gratis', 'nihil', 'niets', 'free'}
+FRACTIONS = {'½': '1/2', '¼': '1/4', '¾': '3/4'}
+
+NUMBER = r'\d+(?:\s*[13]/[24])?|[13]/[24]'
+CURRENCY = re.compile(r'^(?:ƒ|fl?)\.?\s*(?=[\d-])')
+POSITIONAL = re.compile(
+    rf'^(?P<guilder>{NUMBER}|-)?\s*[-:.]\s*(?P<stuiver>{NUMBER}|-)?(?:\s*[-:.]\s*(?P<penning>{NUMBER}|-)?)?$'
+)
+WHOLE = re.compile(rf'^(?P<guilder>{NUMBER})$')
+LABELLED = re.compile(rf'({NUMBER})\s*({"|".join(name for names in UNIT_NAMES.values() for name in names)})\b\.?'
+                      r'(?:\s*,?\s*(?:en\s+)?)')
+DECIMAL = re.compile(r'^(\d+),(\d{1,2})$')
+
+# Results of parse_units() that are not amounts
+EMPTY = -1
+UNPARSEABLE = -2
+
+
+def number_units(number, unit):
+    """Convert a number like '4', '4 1/2' or '3/4' of a unit to UNITS, or None if that is not a whole number."""
+    number = number.replace(' ', '')
+    whole, fraction = (number[:-3], number[-3:]) if '/' in number else (number, '')
+    units = int(whole or 0) * UNIT_VALUES[unit]
+    if fraction:
+        numerator, denominator = map(int, fraction.split('/'))
+        units += numerator * UNIT_VALUES[unit] / denominator
+    return int(units) if units == int(units) else None
+
+
+def positional_amounts(text):
+    """Return {unit: number} for a positional price like 3-4-8 or f 3, or None."""
+    text = CURRENCY.sub('', text)
+    match = WHOLE.match(text) or POSITIONAL.match(text)
+    if not match or not any(match.groupdict().values()):
+        return None
+    return {unit: number for unit, number in match.groupdict().items() if number and number != '-'}
+
+
+def labelled_amounts(text):
+    """Return {unit: number} for a price with units like 3 gl 4 st, or None."""
+    amounts = {}
+    position = 0
+    for match in LABELLED.finditer(text):
+        unit = next(unit for unit, names in UNIT_NAMES.items() if match[2] in names)
+        if match.start() != position or unit in amounts:
+            return None
+        amounts[unit] = match[1]
+        position = match.end()
+    return amounts if amounts and position == len(text) else None
+
+
+def parse_units(text):
+    """Parse a single price into UNITS, EMPTY or UNPARSEABLE."""
+    text = ' '.join((text or '').split()).casefold()
+    for character, fraction in FRACTIONS.items():
+        text = text.replace(character, f' {fraction}')
+    text = text.strip(' .;')
+    if not text:
+        return EMPTY
+    if text in FREE:
+        return 0
+    if match := DECIMAL.match(text):
+        return int(match[1]) * UNITS + int(match[2].ljust(2, '0')) * CENT
+
+    if (amounts := positional_amounts(text)) is not None:
+        # Without labels, 20 stuivers or 16 penningen are more likely a misreading than a notation
+        limits = {'stuiver': UNIT_VALUES['guilder'], 'penning': UNIT_VALUES['stuiver']}
+    elif (amounts := labelled_amounts(text)) is not None:
+        limits = {}
+    else:
+        return UNPARSEABLE
+    units = {unit: number_units(number, unit) for unit, number in amounts.items()}
+    if None in units.values() or any(units.get(unit, 0) >= limit for unit, limit in limits.items()):
+        return UNPARSEABLE
+    return sum(units.values())
+
+
+def parse_prices(texts):
+    """
+    Parse a batch of prices. Return a list with the price in guilders as a Decimal, or None for empty and unparseable
+    prices, and a boolean array that is True for the unparseable ones.
+    """
+    texts = np.array([text or '' for text in texts], dtype=str)
+    distinct, inverse = np.unique(texts, return_inverse=True)
+    units = np.array([parse_units(text) for text in distinct], dtype=np.int64)
+    # Round half up to cents, and make Decimals once per distinct text
+    cents = (units + CENT // 2) // CENT
+    decimals = [Decimal(int(cent)).scaleb(-2) if unit >= 0 else None for unit, cent in zip(units, cents)]
+    return [decimals[index] for index in inverse.tolist()], units[inverse] == UNPARSEABLE
+
+
+def parse_price(text):
+    """Parse a single price into (Decimal or None, unparseable)."""
+    decimals, unparseable = parse_prices([text])
+    return decimals[0], bool(unparseable[0])
@@ -0,0 +1,70 @@
+from collections import namedtuple
+from itertools import batched
+
+from django.db import transaction
+
+from luchtmans.cache import bump_version
+from luchtmans.models import PersonPersonRelation, RelationType
+
+
+BulkRelationResult = namedtuple('BulkRelationResult', ['relations_created', 'types_created'])
+
+
+def existing_relation_ids(pairs, batch_size=1000):
+    """Return a dict mapping the (from_person_id, to_person_id) pairs that already exist to their relation id."""
+    from_person_ids = {from_person_id for from_person_id, _ in pairs}
+    relation_ids = {}
+    for batch in batched(from_person_ids, batch_size):
+        relations = PersonPersonRelation.objects.filter(from_person_id__in=batch)
+        for relation_id, from_person_id, to_person_id in relations.values_list('id', 'from_person_id', 'to_person_id'):
+            if (from_person_id, to_person_id) in pairs:
+                relation_ids[(from_person_id, to_person_id)] = relation_id
+    return relation_ids
+
+
+def bulk_add_person_relations(edges, batch_size=1000):
+    """
+    Add PersonPersonRelations in bulk, with the same result as saving them one by one.
+
+    `edges` is an iterable of (from_person_id, to_person_id, relation_type_ids) tuples. For every edge the relation
+    and its reverse are created if they do not exist yet, the types are added to the relation and their reverse types
+    to the reverse relation. Relations and types that already exist are left alone. No signals are sent, the cache
+    versions of the relation tables are bumped after commit.
+    """
+    reverse_types = dict(RelationType.objects.values_list('id', 'reverse_id'))
+
+    pairs = set()
+    typed_pairs = set()
+    for from_person_id, to_person_id, type_ids in edges:
+        pairs.update([(from_person_id, to_person_id), (to_person_id, from_person_id)])
+        for type_id in type_ids:
+            if type_id not in reverse_types:
+                raise RelationType.DoesNotExist(f'RelationType with id {type_id} does not exist')
+            typed_pairs.add((from_person_id, to_person_id, type_id))
+            typed_pairs.add((to_person_id, from_person_id, reverse_types[type_id] or type_id))
+
+    through_model = PersonPersonRelation.types.through
+
+    with transaction.atomic():
+        relation_ids = existing_relation_ids(pairs, batch_size)
+        new_pairs = pairs - relation_ids.keys()
+        PersonPersonRelation.objects.bulk_create(
+            [PersonPersonRelation(from_person_id=from_id, to_person_id=to_id) for from_id, to_id in new_pairs],
+            batch_size=batch_size,
+        )
+        relation_ids.update(existing_relation_ids(new_pairs, batch_size))
+
+        wanted_types = {(relation_ids[(from_id, to_id)], type_id) for from_id, to_id, type_id in typed_pairs}
+        existing_types = set()
+        for batch in batched({relation_id for relation_id, _ in wanted_types}, batch_size):
+            existing_types.update(through_model.objects.filter(personpersonrelation_id__in=batch)
+                                  .values_list('personpersonrelation_id', 'relationtype_id'))
+        new_types = wanted_types - existing_types
+        through_model.objects.bulk_create(
+            [through_model(personpersonrelation_id=relation_id, relationtype_id=type_id)
+             for relation_id, type_id in new_types],
+            batch_size=batch_size,
+        )
+        transaction.on_commit(lambda: bump_version(PersonPersonRelation, through_model))
+
+    return BulkRelationResult(len(new_pairs), len(new_types))
@@ -0,0 +1,58 @@
+"""
+Full-text search.
+
+Models that inherit SearchVectorModel keep a tsvector of their `search_vector_fields` in `search_vector`, with a GIN
+index on PostgreSQL (see migration 0013). The vector is computed by the database on save. SQLite has no full-text
+types, so there the column stays empty and searches fall back to icontains over the same fields.
+"""
+import re
+from functools import reduce
+from operator import or_
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import Case, F, FloatField, Q, Value, When
+
+SEARCH_CONFIG = 'simple'
+WEIGHT_RANKS = {'A': 1.0, 'B': 0.4, 'C': 0.2, 'D': 0.1}
+
+
+def full_text_search_available():
+    return connection.vendor == 'postgresql'
+
+
+def search_vector(model):
+    return reduce(lambda left, right: left + right, [
+        SearchVector(field, weight=weight, config=SEARCH_CONFIG) for field, weight in model.search_vector_fields
+    ])
+
+
+def update_search_vectors(queryset):
+    """Recompute the search vectors of the objects in `queryset` with a single UPDATE."""
+    if full_text_search_available():
+        return queryset.update(search_vector=search_vector(queryset.model))
+    return 0
+
+
+def search(queryset, term):
+    """
+    Filter `queryset` on the words in `term` and annotate the matches with a search_rank, highest rank is the best
+    match. Every word has to occur, as a prefix of a word in the text, so searches also work while typing.
+    """
+    words = re.findall(r'\w+', term)
+    if not words:
+        return queryset.none()
+
+    if full_text_search_available():
+        query = SearchQuery(' & '.join(f"'{word}':*" for word in words), config=SEARCH_CONFIG, search_type='raw')
+        return queryset.filter(search_vector=query).annotate(search_rank=SearchRank(F('search_vector'), query))
+
+    # Every word has to occur in one of the fields; rank by the weight of the best matching field
+    fields = queryset.model.search_vector_fields
+    for word in words:
+        queryset = queryset.filter(reduce(or_, [Q(**{f'{field}__icontains': word}) for field, _ in fields]))
+    return queryset.annotate(search_rank=Case(
+        *[When(**{f'{field}__icontains': term, 'then': Value(WEIGHT_RANKS[weight])}) for field, weight in fields],
+        default=Value(0.0),
+        output_field=FloatField(),
+    ))
@@ -0,0 +1,49 @@
+from django.contrib import admin
+from django.contrib.admin.utils import NotRelationField, get_fields_from_path
+from django.contrib.admin.views.autocomplete import AutocompleteJsonView
+from django.core.exceptions import FieldDoesNotExist, PermissionDenied
+from django.http import HttpResponse
+
+from luchtmans.autocomplete import autocomplete
+from luchtmans.cache import get_or_compute, related_models
+from luchtmans.models import SearchNameModel
+
+
+class CachedAutocompleteJsonView(AutocompleteJsonView):
+    """
+    AutocompleteJsonView that caches its responses until one of the models it searches or displays changes. Models
+    with a search_name column are searched and ranked on that column instead of the admin's search_fields.
+    """
+
+    def get_queryset(self):
+        if not issubclass(self.model_admin.model, SearchNameModel):
+            return super().get_queryset()
+        queryset = self.model_admin.get_queryset(self.request)
+        queryset = queryset.complex_filter(self.source_field.get_limit_choices_to())
+        return autocomplete(queryset, self.term)
+
+    def get_search_models(self, request, model_admin):
+        search_models = related_models(model_admin.model)
+        for search_field in model_admin.get_search_fields(request):
+            try:
+                fields = get_fields_from_path(model_admin.model, search_field.lstrip('^=@'))
+            except (FieldDoesNotExist, NotRelationField):
+                continue
+            search_models.update(field.model for field in fields)
+        return search_models
+
+    def get(self, request, *args, **kwargs):
+        self.term, self.model_admin, self.source_field, to_field_name = self.process_request(request)
+        if not self.has_perm(request):
+            raise PermissionDenied
+
+        get_response = super().get
+        parts = [self.source_field.model._meta.label_lower, self.source_field.name, self.term, request.GET.get('page')]
+        content = get_or_compute('autocomplete', self.get_search_models(request, self.model_admin), parts,
+                                 lambda: get_response(request, *args, **kwargs).content)
+        return HttpResponse(content, content_type='application/json')
+
+
+class LuchtmansAdminSite(admin.AdminSite):
+    def autocomplete_view(self, request):
+        return CachedAutocompleteJsonView.as_view(admin_site=self)(request)
@@ -0,0 +1,58 @@
+"""
+Search that is tolerant of early-modern spelling variants.
+
+Models that inherit NormalizedSpellingModel keep a copy of their `spelling_fields` in `normalized_text`, folded by
+the rules in settings.SPELLING_RULES (ij and y, u and v, c and k, doubled letters and so on). Search terms are folded
+by the same rules, so 'Beschrijvinge van Leijden' and 'Beschryving van Leyden' end up the same text. On Postgres the
+column has a pg_trgm GIN index (see migration 0014), a trigram index that serves the substring filter below without
+scanning the table.
+
+The rules are applied in order, each as a regular expression substitution on lowercased words without accents. Run
+the build_spelling_index command after changing them.
+"""
+import re
+from functools import cache
+
+from django.conf import settings
+
+from luchtmans.autocomplete import fold_text
+
+DEFAULT_SPELLING_RULES = [
+    (r'ij', 'y'),
+    (r'v', 'u'),
+    (r'ph', 'f'),
+    (r'th', 't'),
+    (r'gh', 'g'),
+    (r'ck', 'k'),
+    (r'c(?![eihy])', 'k'),
+    (r'ae', 'a'),
+    (r'dt\b', 't'),
+    (r'(\w)\1+', r'\1'),
+]
+
+
+@cache
+def compile_rules(rules):
+    return [(re.compile(pattern), replacement) for pattern, replacement in rules]
+
+
+def spelling_rules():
+    return compile_rules(tuple(map(tuple, getattr(settings, 'SPELLING_RULES', DEFAULT_SPELLING_RULES))))
+
+
+def normalize_spelling(*texts):
+    """Fold the texts to one spelling: lowercase words without accents or punctuation, rewritten by the rules."""
+    text = ' '.join(re.findall(r'\w+', fold_text(*texts)))
+    for pattern, replacement in spelling_rules():
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def spelling_search(queryset, term):
+    """Filter `queryset` on the objects whose normalized text contains every word of `term`, in any spelling."""
+    words = normalize_spelling(term).split()
+    if not words:
+        return queryset.none()
+    for word in words:
+        queryset = queryset.filter(normalized_text__contains=word)
+    return queryset
@@ -0,0 +1,44 @@
+'use strict';
+// Load the values of the facet filters in the changelist sidebar when they are opened, see FacetListFilter in
+// luchtmans/admin.py, and search them as the user types.
+{
+    function load(facet, term) {
+        const url = new URL(facet.dataset.url, window.location.href);
+        if (term) {
+            url.searchParams.set('term', term);
+        }
+        fetch(url, {credentials: 'same-origin', headers: {Accept: 'application/json'}})
+            .then(response => response.json())
+            .then(data => {
+                facet.querySelector('.facet-values').replaceChildren(...data.results.map(result => {
+                    const item = document.createElement('li');
+                    const link = document.createElement('a');
+                    link.href = result.url;
+                    link.textContent = `${result.label} (${result.count})`;
+                    item.append(link);
+                    return item;
+                }));
+            });
+    }
+
+    window.addEventListener('load', () => {
+        for (const facet of document.querySelectorAll('.facet-filter')) {
+            const details = facet.closest('details');
+            let loaded = false;
+            const loadOnce = () => {
+                if (details.open && !loaded) {
+                    loaded = true;
+                    load(facet, '');
+                }
+            };
+            details.addEventListener('toggle', loadOnce);
+            loadOnce();
+
+            let timer;
+            facet.querySelector('input').addEventListener('input', event => {
+                clearTimeout(timer);
+                timer = setTimeout(() => load(facet, event.target.value), 250);
+            });
+        }
+    });
+}
@@ -1,3 +1,1578 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import shutil
+import tempfile
+import threading
+from datetime import date
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Q
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import translation
+from easyaudit.models import CRUDEvent
+
+from luchtmans.models import (Country, Place, Street, Address, Person, PersonPersonRelation, RelationType,
+                              PeriodOfResidence, Religion, PersonReligion, Language, GenreParisianCategory, Work,
+                              PersonWorkRelationRole, PersonWorkRelation, Format, STCNGenre, Edition,
+                              PersonEditionRelationRole, PersonEditionRelation, Collection, ItemType, Page, Binding,
+                              Item, CollectionEdition, EditionCoPurchase, CollectionSimilarity, PriceAggregate,
+                              LedgerEntry, ResidenceCluster, suppress_relation_signals)
+from luchtmans.analytics import aggregate, build_price_aggregates, price_aggregates, update_price_aggregates
+from luchtmans.autocomplete import autocomplete
+from luchtmans.cache import get_versions, lookup_choices
+from luchtmans.clusters import MAX_ZOOM, build_residence_clusters, residence_clusters, update_residence_clusters
+from luchtmans.copurchases import also_bought, build_co_purchases, similar_collections
+from luchtmans.dates import parse_date
+from luchtmans.dedupe import candidate_pairs, merge_groups
+from luchtmans.entries import build_ledger_entries
+from luchtmans.export import TABLES, ExportError, export, parquet_available
+from luchtmans.geo import EARTH_RADIUS, geohash, next_prefix
+from luchtmans.graph import RelationGraph, get_graph
+from luchtmans.prices import parse_prices
+from luchtmans.relations import bulk_add_person_relations
+from luchtmans.search import search
+from luchtmans.spelling import normalize_spelling, spelling_search
+from luchtmans.wikidata import open_dump
+
+
+def create_ledger_rows(i):
+    """Create one row for every model, all linked to each other; `i` keeps unique fields unique."""
+    country = Country.objects.create(name=f'Country {i}')
+    place = Place.objects.create(name=f'Place {i}', country=country)
+    street = Street.objects.create(name=f'Street {i}', place=place)
+    address = Address.objects.create(street=street, house_number=str(i))
+    person = Person.objects.create(short_name=f'Person {i}', place_of_birth=place, place_of_death=place)
+    other_person = Person.objects.create(short_name=f'Other person {i}')
+    relation_type = RelationType.objects.create(text=f'type {i}')
+    relation = PersonPersonRelation.objects.create(from_person=person, to_person=other_person)
+    relation.types.add(relation_type)
+    PeriodOfResidence.objects.create(person=person, address=address, start_year=1750, end_year=1760)
+    religion = Religion.objects.create(name=f'Religion {i}')
+    PersonReligion.objects.create(person=person, religion=religion)
+    language = Language.objects.create(name=f'Language {i}')
+    work = Work.objects.create(title=f'Work {i}', uncertain=False,
+                               genre_parisian_category=GenreParisianCategory.objects.create(name=f'Genre {i}'))
+    work.languages.add(language)
+    PersonWorkRelation.objects.create(person=person, work=work,
+                                      role=PersonWorkRelationRole.objects.create(name=f'Role {i}'))
+    Format.objects.create(name=f'Format {i}')
+    edition = Edition.objects.create(title=f'Edition {i}', short_title=f'Edition {i}', edition_uncertain=False,
+                                     work=work)
+    edition.places_of_publication.add(place)
+    edition.languages.add(language)
+    edition.stcn_genres.add(STCNGenre.objects.create(name=f'STCN genre {i}'))
+    PersonEditionRelation.objects.create(person=person, edition=edition,
+                                         role=PersonEditionRelationRole.objects.create(name=f'Edition role {i}'))
+    collection = Collection.objects.create(short_title=f'Collection {i}', client=person)
+    item = Item.objects.create(collection=collection, transcription_full=f'Item {i}',
+                               type=ItemType.objects.create(name=f'Item type {i}'), non_book=False,
+                               transcription_incomplete=False, page=Page.objects.create(volume=1, folio=str(i)),
+                               edition_uncertain=False, price_decimal=Decimal('1.00'), work_in_progress=False)
+    item.editions.add(edition)
+    item.binding.add(Binding.objects.create(name=f'Binding {i}'))
+    item.languages.add(language)
+
+
+class ChangelistQueryBudgetTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+
+    def changelist_urls(self):
+        with translation.override('en'):
+            return [reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist')
+                    for model in admin.site._registry if model._meta.app_label == 'luchtmans']
+
+    def count_queries(self, url):
+        # Count with a cold cache, which the changelists of the other models would otherwise have filled
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_ledger_rows(0)
+        counts = {url: self.count_queries(url) for url in self.changelist_urls()}
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(1, 5):
+                create_ledger_rows(i)
+
+        for url, count in counts.items():
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), count)
+
+
+class BulkPersonRelationTests(TestCase):
+    def setUp(self):
+        self.persons = [Person.objects.create(short_name=f'Person {i}') for i in range(4)]
+        self.father = RelationType.objects.create(text='father')
+        self.son = RelationType.objects.create(text='son', reverse=self.father)
+        self.friend = RelationType.objects.create(text='friend')
+        a, b, c, d = [person.pk for person in self.persons]
+        self.edges = [
+            (a, b, [self.father.pk]),
+            (a, c, [self.friend.pk, self.father.pk]),
+            (d, a, []),
+        ]
+
+    def snapshot(self):
+        return {(relation.from_person_id, relation.to_person_id): {type.text for type in relation.types.all()}
+                for relation in PersonPersonRelation.objects.prefetch_related('types')}
+
+    def test_bulk_add_matches_signal_path(self):
+        for from_person_id, to_person_id, type_ids in self.edges:
+            relation = PersonPersonRelation.objects.create(from_person_id=from_person_id, to_person_id=to_person_id)
+            relation.types.add(*type_ids)
+        expected = self.snapshot()
+        PersonPersonRelation.objects.all().delete()
+
+        result = bulk_add_person_relations(self.edges)
+
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(result, (6, 6))
+
+    def test_bulk_add_skips_existing_rows(self):
+        bulk_add_person_relations(self.edges[:1])
+        expected = self.snapshot()
+
+        result = bulk_add_person_relations(self.edges[:1] + [(self.edges[0][1], self.edges[0][0], [self.son.pk])])
+
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(result, (0, 0))
+
+    def test_bulk_add_bumps_versions_after_commit(self):
+        models = [PersonPersonRelation, PersonPersonRelation.types.through]
+        versions = get_versions(models)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            bulk_add_person_relations(self.edges)
+            self.assertEqual(get_versions(models), versions)
+        for callback in callbacks:
+            callback()
+
+        self.assertNotEqual(get_versions(models)[0], versions[0])
+        self.assertNotEqual(get_versions(models)[1], versions[1])
+
+
+class RelationTypeSignalTests(TestCase):
+    def setUp(self):
+        from_person = Person.objects.create(short_name='Father')
+        to_person = Person.objects.create(short_name='Son')
+        self.relation = PersonPersonRelation.objects.create(from_person=from_person, to_person=to_person)
+        self.reverse_relation = PersonPersonRelation.objects.get(from_person=to_person, to_person=from_person)
+        self.types = [RelationType.objects.create(text=f'type {i}') for i in range(4)]
+        self.reverse_types = [RelationType.objects.create(text=f'reverse type {i}', reverse=relation_type)
+                              for i, relation_type in enumerate(self.types)]
+
+    def assertReverseTypes(self, expected):
+        self.assertEqual(set(self.reverse_relation.types.all()), set(expected))
+
+    def test_add_remove_and_clear_are_applied_to_reverse_relation(self):
+        self.relation.types.add(*self.types[:3])
+        self.assertReverseTypes(self.reverse_types[:3])
+        self.relation.types.remove(self.types[0])
+        self.assertReverseTypes(self.reverse_types[1:3])
+        self.relation.types.set([self.types[2], self.types[3]])
+        self.assertReverseTypes(self.reverse_types[2:4])
+        self.relation.types.clear()
+        self.assertReverseTypes([])
+
+    def test_changes_from_the_type_side_are_applied_to_reverse_relation(self):
+        self.types[0].personpersonrelation_set.add(self.relation)
+        self.assertReverseTypes(self.reverse_types[:1])
+        self.types[0].personpersonrelation_set.clear()
+        self.assertReverseTypes([])
+
+    def test_queries_do_not_grow_with_number_of_types(self):
+        with CaptureQueriesContext(connection) as one_type:
+            self.relation.types.add(self.types[0])
+        with CaptureQueriesContext(connection) as three_types:
+            self.relation.types.add(*self.types[1:])
+        self.assertEqual(len(three_types), len(one_type))
+
+
+class RelationSignalSuppressionTests(TransactionTestCase):
+    def test_suppression_does_not_leak_into_other_threads(self):
+        persons = [Person.objects.create(short_name=f'Person {i}') for i in range(4)]
+        relation_type = RelationType.objects.create(text='friend')
+        suppressed = threading.Event()
+        other_thread_done = threading.Event()
+
+        def save_suppressed():
+            with suppress_relation_signals():
+                PersonPersonRelation.objects.create(from_person=persons[0], to_person=persons[1])
+                suppressed.set()
+                other_thread_done.wait(timeout=10)
+            connection.close()
+
+        def save_with_signals():
+            suppressed.wait(timeout=10)
+            relation = PersonPersonRelation.objects.create(from_person=persons[2], to_person=persons[3])
+            relation.types.add(relation_type)
+            other_thread_done.set()
+            connection.close()
+
+        threads = [threading.Thread(target=save_suppressed), threading.Thread(target=save_with_signals)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertFalse(PersonPersonRelation.objects.filter(from_person=persons[1], to_person=persons[0]).exists())
+        reverse_relation = PersonPersonRelation.objects.get(from_person=persons[3], to_person=persons[2])
+        self.assertEqual(list(reverse_relation.types.all()), [relation_type])
+
+
+class LookupCacheTests(TestCase):
+    def test_lookup_choices_are_cached_until_the_table_changes(self):
+        language = Language.objects.create(name='Latin')
+        self.assertEqual(lookup_choices(Language), [(language.pk, 'Latin')])
+        with self.assertNumQueries(0):
+            lookup_choices(Language)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            language.name = 'Dutch'
+            language.save()
+            # Until commit, other requests would still read the old rows
+            self.assertEqual(lookup_choices(Language), [(language.pk, 'Latin')])
+        self.assertEqual(lookup_choices(Language), [(language.pk, 'Dutch')])
+
+
+class AutocompleteTests(TestCase):
+    def test_results_are_ranked_by_match_quality(self):
+        for short_name in ['Abraham Luzac-Tetrode', 'J. Luzac', 'Luzac', 'Johan Luzac', 'Élie Luzac', 'Luzacq']:
+            Person.objects.create(short_name=short_name)
+
+        results = autocomplete(Person.objects.all(), 'luzac')
+
+        self.assertEqual([person.short_name for person in results],
+                         ['Luzac', 'Luzacq', 'J. Luzac', 'Élie Luzac', 'Johan Luzac', 'Abraham Luzac-Tetrode'])
+        self.assertEqual([person.short_name for person in autocomplete(Person.objects.all(), 'LUZAC elie')],
+                         ['Élie Luzac'])
+
+    def test_address_search_name_follows_street_name(self):
+        street = Street.objects.create(name='Rapenburg',
+                                       place=Place.objects.create(name='Leiden',
+                                                                  country=Country.objects.create(name='Holland')))
+        address = Address.objects.create(street=street, house_number='69')
+        for house_number in ['70', '71']:
+            Address.objects.create(street=street, house_number=house_number)
+        street.name = 'Rapenborgh'
+        with CaptureQueriesContext(connection) as queries:
+            street.save()
+
+        self.assertEqual(list(autocomplete(Address.objects.all(), 'rapenborgh 69')), [address])
+        # All addresses are written in one UPDATE
+        self.assertEqual(sum('UPDATE "luchtmans_address"' in query['sql'] for query in queries.captured_queries), 1)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.title_match = Work.objects.create(title='Lettres sur la Hollande', uncertain=False)
+        self.other = Work.objects.create(title='Reize door Holland', uncertain=False)
+        self.person = Person.objects.create(short_name='Holl', surname='Hollander', first_names='Jan')
+
+    def test_all_words_have_to_match(self):
+        self.assertEqual(list(search(Work.objects.all(), 'lettres holland')), [self.title_match])
+        self.assertEqual(list(search(Work.objects.all(), '--')), [])
+
+    def test_heavier_fields_rank_higher(self):
+        person = Person.objects.create(short_name='Jan', surname='Jansz', first_names='Hollander')
+        results = search(Person.objects.all(), 'hollander').order_by('-search_rank', 'pk')
+        self.assertEqual(list(results), [self.person, person])
+        self.assertGreater(results[0].search_rank, results[1].search_rank)
+
+    def test_search_api(self):
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('luchtmans:search'), {'q': 'holl', 'type': ['work', 'person']})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual({(result['type'], result['id']) for result in results},
+                         {('work', self.title_match.pk), ('work', self.other.pk), ('person', self.person.pk)})
+        self.assertEqual(self.client.get(reverse('luchtmans:search'), {'q': 'holl', 'type': 'page'}).status_code, 400)
+        self.assertEqual(len(self.client.get(reverse('luchtmans:search'), {'q': 'holl', 'limit': -5}).json()['results']),
+                         1)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('luchtmans:search'), {'q': 'holl'}).status_code, 302)
+
+
+class SpellingSearchTests(TestCase):
+    def test_spelling_variants_normalize_alike(self):
+        self.assertEqual(normalize_spelling('Beschrijvinge der Stadt Leijden'),
+                         normalize_spelling('Beschryvinge der Stadt Leyden'))
+        self.assertEqual(normalize_spelling('Catalogus'), normalize_spelling('Katalogus'))
+        self.assertEqual(normalize_spelling('Philosophie'), normalize_spelling('Filosofie'))
+
+    def test_items_and_editions_are_found_in_any_spelling(self):
+        create_ledger_rows(0)
+        item = Item.objects.get()
+        item.transcription_full = 'Beschryving van Leyden, 2 deelen'
+        item.save()
+        edition = Edition.objects.get()
+        edition.title = 'Catalogus van boeken'
+        edition.save(update_fields=['title'])
+
+        self.assertEqual(list(spelling_search(Item.objects.all(), 'beschrijving leijden')), [item])
+        self.assertEqual(list(spelling_search(Edition.objects.all(), 'katalogus')), [edition])
+        self.assertEqual(list(spelling_search(Item.objects.all(), 'amsterdam')), [])
+
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        with translation.override('en'):
+            response = self.client.get(reverse('admin:luchtmans_edition_changelist'), {'q': 'katalogus'})
+        self.assertEqual(list(response.context['cl'].result_list), [edition])
+
+
+class ImportLedgerTests(TestCase):
+    def setUp(self):
+        create_ledger_rows(0)
+        self.edition = Edition.objects.get()
+        self.edition.stcn_id = '12345678X'
+        self.edition.save()
+        self.client_person = Person.objects.create(short_name='Client')
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_rows(self, count):
+        path = self.directory / 'ledger.jsonl'
+        with open(path, 'w', encoding='utf-8') as file:
+            for i in range(count):
+                file.write(json.dumps({
+                    'collection': 'Ledger 1', 'client': self.client_person.pk, 'volume': 1, 'folio': str(10 + i // 2),
+                    'recto_verso': 'rv'[i % 2], 'type': 'Book', 'bindings': 'calf;Item type 0', 'languages': ['Latin'],
+                    'editions': f'12345678X;{self.edition.pk}', 'transcription_full': f'Catalogus {i}',
+                    'non_book': 'no', 'date': '1750-01-0%d' % (i % 9 + 1), 'price_decimal': '1.50',
+                }) + '\n')
+        return path
+
+    def test_import_creates_items_and_relations(self):
+        path = self.write_rows(5)
+        output = io.StringIO()
+        call_command('import_ledger', str(path), batch_size=2, stdout=output)
+        self.assertIn('Imported 5 items', output.getvalue())
+
+        items = Item.objects.filter(collection__short_title='Ledger 1')
+        self.assertEqual(items.count(), 5)
+        self.assertEqual(Page.objects.filter(volume=1, folio='10').count(), 2)
+        item = items.get(transcription_full='Catalogus 3')
+        self.assertEqual((item.page.folio, item.page.recto_verso, item.type.name), ('11', 'V', 'Book'))
+        self.assertEqual(list(item.editions.all()), [self.edition])
+        self.assertEqual(sorted(binding.name for binding in item.binding.all()), ['Item type 0', 'calf'])
+        self.assertEqual(item.normalized_text, 'katalogus 3')
+        self.assertEqual(list(spelling_search(Item.objects.all(), 'katalogus 3')), [item])
+
+    def test_import_resumes_from_checkpoint(self):
+        path = self.write_rows(4)
+        checkpoint = self.directory / 'checkpoint.json'
+        checkpoint.write_text(json.dumps({'file': str(path.resolve()), 'rows': 3}))
+
+        output = io.StringIO()
+        call_command('import_ledger', str(path), checkpoint=checkpoint, stdout=output)
+        self.assertIn('Resuming after row 3', output.getvalue())
+
+        self.assertEqual(list(Item.objects.filter(collection__short_title='Ledger 1')
+                              .values_list('transcription_full', flat=True)), ['Catalogus 3'])
+        self.assertEqual(json.loads(checkpoint.read_text())['rows'], 4)
+
+
+class DatasetBenchmarkTests(TestCase):
+    def test_generate_dataset_and_benchmark(self):
+        call_command('generate_dataset', scale=0.0005, seed=1, stdout=io.StringIO())
+        self.assertEqual(Person.objects.count(), 100)
+        self.assertEqual(PersonPersonRelation.objects.count(), 250)
+        self.assertEqual(Item.objects.count(), 1000)
+        self.assertEqual(Item.objects.filter(normalized_text='').count(), 0)
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        baseline = Path(directory) / 'baseline.json'
+        benchmarks = ['changelist:person', 'autocomplete:person', 'signals:person_relation', 'import:ledger']
+        output = io.StringIO()
+        call_command('benchmark', *benchmarks, repeat=1, output=baseline, stdout=output)
+        self.assertIn('changelist:person: ', output.getvalue())
+        results = json.loads(baseline.read_text())['results']
+        self.assertEqual(list(results), benchmarks)
+        self.assertEqual(Item.objects.count(), 1000)
+
+        # A benchmark that needs more queries than the baseline is a regression
+        results['changelist:person']['queries'] -= 1
+        baseline.write_text(json.dumps({'results': results}))
+        with self.assertRaisesMessage(CommandError, 'changelist:person'):
+            call_command('benchmark', 'changelist:person', repeat=1, compare=baseline, threshold=100,
+                         stdout=io.StringIO())
+
+
+class IntervalQueryTests(TestCase):
+    def setUp(self):
+        create_ledger_rows(0)
+        self.person = Person.objects.get(short_name='Person 0')
+        self.address = Address.objects.get()
+        PeriodOfResidence.objects.all().delete()
+        self.periods = {
+            (start, end): PeriodOfResidence.objects.create(person=self.person, address=self.address,
+                                                          start_year=start, end_year=end)
+            for start, end in [(1750, 1760), (None, 1740), (1765, None), (None, None)]
+        }
+
+    def keys(self, queryset):
+        return {key for key, period in self.periods.items() if period in queryset}
+
+    def test_open_ended_intervals(self):
+        periods = PeriodOfResidence.objects
+        self.assertEqual(self.keys(periods.active_in(1760)), {(1750, 1760), (None, None)})
+        self.assertEqual(self.keys(periods.overlapping(1735, 1750)), {(1750, 1760), (None, 1740), (None, None)})
+        self.assertEqual(self.keys(periods.overlapping(1770)), {(1765, None), (None, None)})
+        self.assertEqual(self.keys(periods.containing(1752, 1758)), {(1750, 1760), (None, None)})
+        self.assertEqual(self.keys(periods.within(1700, 1800)), {(1750, 1760)})
+        self.assertEqual(self.keys(periods.within(end=1745)), {(None, 1740)})
+
+    def test_edition_without_end_year_is_a_single_year(self):
+        edition = Edition.objects.get()
+        edition.year_of_publication_start = 1755
+        edition.save()
+        self.assertEqual(list(Edition.objects.overlapping(1750, 1760)), [edition])
+        self.assertEqual(list(Edition.objects.overlapping(1756, 1760)), [])
+        self.assertEqual(list(Edition.objects.within(1755, 1755)), [edition])
+        edition.year_of_publication_start = None
+        edition.save()
+        self.assertEqual(list(Edition.objects.overlapping()), [])
+
+    def test_decade_filters(self):
+        self.assertEqual(PeriodOfResidence.objects.decades(), [1740, 1750, 1760])
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        with translation.override('en'):
+            response = self.client.get(reverse('admin:luchtmans_periodofresidence_changelist'), {'decade': '1740'})
+            self.assertEqual(self.keys(response.context['cl'].result_list), {(None, 1740), (None, None)})
+            response = self.client.get(reverse('admin:luchtmans_person_changelist'), {'residence_decade': '1770'})
+            self.assertEqual(list(response.context['cl'].result_list), [self.person])
+
+
+class PersonDateTests(TestCase):
+    def test_parse_date(self):
+        self.assertEqual(parse_date('1745-03-02'), (date(1745, 3, 2), date(1745, 3, 2), False))
+        self.assertEqual(parse_date('2 maart 1745'), (date(1745, 3, 2), date(1745, 3, 2), False))
+        self.assertEqual(parse_date('1745'), (date(1745, 1, 1), date(1745, 12, 31), False))
+        self.assertEqual(parse_date('c. 1745'), (date(1740, 1, 1), date(1750, 12, 31), True))
+        self.assertEqual(parse_date('before 1790'), (None, date(1789, 12, 31), True))
+        self.assertEqual(parse_date('1745/46'), (date(1745, 1, 1), date(1746, 12, 31), True))
+        self.assertEqual(parse_date('unknown'), (None, None, True))
+        self.assertEqual(parse_date(''), (None, None, False))
+        # Widened dates stop at the first and last day a date can have
+        self.assertEqual(parse_date('c. 9998'), (date(9993, 1, 1), date(9999, 12, 31), True))
+        self.assertEqual(parse_date('before 0001-01-01'), (None, date(1, 1, 1), True))
+        self.assertEqual(parse_date('after 9999-12-31'), (date(9999, 12, 31), None, True))
+        person = Person.objects.create(short_name='Late', date_of_birth='9950')
+        self.assertEqual((person.alive_from, person.alive_until), (date(9950, 1, 1), date(9999, 12, 31)))
+
+    def test_alive_in(self):
+        lived = Person.objects.create(short_name='Lived', date_of_birth='1745-03-02', date_of_death='c. 1790')
+        born = Person.objects.create(short_name='Born', date_of_birth='1700')
+        died = Person.objects.create(short_name='Died', date_of_death='after 1775')
+        Person.objects.create(short_name='Unknown', date_of_birth='onbekend')
+        self.assertEqual((lived.alive_from, lived.alive_until), (date(1745, 3, 2), date(1795, 12, 31)))
+
+        self.assertEqual(set(Person.objects.alive_in(1770)), {lived, born, died})
+        self.assertEqual(set(Person.objects.alive_in(1810, 1820)), {died})
+        self.assertEqual(set(Person.objects.alive_in(1700, 1720)), {born, died})
+        self.assertEqual(set(Person.objects.alive_in(1650, 1670)), set())
+
+        lived.date_of_death = '1760'
+        lived.save(update_fields=['date_of_death'])
+        self.assertEqual(set(Person.objects.alive_in(1770)), {born, died})
+
+    def test_alive_in_admin_and_api(self):
+        person = Person.objects.create(short_name='Lived', date_of_birth='1745', date_of_death='1790')
+        Person.objects.create(short_name='Later', date_of_birth='1800', date_of_death='1850')
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        with translation.override('en'):
+            response = self.client.get(reverse('admin:luchtmans_person_changelist'), {'alive': '1770'})
+        self.assertEqual(list(response.context['cl'].result_list), [person])
+        with translation.override('en'):
+            response = self.client.get(reverse('admin:luchtmans_person_changelist'), {'alive': '0'})
+        self.assertEqual(response.status_code, 302)
+
+        response = self.client.get(reverse('luchtmans:persons'), {'alive_in': '1760-1770'})
+        self.assertEqual([result['id'] for result in response.json()['results']], [person.pk])
+        for alive_in in ['soon', '0', '1760-10000']:
+            self.assertEqual(self.client.get(reverse('luchtmans:persons'), {'alive_in': alive_in}).status_code, 400)
+        response = self.client.get(reverse('luchtmans:persons'), {'alive_in': '1760-1770', 'limit': -1, 'offset': -1})
+        self.assertEqual([result['id'] for result in response.json()['results']], [person.pk])
+
+
+class RelationGraphTests(TestCase):
+    def setUp(self):
+        # The versions are bumped after commit, so the graph and labels of an earlier test would be reused
+        cache.clear()
+        self.persons = [Person.objects.create(short_name=f'Person {i}') for i in range(6)]
+        self.father = RelationType.objects.create(text='father')
+        self.friend = RelationType.objects.create(text='friend')
+        a, b, c, d, e, f = [person.pk for person in self.persons]
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_add_person_relations([
+                (a, b, [self.father.pk]),
+                (b, c, [self.father.pk]),
+                (c, d, [self.friend.pk]),
+                (a, d, []),
+                (e, f, [self.friend.pk]),
+            ])
+
+    def test_queries(self):
+        a, b, c, d, e, f = [person.pk for person in self.persons]
+        graph = RelationGraph.load()
+
+        self.assertEqual(graph.shortest_path(a, c).persons, [a, b, c])
+        self.assertEqual(graph.shortest_path(b, d).persons, [b, a, d])
+        self.assertEqual(graph.shortest_path(b, d, types=[self.father.pk, self.friend.pk]).persons, [b, c, d])
+        self.assertEqual(graph.shortest_path(a, c, max_depth=1), None)
+        self.assertEqual(graph.shortest_path(a, e), None)
+        relation = PersonPersonRelation.objects.get(from_person=a, to_person=b)
+        self.assertEqual(graph.shortest_path(a, b).relations, [relation.pk])
+
+        self.assertEqual(graph.neighbourhood(a, 1), {a: 0, b: 1, d: 1})
+        self.assertEqual(graph.neighbourhood(a, 2, types=[self.father.pk]), {a: 0, b: 1, c: 2})
+        self.assertEqual(graph.component_sizes().tolist(), [4, 2])
+        self.assertEqual(sorted(graph.component(f)), [e, f])
+
+        statistics = graph.degree_statistics(top=1)
+        self.assertEqual((statistics.persons, statistics.relations, statistics.max), (6, 10, 2))
+        self.assertEqual(statistics.top, [(a, 2)])
+
+    def test_graph_is_refreshed_after_commit(self):
+        a, b, c, d, e, f = [person.pk for person in self.persons]
+        graph = get_graph()
+        with self.captureOnCommitCallbacks(execute=True):
+            relation = PersonPersonRelation.objects.create(from_person_id=d, to_person_id=e)
+            relation.types.add(self.friend)
+        with self.captureOnCommitCallbacks(execute=True):
+            PersonPersonRelation.objects.filter(from_person=a, to_person=b).delete()
+
+        self.assertIs(get_graph(), graph)
+        self.assertEqual(graph.shortest_path(a, f).persons, [a, d, e, f])
+        self.assertEqual(graph.shortest_path(a, f, types=[self.friend.pk]), None)
+        self.assertEqual(graph.shortest_path(c, f, types=[self.friend.pk]).persons, [c, d, e, f])
+        self.assertEqual(graph.component_sizes().tolist(), [6])
+
+        new_person = Person.objects.create(short_name='Person 6')
+        with self.captureOnCommitCallbacks(execute=True):
+            PersonPersonRelation.objects.create(from_person=new_person, to_person_id=f)
+        self.assertEqual(get_graph().neighbourhood(new_person.pk), {new_person.pk: 0, f: 1})
+
+    def test_commit_refreshes_only_its_own_changes(self):
+        a, b, c, d, e, f = [person.pk for person in self.persons]
+        graph = get_graph()
+        # The callbacks of a transaction that has not committed yet, like one of another thread
+        with self.captureOnCommitCallbacks() as callbacks:
+            PersonPersonRelation.objects.create(from_person_id=d, to_person_id=e)
+        with self.captureOnCommitCallbacks(execute=True):
+            PersonPersonRelation.objects.filter(from_person=a, to_person=b).delete()
+        self.assertEqual(graph.shortest_path(d, e), None)
+
+        for callback in callbacks:
+            callback()
+        self.assertIs(get_graph(), graph)
+        self.assertEqual(graph.shortest_path(d, e).persons, [d, e])
+
+    def test_graph_api(self):
+        a, b, c, d, e, f = [person.pk for person in self.persons]
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('luchtmans:graph_path'), {'from': a, 'to': c})
+        self.assertEqual([person['id'] for person in response.json()['path']], [a, b, c])
+        self.assertEqual([relation['types'] for relation in response.json()['relations']], [['father'], ['father']])
+        self.assertEqual(self.client.get(reverse('luchtmans:graph_path'), {'from': a, 'to': e}).json(), {'path': None})
+        self.assertEqual(self.client.get(reverse('luchtmans:graph_path'), {'from': a}).status_code, 400)
+        response = self.client.get(reverse('luchtmans:graph_path'), {'from': a, 'to': c, 'max_depth': -1})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('luchtmans:graph_neighbourhood'), {'person': a, 'depth': -1})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(reverse('luchtmans:graph_neighbourhood'), {'person': a, 'depth': 2})
+        self.assertEqual([(person['id'], person['distance']) for person in response.json()['results']],
+                         [(a, 0), (b, 1), (d, 1), (c, 2)])
+
+        response = self.client.get(reverse('luchtmans:graph_statistics'), {'person': e})
+        self.assertEqual(response.json()['components'], 2)
+        self.assertEqual([person['id'] for person in response.json()['component']['persons']], [e, f])
+
+
+class CoPurchaseTests(TestCase):
+    def setUp(self):
+        for i in range(4):
+            create_ledger_rows(i)
+        self.collections = list(Collection.objects.order_by('pk'))
+        self.editions = list(Edition.objects.order_by('pk'))
+        # Collection i bought edition i; c0 also bought e1 and e2, c1 also e0 and c2 also e1
+        for collection, edition in [(0, 1), (0, 2), (1, 0), (2, 1)]:
+            self.add_item(self.collections[collection], self.editions[edition])
+
+    def add_item(self, collection, edition):
+        item = Item.objects.create(collection=collection, transcription_full='Item', type=ItemType.objects.first(),
+                                   non_book=False, transcription_incomplete=False, page=Page.objects.first(),
+                                   edition_uncertain=False, price_decimal=Decimal('1.00'), work_in_progress=False)
+        item.editions.add(edition)
+        return item
+
+    def snapshot(self):
+        return (
+            set(CollectionEdition.objects.values_list('collection', 'edition', 'items')),
+            set(EditionCoPurchase.objects.values_list('edition', 'other', 'collections')),
+            {(collection, other, editions, round(similarity, 6)) for collection, other, editions, similarity in
+             CollectionSimilarity.objects.values_list('collection', 'other', 'editions', 'similarity')},
+        )
+
+    def test_build(self):
+        build_co_purchases(log=lambda message: None)
+        e0, e1, e2, e3 = self.editions
+        c0, c1, c2, c3 = self.collections
+
+        self.assertEqual([(co_purchase.other, co_purchase.collections) for co_purchase in also_bought(e1.pk)],
+                         [(e0, 2), (e2, 2)])
+        self.assertEqual([(co_purchase.other, co_purchase.collections) for co_purchase in also_bought(e0.pk)],
+                         [(e1, 2), (e2, 1)])
+        self.assertEqual(list(also_bought(e3.pk)), [])
+        self.assertEqual([(similarity.other, similarity.editions, round(similarity.similarity, 3))
+                          for similarity in similar_collections(c1.pk)], [(c0, 2, 0.667), (c2, 1, 0.333)])
+
+    def test_item_changes_match_a_rebuild(self):
+        build_co_purchases(log=lambda message: None)
+        e0, e1, e2, e3 = self.editions
+        c0, c1, c2, c3 = self.collections
+        with self.captureOnCommitCallbacks(execute=True):
+            item = self.add_item(c3, e0)
+        with self.captureOnCommitCallbacks(execute=True):
+            item.editions.add(e2)
+        with self.captureOnCommitCallbacks(execute=True):
+            moved = Item.objects.filter(collection=c0, editions=e1).get()
+            moved.collection = c3
+            moved.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Item.objects.filter(collection=c2, editions=e1).delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            e2.item_set.remove(*Item.objects.filter(collection=c0))
+
+        self.assertEqual([co_purchase.other for co_purchase in also_bought(e3.pk)], [e0, e1, e2])
+        incremental = self.snapshot()
+        build_co_purchases(log=lambda message: None)
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_commit_updates_only_its_own_cells(self):
+        build_co_purchases(log=lambda message: None)
+        e0, e1, e2, e3 = self.editions
+        c0, c1, c2, c3 = self.collections
+        # The callbacks of a transaction that has not committed yet, like one of another thread
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.add_item(c3, e0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_item(c3, e1)
+        cells = CollectionEdition.objects.filter(collection=c3).values_list('edition', flat=True)
+        self.assertEqual(set(cells), {e1.pk, e3.pk})
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(set(cells.all()), {e0.pk, e1.pk, e3.pk})
+
+    def test_api(self):
+        build_co_purchases(log=lambda message: None)
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('luchtmans:also_bought'), {'edition': self.editions[1].pk})
+        self.assertEqual([result['id'] for result in response.json()['results']],
+                         [self.editions[0].pk, self.editions[2].pk])
+        response = self.client.get(reverse('luchtmans:similar_collections'), {'collection': self.collections[1].pk})
+        self.assertEqual(response.json()['results'][0]['id'], self.collections[0].pk)
+        self.assertEqual(self.client.get(reverse('luchtmans:also_bought'), {'edition': 'x'}).status_code, 400)
+
+
+class PriceTests(TestCase):
+    def test_parse_prices(self):
+        texts = ['3-4-8', 'f 3:4:8', '-15', '3-', '3 gl 4 st 8 p', '12 st', '3-4½', '3,50', 'gratis', '', 'abc', '3-25']
+        decimals, unparseable = parse_prices(texts)
+        self.assertEqual(decimals, [Decimal('3.23'), Decimal('3.23'), Decimal('0.75'), Decimal('3.00'),
+                                    Decimal('3.23'), Decimal('0.60'), Decimal('3.23'), Decimal('3.50'),
+                                    Decimal('0.00'), None, None, None])
+        self.assertEqual(unparseable.tolist(), [False] * 10 + [True, True])
+
+    def test_save_and_backfill(self):
+        create_ledger_rows(0)
+        item = Item.objects.get()
+        self.assertEqual((item.price_decimal, item.price_needs_review), (Decimal('1.00'), False))
+
+        item.price, item.price_decimal = '2-10', None
+        item.save()
+        self.assertEqual(Item.objects.get().price_decimal, Decimal('2.50'))
+        item.price, item.price_decimal = 'twee gulden', None
+        item.save()
+        self.assertEqual(Item.objects.filter(price_needs_review=True).get().price_decimal, None)
+        item.price_decimal = Decimal('2.00')
+        item.save(update_fields=['price_decimal'])
+        self.assertFalse(Item.objects.get().price_needs_review)
+
+        Item.objects.update(price='-15', price_decimal=None)
+        output = io.StringIO()
+        call_command('parse_prices', batch_size=1, stdout=output)
+        self.assertIn('updated 1 items, 0 flagged for review', output.getvalue())
+        self.assertEqual((Item.objects.get().price_decimal, Item.objects.get().price_needs_review),
+                         (Decimal('0.75'), False))
+        Item.objects.update(price='1-2', price_decimal=Decimal('5.00'))
+        call_command('parse_prices', stdout=io.StringIO())
+        self.assertEqual(Item.objects.get().price_decimal, Decimal('5.00'))
+        call_command('parse_prices', all=True, stdout=io.StringIO())
+        self.assertEqual(Item.objects.get().price_decimal, Decimal('1.10'))
+
+    def test_changed_price_is_parsed_again(self):
+        create_ledger_rows(0)
+        Item.objects.update(price='3-4')
+        item = Item.objects.get()
+        item.price_decimal = None
+        item.save()
+        self.assertEqual(item.price_decimal, Decimal('3.20'))
+
+        # An editor corrects the price, the decimal price follows
+        item = Item.objects.get()
+        item.price = '5-0'
+        item.save()
+        self.assertEqual(Item.objects.get().price_decimal, Decimal('5.00'))
+        item.price = 'vijf gulden'
+        item.save()
+        self.assertEqual((item.price_decimal, item.price_needs_review), (None, True))
+        # A decimal price entered with the price is kept
+        item = Item.objects.get()
+        item.price, item.price_decimal = 'vyf gulden', Decimal('5.00')
+        item.save()
+        self.assertEqual((Item.objects.get().price_decimal, Item.objects.get().price_needs_review),
+                         (Decimal('5.00'), False))
+
+
+class PriceAggregateTests(TestCase):
+    def setUp(self):
+        for i in range(3):
+            create_ledger_rows(i)
+        self.editions = list(Edition.objects.order_by('pk'))
+        self.genre = STCNGenre.objects.order_by('pk').first()
+        self.editions[1].stcn_genres.add(self.genre)
+        for price, edition in [('2.00', 0), ('4.00', 0), (None, 0), ('3.50', 1)]:
+            self.add_item(price, self.editions[edition])
+
+    def add_item(self, price, edition):
+        item = Item.objects.create(collection=Collection.objects.first(), transcription_full='Item',
+                                   type=ItemType.objects.first(), non_book=False, transcription_incomplete=False,
+                                   page=Page.objects.first(), edition_uncertain=False, date=date(1760, 5, 1),
+                                   price_decimal=price and Decimal(price), number_of_copies='2 ex.',
+                                   work_in_progress=False)
+        item.editions.add(edition)
+        return item
+
+    def snapshot(self):
+        return set(PriceAggregate.objects.values_list('dimension', 'key', 'items', 'copies', 'priced_items', 'total',
+                                                      'mean', 'minimum', 'p25', 'median', 'p75', 'p90', 'maximum'))
+
+    def test_aggregate(self):
+        keys = np.array([1, 2, 1, 1, 2, 3])
+        cents = np.array([100, 250, 300, -1, 50, -1])
+        statistics = aggregate(keys, cents, np.ones(6, dtype=np.int64))
+        self.assertEqual(statistics['items'].tolist(), [3, 2, 1])
+        self.assertEqual(statistics['priced_items'].tolist(), [2, 2, 0])
+        self.assertEqual(statistics['p25'][:2].tolist(), [np.percentile([100, 300], 25), np.percentile([50, 250], 25)])
+        self.assertTrue(np.isnan(statistics['median'][2]))
+
+    def test_build(self):
+        build_price_aggregates(log=lambda message: None)
+        edition = PriceAggregate.objects.get(dimension='edition', key=self.editions[0].pk)
+        self.assertEqual((edition.items, edition.copies, edition.priced_items), (4, 7, 3))
+        self.assertEqual((edition.minimum, edition.median, edition.mean, edition.maximum),
+                         (Decimal('1.00'), Decimal('2.00'), Decimal('2.33'), Decimal('4.00')))
+        self.assertEqual(PriceAggregate.objects.get(dimension='year', key=1760).items, 4)
+        # The genre of edition 1 only (1.00 and 3.50) before the genre that edition 1 shares with edition 0
+        self.assertEqual([aggregate.key for aggregate in price_aggregates('stcn_genre', order_by='median', limit=2)],
+                         [STCNGenre.objects.order_by('pk')[1].pk, self.genre.pk])
+
+    def test_changes_match_a_rebuild(self):
+        build_price_aggregates(log=lambda message: None)
+        e0, e1, e2 = self.editions
+        with self.captureOnCommitCallbacks(execute=True):
+            item = self.add_item('10.00', e2)
+        with self.captureOnCommitCallbacks(execute=True):
+            item.editions.add(e1)
+        with self.captureOnCommitCallbacks(execute=True):
+            changed = Item.objects.get(price_decimal=Decimal('4.00'))
+            changed.price_decimal, changed.date = Decimal('5.00'), date(1770, 1, 1)
+            changed.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Item.objects.filter(price_decimal=Decimal('3.50')).delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            e1.stcn_genres.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            e0.item_set.remove(*Item.objects.filter(price_decimal=Decimal('2.00')))
+
+        self.assertEqual(PriceAggregate.objects.get(dimension='edition', key=e1.pk).maximum, Decimal('10.00'))
+        incremental = self.snapshot()
+        build_price_aggregates(log=lambda message: None)
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_parse_prices(self):
+        build_price_aggregates(log=lambda message: None)
+        before = self.snapshot()
+        Item.objects.filter(price_decimal__isnull=True).update(price='3-4')
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('parse_prices', stdout=io.StringIO())
+        incremental = self.snapshot()
+        self.assertNotEqual(incremental, before)
+        build_price_aggregates(log=lambda message: None)
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_commit_updates_only_its_own_keys(self):
+        build_price_aggregates(log=lambda message: None)
+        e0, e1, e2 = self.editions
+        maximum = PriceAggregate.objects.filter(dimension='edition').values_list('maximum', flat=True)
+        # The callbacks of a transaction that has not committed yet, like one of another thread
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.add_item('10.00', e2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_item('6.00', e1)
+        self.assertEqual((maximum.get(key=e1.pk), maximum.get(key=e2.pk)), (Decimal('6.00'), Decimal('1.00')))
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(maximum.get(key=e2.pk), Decimal('10.00'))
+
+    def test_large_keys_are_marked_stale(self):
+        build_price_aggregates(log=lambda message: None)
+        Item.objects.filter(price_decimal=Decimal('4.00')).update(price_decimal=Decimal('8.00'))
+        e0, e1, _ = self.editions
+        update_price_aggregates({('edition', e0.pk), ('edition', e1.pk)}, max_items=3)
+        # Edition 0 has four items and edition 1 two
+        self.assertEqual(list(PriceAggregate.objects.filter(stale=True).values_list('key', 'maximum')),
+                         [(e0.pk, Decimal('4.00'))])
+
+        output = io.StringIO()
+        call_command('build_price_aggregates', stale=True, stdout=output)
+        self.assertIn('Refreshed 1 price aggregates', output.getvalue())
+        self.assertEqual(PriceAggregate.objects.get(dimension='edition', key=e0.pk).maximum, Decimal('8.00'))
+        self.assertFalse(PriceAggregate.objects.filter(stale=True).exists())
+
+    def test_api(self):
+        build_price_aggregates(log=lambda message: None)
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('luchtmans:price_aggregates'), {'dimension': 'edition', 'order': 'total'})
+        result = response.json()['results'][0]
+        self.assertEqual((result['key'], result['label'], result['total']), (self.editions[0].pk, 'Edition 0', '7.00'))
+        response = self.client.get(reverse('luchtmans:price_aggregates'), {'dimension': 'year', 'key': '1760'})
+        self.assertEqual([(result['label'], result['items']) for result in response.json()['results']], [('1760', 4)])
+        self.assertEqual(self.client.get(reverse('luchtmans:price_aggregates'), {'dimension': 'x'}).status_code, 400)
+
+
+class LedgerEntryTests(TestCase):
+    def setUp(self):
+        for i in range(3):
+            create_ledger_rows(i)
+        self.items = list(Item.objects.order_by('pk'))
+
+    def snapshot(self):
+        return list(LedgerEntry.objects.order_by('pk').values())
+
+    def test_build(self):
+        build_ledger_entries(log=lambda message: None)
+        entry = LedgerEntry.objects.get(item=self.items[1])
+        self.assertEqual((entry.collection_title, entry.client_name, entry.volume, entry.folio),
+                         ('Collection 1', 'Person 1', 1, '1'))
+        self.assertEqual((entry.edition_titles, entry.work_titles), (['Edition 1'], ['Work 1']))
+        self.assertEqual(entry.binding_ids, [Binding.objects.get(name='Binding 1').pk])
+
+    def test_parse_prices(self):
+        build_ledger_entries(log=lambda message: None)
+        Item.objects.filter(pk=self.items[0].pk).update(price='3-4', price_decimal=None)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('parse_prices', stdout=io.StringIO())
+        self.assertEqual(LedgerEntry.objects.get(item=self.items[0]).price_decimal, Decimal('3.20'))
+
+    def test_changes_match_a_rebuild(self):
+        build_ledger_entries(log=lambda message: None)
+        item0, item1, item2 = self.items
+        with self.captureOnCommitCallbacks(execute=True):
+            item0.price = '2-10'
+            item0.price_decimal = None
+            item0.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            item0.editions.add(Edition.objects.get(title='Edition 2'))
+        with self.captureOnCommitCallbacks(execute=True):
+            work = Work.objects.get(title='Work 2')
+            work.title = 'Opera omnia'
+            work.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            client = item1.collection.client
+            client.short_name = 'Luchtmans'
+            client.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Language.objects.get(name='Language 1').item_set.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            item2.delete()
+
+        entry = LedgerEntry.objects.get(item=item0)
+        self.assertEqual((entry.price_decimal, entry.work_titles), (Decimal('2.50'), ['Work 0', 'Opera omnia']))
+        incremental = self.snapshot()
+        build_ledger_entries(log=lambda message: None)
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_commit_updates_only_its_own_entries(self):
+        build_ledger_entries(log=lambda message: None)
+        item0, item1, _ = self.items
+        # The callbacks of a transaction that has not committed yet, like one of another thread
+        with self.captureOnCommitCallbacks() as callbacks:
+            item0.notes = 'Open'
+            item0.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            item1.notes = 'Committed'
+            item1.save()
+        notes = LedgerEntry.objects.order_by('pk').values_list('notes', flat=True)
+        self.assertEqual(list(notes)[:2], ['', 'Committed'])
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(list(notes.all())[:2], ['Open', 'Committed'])
+
+    def test_changelist(self):
+        build_ledger_entries(log=lambda message: None)
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        with translation.override('en'):
+            response = self.client.get(reverse('admin:luchtmans_item_changelist'), {'o': '2'})
+        self.assertContains(response, '<td class="field-client_name">Person 2</td>', html=True)
+        self.assertContains(response, '<td class="field-binding_list">Binding 0</td>', html=True)
+        self.assertEqual([item.pk for item in response.context['cl'].result_list],
+                         [item.pk for item in self.items])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        for i in range(3):
+            create_ledger_rows(i)
+        Item.objects.filter(transcription_full='Item 2').update(date=date(1780, 5, 1))
+        build_ledger_entries(log=lambda message: None)
+
+    def export(self, *args, **kwargs):
+        return b''.join(export(*args, **kwargs, chunk_size=2))
+
+    def test_csv(self):
+        rows = list(csv.DictReader(io.StringIO(self.export('items', 'csv').decode())))
+        self.assertEqual([row['client'] for row in rows], ['Person 0', 'Person 1', 'Person 2'])
+        self.assertEqual((rows[1]['bindings'], rows[1]['non_book'], rows[1]['price_decimal'], rows[1]['date']),
+                         ('Binding 1', 'false', '1.00', ''))
+        rows = list(csv.DictReader(io.StringIO(self.export('persons', 'csv').decode())))
+        self.assertEqual((rows[0]['place_of_birth'], rows[0]['religious_affiliations']), ('Place 0', 'Religion 0'))
+
+    def test_empty_csv(self):
+        output = self.export('items', 'csv', years=(1900, 1910)).decode()
+        self.assertEqual(list(csv.reader(io.StringIO(output))), [list(TABLES['items'].columns)])
+
+    def test_jsonl(self):
+        rows = [json.loads(line) for line in self.export('editions', 'jsonl').decode().splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual((rows[2]['work'], rows[2]['places_of_publication'], rows[2]['stcn_genres']),
+                         ('Work 2', ['Place 2'], ['STCN genre 2']))
+        rows = [json.loads(line) for line in self.export('person_relations', 'jsonl').decode().splitlines()]
+        self.assertEqual((rows[0]['from_person'], rows[0]['types'], rows[0]['to_person']),
+                         ('Person 0', ['type 0'], 'Other person 0'))
+
+    @skipUnless(parquet_available(), "pyarrow is not installed")
+    def test_parquet(self):
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(io.BytesIO(self.export('items', 'parquet')))
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(table.column('languages').to_pylist(), [['Language 0'], ['Language 1'], ['Language 2']])
+        self.assertEqual(table.column('price_decimal').to_pylist(), [Decimal('1.00')] * 3)
+        self.assertEqual(table.column('date').to_pylist(), [None, None, date(1780, 5, 1)])
+
+    def test_filters(self):
+        collection = Collection.objects.get(short_title='Collection 1')
+        rows = self.export('items', 'jsonl', collections=[collection.pk]).decode().splitlines()
+        self.assertEqual([json.loads(row)['collection'] for row in rows], ['Collection 1'])
+        rows = self.export('items', 'jsonl', years=(1775, 1785)).decode().splitlines()
+        self.assertEqual([json.loads(row)['transcription_full'] for row in rows], ['Item 2'])
+        rows = self.export('person_editions', 'jsonl', collections=[collection.pk]).decode().splitlines()
+        self.assertEqual([json.loads(row)['edition'] for row in rows], ['Edition 1'])
+
+    def test_errors(self):
+        with self.assertRaisesMessage(ExportError, "Unknown format 'xlsx'"):
+            export('items', 'xlsx')
+        with self.assertRaisesMessage(ExportError, "Unknown table 'addresses'"):
+            export('addresses', 'csv')
+
+    def test_view(self):
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        response = self.client.get(reverse('luchtmans:export', args=['items']), {'format': 'jsonl', 'years': '1780'})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="items.jsonl"')
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(row)['transcription_full'] for row in rows], ['Item 2'])
+        self.assertEqual(self.client.get(reverse('luchtmans:export', args=['items']), {'years': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('luchtmans:export', args=['works'])).status_code, 400)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('export_data', 'persons', '--format', 'csv', stdout=out)
+        self.assertEqual(len(list(csv.DictReader(io.StringIO(out.getvalue())))), 6)
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'items.jsonl'
+            call_command('export_data', 'items', '--format', 'jsonl', '--output', str(path), '--years', '1780-1790')
+            self.assertEqual(len(path.read_text().splitlines()), 1)
+        with self.assertRaises(CommandError):
+            call_command('export_data', 'items', '--format', 'parquet')
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        for i in range(5):
+            create_ledger_rows(i)
+        self.items = list(Item.objects.order_by('-pk').values_list('pk', flat=True))
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        patcher = mock.patch.object(admin.site._registry[Item], 'list_per_page', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def changelist(self, **params):
+        with translation.override('en'):
+            response = self.client.get(reverse('admin:luchtmans_item_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl']
+
+    def test_pages(self):
+        cl = self.changelist()
+        self.assertEqual([item.pk for item in cl.result_list], self.items[:2])
+        self.assertEqual((cl.first_url, cl.previous_url, cl.next_url), (None, None, f'?after={self.items[1]}'))
+        cl = self.changelist(after=self.items[3])
+        self.assertEqual([item.pk for item in cl.result_list], self.items[4:])
+        self.assertEqual((cl.previous_url, cl.next_url), (f'?before={self.items[4]}', None))
+        cl = self.changelist(before=self.items[4])
+        self.assertEqual([item.pk for item in cl.result_list], self.items[2:4])
+        self.assertEqual(cl.next_url, f'?after={self.items[3]}')
+        self.assertEqual(cl.result_count, 5)
+
+    def test_filters_and_sorting(self):
+        cl = self.changelist(after=self.items[1], price_needs_review__exact='0')
+        self.assertEqual([item.pk for item in cl.result_list], self.items[2:4])
+        # Links to other filters start from the first page again
+        self.assertNotIn('after', cl.get_query_string({'price_needs_review__exact': '1'}))
+        cl = self.changelist(o='2')
+        self.assertFalse(cl.keyset)
+        self.assertEqual(len(cl.result_list), 2)
+        with translation.override('en'):
+            url = reverse('admin:luchtmans_item_changelist')
+            self.assertRedirects(self.client.get(url, {'after': 'x'}), url + '?e=1')
+
+    def test_estimated_count(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        with mock.patch('luchtmans.pagination.EXACT_COUNT_BELOW', 0):
+            cl = self.changelist()
+            self.assertTrue(cl.count_estimated)
+            self.assertEqual(cl.exact_count_url, '?exact_count=1')
+            cl = self.changelist(exact_count=1)
+            self.assertEqual((cl.count_estimated, cl.result_count), (False, 5))
+
+
+class FacetFilterTests(TestCase):
+    def setUp(self):
+        for i in range(3):
+            create_ledger_rows(i)
+        self.place = Place.objects.get(name='Place 1')
+        Person.objects.filter(short_name__startswith='Other person').update(place_of_birth=self.place, sex='F')
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+
+    def facets(self, field_path, **params):
+        with translation.override('en'):
+            response = self.client.get(reverse('admin:luchtmans_person_facets', args=[field_path]), params)
+        return response.json()['results'] if response.status_code == 200 else response.status_code
+
+    def test_changelist_renders_no_values(self):
+        with translation.override('en'):
+            response = self.client.get(reverse('admin:luchtmans_person_changelist'),
+                                       {'place_of_birth__id__exact': self.place.pk})
+            facets_url = reverse('admin:luchtmans_person_facets', args=['place_of_death'])
+        self.assertContains(response, f'data-url="{facets_url}?place_of_birth__id__exact={self.place.pk}"')
+        self.assertContains(response, '<a href="?place_of_birth__id__exact=%d">Place 1</a>' % self.place.pk)
+        self.assertNotContains(response, 'Place 2</a>')
+
+    def test_counts(self):
+        results = self.facets('place_of_birth')
+        self.assertEqual([(result['label'], result['count']) for result in results][0], ('Place 1', 4))
+        self.assertEqual(results[0]['url'], f'?place_of_birth__id__exact={self.place.pk}')
+        results = self.facets('place_of_birth', sex__exact='F')
+        self.assertEqual([(result['label'], result['count']) for result in results], [('Place 1', 3)])
+        self.assertEqual([result['label'] for result in self.facets('religious_affiliation', term='religion 2')],
+                         ['Religion 2'])
+        self.assertEqual([result['label'] for result in self.facets('place_of_death', term='place 2', limit=1)],
+                         ['Place 2'])
+
+    def test_counts_follow_changes(self):
+        self.assertEqual(self.facets('place_of_birth')[0]['count'], 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            Person.objects.create(short_name='Newcomer', place_of_birth=self.place)
+        self.assertEqual(self.facets('place_of_birth')[0]['count'], 5)
+
+    def test_errors(self):
+        self.assertEqual(self.facets('sex'), 404)
+        self.assertEqual(self.facets('place_of_birth', limit='x'), 400)
+        self.assertEqual(len(self.facets('place_of_birth', limit=-1)), 1)
+
+
+def haversine(latitude1, longitude1, latitude2, longitude2):
+    latitude1, longitude1, latitude2, longitude2 = np.radians([latitude1, longitude1, latitude2, longitude2])
+    a = (np.sin((latitude2 - latitude1) / 2) ** 2
+         + np.cos(latitude1) * np.cos(latitude2) * np.sin((longitude2 - longitude1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+class GeoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        place = Place.objects.create(name='Leiden', country=Country.objects.create(name='Netherlands'),
+                                     latitude=Decimal('52.160100'), longitude=Decimal('4.497000'))
+        street = Street.objects.create(name='Rapenburg', place=place)
+        rng = np.random.default_rng(0)
+        for i, (latitude, longitude) in enumerate(zip(rng.uniform(52.1, 52.2, 150), rng.uniform(4.4, 4.6, 150))):
+            Address.objects.create(street=street, house_number=str(i), latitude=round(Decimal(latitude), 6),
+                                   longitude=round(Decimal(longitude), 6))
+        Address.objects.create(street=street, house_number='unknown')
+        self.distances = {address.pk: haversine(52.1590, 4.4883, float(address.latitude), float(address.longitude))
+                          for address in Address.objects.filter(latitude__isnull=False)}
+
+    def test_geohash(self):
+        self.assertEqual(geohash(57.64911, 10.40744), 'u4pruydqq')
+        self.assertEqual(geohash(None, None), '')
+        self.assertEqual(next_prefix('u4z'), 'u5')
+        self.assertIsNone(next_prefix('zz'))
+        address = Address.objects.get(house_number='unknown')
+        self.assertEqual(address.geohash, '')
+        address.latitude, address.longitude = Decimal('52.159000'), Decimal('4.488300')
+        address.save(update_fields=['latitude', 'longitude'])
+        self.assertEqual(Address.objects.get(pk=address.pk).geohash, geohash(52.159, 4.4883))
+
+    def test_bbox(self):
+        expected = set(Address.objects.filter(latitude__range=(52.13, 52.17), longitude__range=(4.45, 4.52))
+                       .values_list('pk', flat=True))
+        self.assertTrue(expected)
+        self.assertEqual(set(Address.objects.within_bbox(52.13, 4.45, 52.17, 4.52).values_list('pk', flat=True)),
+                         expected)
+        self.assertFalse(Address.objects.within_bbox(52.13, 170, 52.17, -170).exists())
+
+    def test_radius(self):
+        addresses = Address.objects.within_radius(52.1590, 4.4883, 3000)
+        expected = {pk for pk, distance in self.distances.items() if distance <= 3000}
+        self.assertTrue(expected)
+        self.assertEqual({address.pk for address in addresses}, expected)
+        for address in addresses:
+            self.assertAlmostEqual(address.distance, self.distances[address.pk], delta=0.01)
+
+    def test_nearest(self):
+        expected = sorted(self.distances, key=self.distances.get)
+        self.assertEqual([address.pk for address in Address.objects.nearest(52.1590, 4.4883, 5)], expected[:5])
+        # Filters that leave out the nearest ones fetch more candidates
+        odd = [pk for pk in expected if int(Address.objects.get(pk=pk).house_number) % 2][:20]
+        self.assertEqual([address.pk for address in Address.objects.filter(house_number__regex='[13579]$')
+                          .nearest(52.1590, 4.4883, 20)], odd)
+        # The index follows changes
+        address = Address.objects.get(pk=expected[-1])
+        with self.captureOnCommitCallbacks(execute=True):
+            address.latitude, address.longitude = Decimal('52.159000'), Decimal('4.488300')
+            address.save()
+        self.assertEqual(Address.objects.nearest(52.1590, 4.4883, 1)[0].pk, address.pk)
+
+    def test_view(self):
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        url = reverse('luchtmans:geo')
+        results = self.client.get(url, {'near': '52.1590,4.4883', 'limit': 3}).json()['results']
+        self.assertEqual([result['id'] for result in results], sorted(self.distances, key=self.distances.get)[:3])
+        self.assertEqual(results[0]['label'], str(Address.objects.get(pk=results[0]['id'])))
+        results = self.client.get(url, {'near': '52.1590,4.4883', 'radius': 1000, 'limit': 100}).json()['results']
+        self.assertEqual(len(results), sum(distance <= 1000 for distance in self.distances.values()))
+        results = self.client.get(url, {'type': 'place', 'bbox': '52,4,53,5'}).json()['results']
+        self.assertEqual([result['label'] for result in results], ['Leiden'])
+        for params in [{}, {'near': '52'}, {'bbox': '1,2,3,4', 'near': '1,2'}, {'type': 'street', 'near': '1,2'},
+                       {'bbox': 'nan,0,1,1'}, {'bbox': '0,-inf,1,1'}, {'near': '91,4'}, {'bbox': '-100,0,1,1'},
+                       {'near': '52,181'}, {'bbox': '0,0,1,-200'},
+                       {'near': '52,4', 'radius': 'nan'}, {'near': '52,4', 'radius': '-1'}]:
+            self.assertEqual(self.client.get(url, params).status_code, 400)
+
+
+class ResidenceClusterTests(TestCase):
+    def setUp(self):
+        for i in range(3):
+            create_ledger_rows(i)
+        # Person 0 lives at an address with coordinates, person 1 at one without in a place with coordinates, and
+        # person 2 nowhere on the map
+        Address.objects.filter(house_number='0').update(latitude=Decimal('52.159000'), longitude=Decimal('4.488300'))
+        Place.objects.filter(name='Place 1').update(latitude=Decimal('52.370000'), longitude=Decimal('4.890000'))
+
+    def snapshot(self):
+        return list(ResidenceCluster.objects.order_by('zoom', 'decade', 'x', 'y').values(
+            'zoom', 'decade', 'x', 'y', 'clients', 'latitude', 'longitude'))
+
+    def test_build(self):
+        build_residence_clusters(log=lambda message: None)
+        self.assertEqual(set(ResidenceCluster.objects.values_list('decade', flat=True)), {1750, 1760})
+        cluster = ResidenceCluster.objects.get(zoom=0, decade=1750)
+        self.assertEqual(cluster.clients, 2)
+        self.assertAlmostEqual(cluster.latitude, (52.159 + 52.37) / 2)
+        self.assertEqual(ResidenceCluster.objects.filter(zoom=MAX_ZOOM, decade=1750).count(), 2)
+        self.assertEqual(len(residence_clusters(MAX_ZOOM, 1755, 52.1, 4.4, 52.2, 4.5)), 1)
+        self.assertEqual(len(residence_clusters(MAX_ZOOM, 1755, 52.1, 4.5, 52.2, 4.6)), 0)
+        self.assertEqual(len(residence_clusters(8, 1750, 52, 4, 53, 5)), 2)
+
+    def test_changes_match_a_rebuild(self):
+        build_residence_clusters(log=lambda message: None)
+        person0, person1 = Person.objects.get(short_name='Person 0'), Person.objects.get(short_name='Person 1')
+        with self.captureOnCommitCallbacks(execute=True):
+            # Moving within the same cell does not count twice
+            PeriodOfResidence.objects.create(person=person0, address=Address.objects.get(house_number='0'),
+                                             start_year=1758, end_year=None)
+        with self.captureOnCommitCallbacks(execute=True):
+            residence = person1.periodofresidence_set.get()
+            residence.start_year, residence.end_year = 1790, 1801
+            residence.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            place = Place.objects.get(name='Place 2')
+            place.latitude, place.longitude = Decimal('51.920000'), Decimal('4.480000')
+            place.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            collection = Collection.objects.get(short_title='Collection 2')
+            collection.client = Person.objects.get(short_name='Other person 2')
+            collection.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            residence = Person.objects.get(short_name='Person 2').periodofresidence_set.get()
+            residence.person = collection.client
+            residence.save()
+
+        self.assertEqual([(cluster.decade, cluster.clients) for cluster in ResidenceCluster.objects.filter(
+            zoom=0, decade__in=[1750, 1770, 1790]).order_by('decade')], [(1750, 2), (1770, 1), (1790, 2)])
+        incremental = self.snapshot()
+        build_residence_clusters(log=lambda message: None)
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_only_moved_locations_update(self):
+        place = Place.objects.get(name='Place 1')
+        with self.captureOnCommitCallbacks() as callbacks:
+            place.name = 'Place one'
+            place.save()
+        self.assertNotIn(update_residence_clusters, [getattr(callback, 'func', None) for callback in callbacks])
+        with self.captureOnCommitCallbacks() as callbacks:
+            place.latitude = Decimal('52.380000')
+            place.save()
+        self.assertIn(update_residence_clusters, [getattr(callback, 'func', None) for callback in callbacks])
+
+    def test_commit_updates_only_its_own_decades(self):
+        build_residence_clusters(log=lambda message: None)
+        residence0, residence1 = (Person.objects.get(short_name=f'Person {i}').periodofresidence_set.get()
+                                  for i in range(2))
+        # The callbacks of a transaction that has not committed yet, like one of another thread
+        with self.captureOnCommitCallbacks() as callbacks:
+            residence0.start_year, residence0.end_year = 1770, 1779
+            residence0.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            residence1.start_year, residence1.end_year = 1790, 1799
+            residence1.save()
+        decades = ResidenceCluster.objects.filter(zoom=0).order_by('decade').values_list('decade', flat=True)
+        # Both old decades are recomputed without residence 0, which its own callback then adds to 1770
+        self.assertEqual(list(decades), [1790])
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(list(decades.all()), [1770, 1790])
+
+    def test_view(self):
+        build_residence_clusters(log=lambda message: None)
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        url = reverse('luchtmans:residence_clusters')
+        results = self.client.get(url, {'zoom': 2, 'decade': 1755, 'bbox': '40,-10,60,20'}).json()['results']
+        self.assertEqual([result['clients'] for result in results], [2])
+        self.assertEqual(self.client.get(url, {'zoom': 2, 'decade': 1755}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'zoom': 2, 'decade': 1755, 'bbox': '40,-190,60,20'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'zoom': 'x', 'decade': 1755, 'bbox': '1,2,3,4'}).status_code, 400)
+
+
+class GeocodingTests(TestCase):
+    def setUp(self):
+        for i in range(2):
+            create_ledger_rows(i)
+        Place.objects.filter(name='Place 0').update(wikidata_id='Q43631')
+        Address.objects.filter(house_number='0').update(streetname_old='Breede Straat')
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_csv(self, rows):
+        path = self.directory / 'gazetteer.csv'
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(['type', 'name', 'place', 'house_number', 'wikidata_id', 'latitude', 'longitude'])
+            writer.writerows(rows)
+        return path
+
+    def geocode(self, path, *args):
+        output = io.StringIO()
+        call_command('geocode', str(path), *args, processes=1, stdout=output)
+        return output.getvalue()
+
+    def coordinates(self, model, **kwargs):
+        obj = model.objects.get(**kwargs)
+        return obj.latitude, obj.longitude
+
+    def test_geocode(self):
+        path = self.write_csv([
+            ['place', 'Leiden', '', '', 'Q43631', '52.160000', '4.490000'],
+            # A misspelled name
+            ['place', 'Pleace 1', '', '', '', '52.370000', '4.890000'],
+            ['street', 'Breedestraet', 'Place 0', '', '', '52.159000', '4.488000'],
+            ['street', 'Breedestraet', 'Place 0', '0', '', '52.159500', '4.488500'],
+            ['street', 'Streat 1', 'Pleace 1', '', '', '52.371000', '4.891000'],
+        ])
+        self.assertIn('Matched 2 of 2 addresses', self.geocode(path))
+
+        self.assertEqual(self.coordinates(Place, name='Place 0'), (Decimal('52.160000'), Decimal('4.490000')))
+        self.assertEqual(self.coordinates(Place, name='Place 1'), (Decimal('52.370000'), Decimal('4.890000')))
+        # The house, matched on the old street name, and the street
+        self.assertEqual(self.coordinates(Address, house_number='0'), (Decimal('52.159500'), Decimal('4.488500')))
+        self.assertEqual(self.coordinates(Address, house_number='1'), (Decimal('52.371000'), Decimal('4.891000')))
+        self.assertEqual(Address.objects.get(house_number='1').geohash, geohash(52.371, 4.891))
+        self.assertEqual(ResidenceCluster.objects.get(zoom=0, decade=1750).clients, 2)
+
+        # Only the rows whose names changed are matched again
+        Street.objects.filter(name='Street 1').update(name='Nowhere')
+        output = self.geocode(path)
+        self.assertIn('Matched 0 of 0 places', output)
+        self.assertIn('Matched 0 of 1 addresses', output)
+        self.assertEqual(self.coordinates(Address, house_number='1'), (Decimal('52.371000'), Decimal('4.891000')))
+        self.assertIn('Matched 2 of 2 places', self.geocode(path, '--all', '--model', 'place'))
+
+    def test_unmatched_keep_their_coordinates(self):
+        # Coordinates from elsewhere, such as Wikidata
+        Place.objects.filter(name='Place 1').update(latitude=Decimal('52.370000'), longitude=Decimal('4.890000'))
+        path = self.write_csv([['place', 'Elsewhere', '', '', '', '50.000000', '5.000000']])
+        self.assertIn('Matched 0 of 2 places', self.geocode(path, '--model', 'place'))
+        self.assertEqual(self.coordinates(Place, name='Place 1'), (Decimal('52.370000'), Decimal('4.890000')))
+        # The digest is stored all the same, so the next run skips it
+        self.assertNotEqual(Place.objects.get(name='Place 1').geocoded_input, '')
+        self.assertIn('Matched 0 of 0 places', self.geocode(path, '--model', 'place'))
+
+    def test_geojson(self):
+        path = self.directory / 'gazetteer.geojson'
+        path.write_text(json.dumps({'type': 'FeatureCollection', 'features': [{
+            'type': 'Feature', 'properties': {'type': 'street', 'name': 'Street 1', 'place': 'Place 1'},
+            'geometry': {'type': 'LineString', 'coordinates': [[4.0, 52.0], [4.2, 52.2]]},
+        }]}))
+        self.geocode(path, '--model', 'address')
+        self.assertEqual(self.coordinates(Address, house_number='1'), (Decimal('52.100000'), Decimal('4.100000')))
+        self.assertEqual(self.coordinates(Address, house_number='0'), (None, None))
+
+    def test_invalid_gazetteer(self):
+        with self.assertRaisesMessage(CommandError, "Unknown gazetteer format"):
+            self.geocode(self.directory / 'gazetteer.txt')
+        with self.assertRaisesMessage(CommandError, "Row 1: invalid coordinates"):
+            self.geocode(self.write_csv([['place', 'Leiden', '', '', '', 'north', '4.49']]))
+
+
+def wikidata_entity(entity_id, labels=None, **claims):
+    """A Wikidata dump entity with the labels {language: label} and claims {property: [(rank, value), ...]}."""
+    return {
+        'type': 'item', 'id': entity_id,
+        'labels': {language: {'language': language, 'value': label} for language, label in (labels or {}).items()},
+        'claims': {property_id: [{'mainsnak': {'snaktype': 'value', 'property': property_id,
+                                               'datavalue': {'value': value}}, 'rank': rank}
+                                 for rank, value in statements] for property_id, statements in claims.items()},
+    }
+
+
+class WikidataEnrichmentTests(TestCase):
+    def setUp(self):
+        for i in range(2):
+            create_ledger_rows(i)
+        Place.objects.filter(name='Place 0').update(wikidata_id='Q43631')
+        Place.objects.filter(name='Place 1').update(wikidata_id='https://www.wikidata.org/wiki/Q727')
+        Person.objects.filter(short_name='Person 0').update(wikidata_id='Q5598')
+        person = Person.objects.get(short_name='Person 1')
+        person.wikidata_id, person.date_of_birth = 'Q5582', '1690'
+        person.save()
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_dump(self, name, entities):
+        path = self.directory / name
+        lines = '[\n' + ',\n'.join(json.dumps(entity) for entity in entities) + '\n]\n'
+        with open_dump(path, 'wt') as file:
+            file.write(lines)
+        return path
+
+    def test_enrich(self):
+        coordinates = {'latitude': 52.16, 'longitude': 4.49, 'globe': 'http://www.wikidata.org/entity/Q2'}
+        julian = {'time': '+1700-02-18T00:00:00Z', 'precision': 11,
+                  'calendarmodel': 'http://www.wikidata.org/entity/Q1985786'}
+        path = self.write_dump('dump.json.bz2', [
+            wikidata_entity('Q1', {'en': 'Universe'}),
+            wikidata_entity('Q43631', {'en': 'Leiden', 'nl': 'Leiden'}, P625=[
+                ('deprecated', {**coordinates, 'latitude': 0}), ('normal', coordinates)]),
+            wikidata_entity('Q727', {'en': 'Amsterdam', 'nl': 'Amsterdam'}),
+            wikidata_entity('Q5598', P569=[('normal', {'time': '+1606-07-15T00:00:00Z', 'precision': 9}),
+                                           ('preferred', julian)],
+                            P570=[('normal', {'time': '+1660-00-00T00:00:00Z', 'precision': 8})]),
+            wikidata_entity('Q5582', P569=[('normal', {'time': '+1853-03-30T00:00:00Z', 'precision': 11})]),
+        ])
+        output = io.StringIO()
+        call_command('enrich_wikidata', str(path), processes=1, stdout=output)
+        self.assertIn('Found 4 of 4 entities', output.getvalue())
+
+        place = Place.objects.get(wikidata_id='Q43631')
+        self.assertEqual((place.latitude, place.longitude), (Decimal('52.160000'), Decimal('4.490000')))
+        self.assertEqual(place.geohash, geohash(52.16, 4.49))
+        # Only empty names are filled in
+        self.assertEqual((place.name_en, place.name_nl), ('Place 0', 'Leiden'))
+        self.assertIn('leiden', place.search_name)
+        self.assertIsNone(Place.objects.get(name_nl='Amsterdam').latitude)
+        person = Person.objects.get(short_name='Person 0')
+        self.assertEqual((person.date_of_birth, person.birth_earliest), ('1700-02-28', date(1700, 2, 28)))
+        self.assertEqual((person.date_of_death, person.death_earliest), ('c. 1665', date(1660, 1, 1)))
+        self.assertEqual(Person.objects.get(short_name='Person 1').date_of_birth, '1690')
+
+    def test_pool_and_gzip(self):
+        path = self.write_dump('dump.json.gz', [wikidata_entity('Q727', {'nl': 'Amsterdam'})])
+        output = io.StringIO()
+        call_command('enrich_wikidata', str(path), processes=2, batch_size=1, stdout=output)
+        self.assertIn('Found 1 of 4 entities', output.getvalue())
+        self.assertEqual(Place.objects.get(wikidata_id__endswith='Q727').name_nl, 'Amsterdam')
+
+    def test_invalid_dump(self):
+        path = self.directory / 'dump.json.bz2'
+        path.write_bytes(b'not bzip2')
+        with self.assertRaises(CommandError):
+            call_command('enrich_wikidata', str(path), processes=1, stdout=io.StringIO())
+
+
+class PersonDedupeTests(TestCase):
+    def setUp(self):
+        for i in range(2):
+            create_ledger_rows(i)
+        # Distinct names for the persons of the ledger rows, so they are no duplicates of each other
+        for person, name in zip(Person.objects.order_by('pk'), ['Elsevier', 'Boerhaave', 'Hemsterhuis', 'Bakker']):
+            person.short_name = person.surname = name
+            person.save()
+        self.person, self.other_person, self.client_person = Person.objects.order_by('pk')[:3]
+        self.types = RelationType.objects.order_by('pk')
+
+    def create_person(self, short_name, **fields):
+        return Person.objects.create(short_name=short_name, **fields)
+
+    def test_candidate_pairs(self):
+        initials = self.create_person('J. Luzac', date_of_birth='1745')
+        full = self.create_person('Johan Luzac', first_names='Johan', surname='Luzac', date_of_birth='c. 1746')
+        other_name = self.create_person('Jan Luzac', first_names='Jan', surname='Luzac', date_of_birth='1745')
+        self.create_person('J. Luzac', date_of_birth='1700')
+        lusac = self.create_person('J. Lusac', date_of_birth='1745', date_of_death='1800')
+        died_elsewhere = self.create_person('Joh. Luzak', date_of_birth='1745', date_of_death='1760')
+
+        pairs = {(pk, other): score for pk, other, score in candidate_pairs()}
+        self.assertEqual(pairs[initials.pk, full.pk], 1.0)
+        self.assertIn((initials.pk, other_name.pk), pairs)
+        self.assertNotIn((full.pk, other_name.pk), pairs)
+        self.assertIn((initials.pk, died_elsewhere.pk), pairs)
+        self.assertIn((initials.pk, lusac.pk), pairs)
+        self.assertNotIn((lusac.pk, died_elsewhere.pk), pairs)
+        # Clients are never duplicates of each other
+        self.assertNotIn((self.person.pk, self.client_person.pk), pairs)
+        self.assertEqual(merge_groups([(3, 2), (2, 1), (5, 4)]), {2: 1, 3: 1, 5: 4})
+
+    def test_merge(self):
+        person, other_person = self.person, self.other_person
+        duplicate = self.create_person('Dup', date_of_birth='1745', wikidata_id='Q1')
+        residence = person.periodofresidence_set.get()
+        PeriodOfResidence.objects.create(person=duplicate, address=residence.address, start_year=1750, end_year=1760)
+        PeriodOfResidence.objects.create(person=duplicate, address=residence.address, start_year=1770)
+        work_relation = PersonWorkRelation.objects.get(person=person)
+        PersonWorkRelation.objects.create(person=duplicate, work=work_relation.work, role=work_relation.role)
+        third = self.create_person('Third')
+        bulk_add_person_relations([(duplicate.pk, other_person.pk, [self.types[1].pk]),
+                                   (duplicate.pk, third.pk, [self.types[0].pk]),
+                                   (duplicate.pk, person.pk, [self.types[0].pk])])
+
+        output = io.StringIO()
+        call_command('merge_persons', person.pk, duplicate.pk, stdout=output)
+        self.assertIn('Merged 1 persons', output.getvalue())
+
+        self.assertFalse(Person.objects.filter(pk=duplicate.pk).exists())
+        event = CRUDEvent.objects.get(content_type=ContentType.objects.get_for_model(Person),
+                                      object_id=str(duplicate.pk))
+        self.assertEqual((event.event_type, event.object_repr), (CRUDEvent.DELETE, 'Dup'))
+        self.assertEqual(json.loads(event.changed_fields), {'merged_into': person.pk})
+        person.refresh_from_db()
+        self.assertEqual((person.date_of_birth, person.birth_earliest, person.wikidata_id),
+                         ('1745', date(1745, 1, 1), 'Q1'))
+        self.assertEqual(sorted(person.periodofresidence_set.values_list('start_year', flat=True)), [1750, 1770])
+        self.assertEqual(PersonWorkRelation.objects.filter(person=person).count(), 1)
+        relations = {(relation.from_person_id, relation.to_person_id): set(relation.types.values_list('pk', flat=True))
+                     for relation in PersonPersonRelation.objects.filter(
+                         Q(from_person__in=[person, other_person, third]) | Q(to_person__in=[person, third]))}
+        self.assertEqual(relations, {
+            (person.pk, other_person.pk): {self.types[0].pk, self.types[1].pk},
+            (other_person.pk, person.pk): {self.types[0].pk, self.types[1].pk},
+            (person.pk, third.pk): {self.types[0].pk},
+            (third.pk, person.pk): {self.types[0].pk},
+        })
+
+    def test_merge_moves_collection(self):
+        build_ledger_entries(log=lambda message: None)
+        build_price_aggregates(log=lambda message: None)
+        person = self.create_person('Keeper')
+        call_command('merge_persons', person.pk, self.client_person.pk, stdout=io.StringIO())
+
+        self.assertEqual(Collection.objects.get(short_title='Collection 1').client, person)
+        self.assertEqual(list(LedgerEntry.objects.filter(collection__short_title='Collection 1').values_list(
+            'client_id', 'client_name')), [(person.pk, 'Keeper')])
+        self.assertEqual(set(PriceAggregate.objects.filter(dimension='client').values_list('key', flat=True)),
+                         {self.person.pk, person.pk})
+
+    def test_merge_errors(self):
+        with self.assertRaisesMessage(CommandError, 'each have a collection'):
+            call_command('merge_persons', self.person.pk, self.client_person.pk, stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, 'Unknown persons'):
+            call_command('merge_persons', self.person.pk, 999_999, stdout=io.StringIO())
+        self.assertEqual(Person.objects.count(), 4)
+
+    def test_find_and_merge_file(self):
+        self.create_person('J. Luzac', date_of_birth='1745')
+        self.create_person('Johan Luzac', first_names='Johan', surname='Luzac', date_of_birth='1745')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = Path(directory) / 'duplicates.csv'
+        output = io.StringIO()
+        call_command('find_duplicate_persons', output=path, stdout=output)
+        self.assertIn('Found 1 possible duplicates', output.getvalue())
+        with open(path, newline='', encoding='utf-8') as file:
+            self.assertEqual([row['duplicate_name'] for row in csv.DictReader(file)], ['Johan Luzac'])
+        call_command('merge_persons', file=path, min_score=0.9, stdout=io.StringIO())
+        self.assertEqual(list(Person.objects.filter(short_name__contains='Luzac').values_list('short_name', 'surname')),
+                         [('J. Luzac', 'Luzac')])
@@ -0,0 +1,19 @@
+from django.urls import path
+
+from luchtmans import views
+
+app_name = 'luchtmans'
+
+urlpatterns = [
+    path('search/', views.search_view, name='search'),
+    path('persons/', views.persons_view, name='persons'),
+    path('graph/path/', views.graph_path_view, name='graph_path'),
+    path('graph/neighbourhood/', views.graph_neighbourhood_view, name='graph_neighbourhood'),
+    path('graph/statistics/', views.graph_statistics_view, name='graph_statistics'),
+    path('editions/also-bought/', views.also_bought_view, name='also_bought'),
+    path('collections/similar/', views.similar_collections_view, name='similar_collections'),
+    path('analytics/prices/', views.price_aggregates_view, name='price_aggregates'),
+    path('geo/', views.geo_view, name='geo'),
+    path('residences/clusters/', views.residence_clusters_view, name='residence_clusters'),
+    path('export/<str:table>/', views.export_view, name='export'),
+]
@@ -1,3 +1,420 @@
-from django.shortcuts import render
+import math
+from datetime import MAXYEAR, MINYEAR
 
-# Create your views here.
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+
+from luchtmans.analytics import PERCENTILES, price_aggregates
+from luchtmans.cache import get_or_compute, lookup_choices, related_models
+from luchtmans.clusters import residence_clusters
+from luchtmans.copurchases import also_bought, similar_collections
+from luchtmans.export import FORMATS, export
+from luchtmans.graph import get_graph
+from luchtmans.models import (Person, Work, Edition, Collection, Item, PersonPersonRelation, RelationType,
+                              EditionCoPurchase, CollectionSimilarity, STCNGenre, GenreParisianCategory, PriceAggregate,
+                              Country, Place, Address, ResidenceCluster)
+from luchtmans.search import search
+
+SEARCH_MODELS = {
+    'person': Person,
+    'work': Work,
+    'edition': Edition,
+    'collection': Collection,
+    'item': Item,
+}
+
+# The models whose ids are the keys of the price aggregates; the keys of the year dimension are years
+PRICE_AGGREGATE_MODELS = {
+    PriceAggregate.Dimension.EDITION: Edition,
+    PriceAggregate.Dimension.STCN_GENRE: STCNGenre,
+    PriceAggregate.Dimension.GENRE_PARISIAN_CATEGORY: GenreParisianCategory,
+    PriceAggregate.Dimension.CLIENT: Person,
+}
+GEO_MODELS = {
+    'country': Country,
+    'place': Place,
+    'address': Address,
+}
+
+PRICE_AGGREGATE_ORDERS = ['items', 'copies', 'total', 'mean', 'median']
+PRICE_STATISTICS = ['items', 'copies', 'priced_items', 'total', 'mean', *PERCENTILES, 'stale']
+
+
+@staff_member_required
+def search_view(request):
+    """
+    Ranked full-text search over persons, works, editions, collections and items.
+
+    Parameters: q (the search terms), type (one or more of the keys of SEARCH_MODELS, default all) and limit (the
+    maximum number of results, default 20).
+    """
+    term = request.GET.get('q', '')
+    types = request.GET.getlist('type') or list(SEARCH_MODELS)
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 20)), 100))
+        models = [SEARCH_MODELS[type] for type in types]
+    except (KeyError, ValueError) as e:
+        return HttpResponseBadRequest(f'Invalid parameter: {e}')
+
+    def compute():
+        results = []
+        for type, model in zip(types, models):
+            for obj in search(model.objects.all(), term).order_by('-search_rank', 'pk')[:limit]:
+                results.append({
+                    'type': type,
+                    'id': obj.pk,
+                    'label': str(obj),
+                    'rank': obj.search_rank,
+                    'url': reverse(f'admin:luchtmans_{model._meta.model_name}_change', args=[obj.pk]),
+                })
+        return sorted(results, key=lambda result: -result['rank'])[:limit]
+
+    return JsonResponse({'results': get_or_compute('search', models, [term, types, limit], compute)})
+
+
+def parse_years(value):
+    """Parse '1770' or '1770-1790' into a (start, end) pair of years that a date can have."""
+    start, _, end = value.partition('-')
+    years = int(start), int(end or start)
+    if not all(MINYEAR <= year <= MAXYEAR for year in years):
+        raise ValueError(f'year out of range in {value!r}')
+    return years
+
+
+@staff_member_required
+def persons_view(request):
+    """
+    Persons ordered by the first day they may have been alive.
+
+    Parameters: alive_in (a year or a range of years like 1770-1790, see PersonQuerySet.alive_in()), q (search
+    terms), limit (default 50) and offset.
+    """
+    try:
+        alive_in = parse_years(request.GET['alive_in']) if request.GET.get('alive_in') else None
+        limit = max(1, min(int(request.GET.get('limit', 50)), 500))
+        offset = max(0, int(request.GET.get('offset', 0)))
+    except ValueError as e:
+        return HttpResponseBadRequest(f'Invalid parameter: {e}')
+    term = request.GET.get('q', '')
+
+    def compute():
+        persons = Person.objects.all()
+        if alive_in:
+            persons = persons.alive_in(*alive_in)
+        if term:
+            persons = search(persons, term)
+        persons = persons.order_by('alive_from', 'pk')[offset:offset + limit]
+        return [{
+            'id': person.pk,
+            'label': str(person),
+            'date_of_birth': person.date_of_birth,
+            'date_of_death': person.date_of_death,
+            'birth': [person.birth_earliest, person.birth_latest],
+            'death': [person.death_earliest, person.death_latest],
+            'url': reverse('admin:luchtmans_person_change', args=[person.pk]),
+        } for person in persons]
+
+    results = get_or_compute('persons', [Person], [alive_in, term, limit, offset], compute)
+    return JsonResponse({'results': results})
+
+
+def person_results(person_ids):
+    labels = {person.pk: str(person) for person in Person.objects.filter(pk__in=person_ids)}
+    return [{
+        'id': person_id,
+        'label': labels.get(person_id, ''),
+        'url': reverse('admin:luchtmans_person_change', args=[person_id]),
+    } for person_id in person_ids]
+
+
+def parse_graph_parameters(request, *names):
+    """Parse the integer parameters `names` and the relation types to follow (type, default any) of a graph view."""
+    values = [int(request.GET[name]) for name in names]
+    types = [int(type) for type in request.GET.getlist('type')] or None
+    return *values, types
+
+
+def parse_depth(value, maximum):
+    """Parse a number of relations, at most `maximum`."""
+    depth = int(value)
+    if depth < 0:
+        raise ValueError(f'negative depth {depth}')
+    return min(depth, maximum)
+
+
+@staff_member_required
+def graph_path_view(request):
+    """
+    The shortest chain of relations between two persons.
+
+    Parameters: from and to (person ids), type (one or more relation type ids to follow, default any) and max_depth
+    (the maximum number of relations, default and at most 10). The path is null if there is no such chain.
+    """
+    try:
+        from_id, to_id, types = parse_graph_parameters(request, 'from', 'to')
+        max_depth = parse_depth(request.GET.get('max_depth', 10), 10)
+    except (KeyError, ValueError) as e:
+        return HttpResponseBadRequest(f'Invalid parameter: {e}')
+
+    path = get_graph().shortest_path(from_id, to_id, max_depth, types)
+    if path is None:
+        return JsonResponse({'path': None})
+    type_labels = dict(lookup_choices(RelationType))
+    relation_types = {}
+    for relation_id, type_id in PersonPersonRelation.types.through.objects.filter(
+            personpersonrelation__in=path.relations).values_list('personpersonrelation_id', 'relationtype_id'):
+        relation_types.setdefault(relation_id, []).append(type_labels.get(type_id, ''))
+    return JsonResponse({'path': person_results(path.persons), 'relations': [
+        {'id': relation_id, 'types': relation_types.get(relation_id, [])} for relation_id in path.relations
+    ]})
+
+
+@staff_member_required
+def graph_neighbourhood_view(request):
+    """
+    The persons at most `depth` relations away from a person, nearest first.
+
+    Parameters: person (a person id), depth (default 1, at most 3), type (one or more relation type ids to follow,
+    default any) and limit (default 100, at most 1000).
+    """
+    try:
+        person_id, types = parse_graph_parameters(request, 'person')
+        depth = parse_depth(request.GET.get('depth', 1), 3)
+        limit = max(1, min(int(request.GET.get('limit', 100)), 1000))
+    except (KeyError, ValueError) as e:
+        return HttpResponseBadRequest(f'Invalid parameter: {e}')
+
+    distances = get_graph().neighbourhood(person_id, depth, types)
+    nearest = sorted(distances, key=lambda person_id: (distances[person_id], person_id))[:limit]
+    results = [result | {'distance': distances[result['id']]} for result in person_results(nearest)]
+    return JsonResponse({'count': len(distances), 'results': results})
+
+
+@staff_member_required
+def graph_statistics_view(request):
+    """
+    The connected components and the number of relations per person.
+
+    Parameters: person (optional), to also list the persons connected to that person by any chain of relations, and
+    limit (the maximum number of those persons, default 100, at most 1000).
+    """
+    try:
+        person_id = int(request.GET['person']) if request.GET.get('person') else None
+        limit = max(1, min(int(request.GET.get('limit', 100)), 1000))
+    except ValueError as e:
+        return HttpResponseBadRequest(f'Invalid parameter: {e}')
+
+    graph = get_graph()
+    sizes = graph.component_sizes()
+    degrees = graph.degree_statistics()
+    result = {
+        'components': len(sizes),
+        'largest_components': sizes[:10].tolist(),
+        'degrees': degrees._asdict() | {'top': [
+            result | {'degree': degree} for result, (_, degree) in zip(person_results([pk for pk, _ in degrees.top]),
+                                                                        degrees.top)
+        ]},
+    }
+    if person_id is not None:
+        component = sorted(graph.component(person_id))
+        result['component'] = {'size': len(component), 'persons': person_results(component[:limit])}
+    return JsonResponse(result)
+
+
+@staff_member_required
+def also_bought_view(request):
+    """
+    The editions bought most often by the clients who bought an edition, from the precomputed co-purchases.
+
+    Parameters: edition (an edition id) and limit (default 10, at most 20, the number of co-purchases kept per edition).
+    """
+    try:
+        edition_id = int(request.GET['edition'])
+        limit = max(1, min(int(request.GET.get('limit', 10)), 20))
+    except (KeyError, ValueError) as e:
+        return HttpResponseBadRequest(f'Invalid parameter: {e}')
+
+    def compute():
+        return [{
+            'id': co_purchase.other_id,
+            'label': str(co_purchase.other),
+            'collections': co_purchase.collections,
+            'url': reverse('admin:luchtmans_edition_change', args=[co_purchase.other_id]),
+        } for co_purchase in also_bought(edition_id, limit)]
+
+    results = get_or_compute('also_bought', [EditionCoPurchase, Edition], [edition_id, limit], compute)
+    return JsonResponse({'results': results})
+
+
+@staff_member_required
+def similar_collections_view(request):
+    """
+    The collections most like a collection, by the editions they have in common relative to their size.
+
+    Parameters: collection (a collection id) and limit (default 10, at most 20).
+    """
+    try:
+        collection_id = int(request.GET['collection'])
+        limit = max(1, min(int(request.GET.get('limit', 10)), 20))
+    except (KeyError, ValueError) as e:
+        return HttpResponseBadRequest(f'Invalid parameter: {e}')
+
+    def compute():
+        return [{
+            'id': similarity.other_id,
+            'label': str(similarity.other),
+            'editions': similarity.editions,
+            'similarity': similarity.similarity,
+            'url': reverse('admin:luchtmans_collection_change', args=[similarity.other_id]),
+        } for similarity in similar_collections(collection_id, limit)]
+
+    results = get_or_compute('similar_collections', [CollectionSimilarity, Collection], [collection_id, limit],
+                             compute)
+    return JsonResponse({'results': results})
+
+
+@staff_member_required
+def price_aggregates_view(request):
+    """
+    Price statistics of the items per edition, genre, year or client, from the precomputed aggregates. Prices are in
+    guilders, as strings; stale is true for statistics of many items that changed since they were computed.
+
+    Parameters: dimension (edition, stcn_genre, genre_parisian_category, year or client), key (optional, one or more
+    ids or years; by default the keys that rank highest), order (items, copies, total, mean or median, default items)
+    and limit (default 20, at most 100).
+    """
+    dimension = request.GET.get('dimension')
+    order_by = request.GET.get('order', 'items')
+    try:
+        keys = [int(key) for key in request.GET.getlist('key')] or None
+        limit = max(1, min(int(request.GET.get('limit', 20)), 100))
+        if dimension not in PriceAggregate.Dimension.values:
+            raise ValueError(f'unknown dimension {dimension!r}')
+        if order_by not in PRICE_AGGREGATE_ORDERS:
+            raise ValueError(f'unknown order {order_by!r}')
+    except ValueError as e:
+        return HttpResponseBadRequest(f'Invalid parameter: {e}')
+    model = PRICE_AGGREGATE_MODELS.get(dimension)
+
+    def compute():
+        aggregates = list(price_aggregates(dimension, keys, order_by, limit))
+        labels = model.objects.in_bulk([aggregate.key for aggregate in aggregates]) if model else {}
+        return [{
+            'key': aggregate.key,
+            'label': str(labels.get(aggregate.key, aggregate.key)),
+            'url': reverse(f'admin:luchtmans_{model._meta.model_name}_change', args=[aggregate.key]) if model else None,
+        } | {name: getattr(aggregate, name) for name in PRICE_STATISTICS} for aggregate in aggregates]
+
+    results = get_or_compute('price_aggregates', [PriceAggregate] + ([model] if model else []),
+                             [dimension, keys, order_by, limit], compute)
+    return JsonResponse({'dimension': dimension, 'results': results})
+
+
+def parse_floats(value, count):
+    """
+    Parse `count` comma-separated coordinates; as in bbox and near, every even position (0, 2) is a latitude and every
+    odd position a longitude.
+    """
+    values = [float(part) for part in value.split(',')]
+    if len(values) != count:
+        raise ValueError(f'expected {count} numbers, got {value!r}')
+    if not all(math.isfinite(number) for number in values):
+        raise ValueError(f'expected finite numbers, got {value!r}')
+    if any(abs(latitude) > 90 for latitude in values[::2]):
+        raise ValueError(f'latitude out of range in {value!r}')
+    if any(abs(longitude) > 180 for longitude in values[1::2]):
+        raise ValueError(f'longitude out of range in {value!r}')
+    return values
+
+
+@staff_member_required
+def geo_view(request):
+    """
+    Countries, places or addresses by their coordinates (see luchtmans.geo), with their distance in meters if near is
+    given.
+
+    Parameters: type (country, place or address, default address), and either bbox (south,west,north,east in
+    degrees) or near (latitude,longitude) with radius (optional, in meters; without it the nearest are returned,
+    nearest first), and limit (default 10, at most 100).
+    """
+    model = GEO_MODELS.get(request.GET.get('type', 'address'))
+    try:
+        if model is None:
+            raise ValueError(f'unknown type {request.GET["type"]!r}')
+        bbox = parse_floats(request.GET['bbox'], 4) if request.GET.get('bbox') else None
+        near = parse_floats(request.GET['near'], 2) if request.GET.get('near') else None
+        radius = float(request.GET['radius']) if request.GET.get('radius') else None
+        if radius is not None and not (math.isfinite(radius) and radius >= 0):
+            raise ValueError(f'invalid radius {radius!r}')
+        limit = max(1, min(int(request.GET.get('limit', 10)), 100))
+        if (bbox is None) == (near is None):
+            raise ValueError('give either bbox or near')
+    except ValueError as e:
+        return HttpResponseBadRequest(f'Invalid parameter: {e}')
+
+    def compute():
+        objects = model.objects.all()
+        if model is Address:
+            objects = objects.select_related('street__place')
+        if bbox:
+            objects = objects.within_bbox(*bbox).order_by('pk')[:limit]
+        elif radius is not None:
+            objects = objects.within_radius(*near, radius).order_by('distance', 'pk')[:limit]
+        else:
+            objects = objects.nearest(*near, limit)
+        return [{
+            'id': obj.pk,
+            'label': str(obj),
+            'latitude': obj.latitude,
+            'longitude': obj.longitude,
+            'distance': getattr(obj, 'distance', None),
+            'url': reverse(f'admin:luchtmans_{model._meta.model_name}_change', args=[obj.pk]),
+        } for obj in objects]
+
+    results = get_or_compute('geo', related_models(model), [model._meta.model_name, bbox, near, radius, limit],
+                             compute)
+    return JsonResponse({'results': results})
+
+
+@staff_member_required
+def residence_clusters_view(request):
+    """
+    The clusters of clients who lived within a map viewport during a decade, see luchtmans.clusters.
+
+    Parameters: zoom (the zoom level of the map), decade (a year of the decade) and bbox (south,west,north,east in
+    degrees).
+    """
+    try:
+        zoom = int(request.GET['zoom'])
+        decade = int(request.GET['decade']) // 10 * 10
+        bbox = parse_floats(request.GET['bbox'], 4)
+    except (KeyError, ValueError) as e:
+        return HttpResponseBadRequest(f'Invalid parameter: {e}')
+
+    def compute():
+        return list(residence_clusters(zoom, decade, *bbox).values('clients', 'latitude', 'longitude'))
+
+    results = get_or_compute('residence_clusters', [ResidenceCluster], [zoom, decade, bbox], compute)
+    return JsonResponse({'results': results})
+
+
+@staff_member_required
+def export_view(request, table):
+    """
+    Stream a full table as a file: items, editions, persons, person_relations or person_editions (see
+    luchtmans.export).
+
+    Parameters: format (csv, jsonl or parquet, default csv), collection (optional, one or more collection ids) and
+    years (optional, a year or a range of years like 1770-1790).
+    """
+    file_format = request.GET.get('format', 'csv')
+    try:
+        collections = [int(pk) for pk in request.GET.getlist('collection')] or None
+        years = parse_years(request.GET['years']) if request.GET.get('years') else None
+        content = export(table, file_format, collections, years)
+    except ValueError as e:  # including ExportError
+        return HttpResponseBadRequest(f'Invalid parameter: {e}')
+    response = StreamingHttpResponse(content, content_type=FORMATS[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{table}.{file_format}"'
+    return response
@@ -0,0 +1,95 @@
+"""
+Reading entities from a Wikidata JSON dump, see luchtmans.enrichment.
+
+A dump, like latest-all.json.bz2 of dumps.wikimedia.org, is one JSON array with one entity per line, compressed with
+bzip2 or gzip. entity_lines() picks the lines of the wanted entities by the id near the start of the line, without
+parsing the JSON; parse_entity() takes the labels, the coordinates and the dates of birth and death from one of them.
+
+This module does not import Django, so the processes of the parsing pool can import it however they are started.
+"""
+import bz2
+import gzip
+import json
+import re
+from datetime import date
+
+# The id of an entity is the first "id" of its line, the ids of its statements come later
+ENTITY_ID = re.compile(rb'"id"\s*:\s*"([QPL]\d+)"')
+TIME = re.compile(r'^([+-])(\d+)-(\d\d)-(\d\d)T')
+
+COORDINATE_LOCATION = 'P625'
+DATE_OF_BIRTH = 'P569'
+DATE_OF_DEATH = 'P570'
+EARTH = 'http://www.wikidata.org/entity/Q2'
+JULIAN_CALENDAR = 'http://www.wikidata.org/entity/Q1985786'
+# The precisions of Wikidata times
+DECADE, YEAR, MONTH, DAY = 8, 9, 10, 11
+# Days from the Julian day number to date.toordinal()
+ORDINAL_OFFSET = 1_721_425
+
+
+def open_dump(path, mode='rb'):
+    path = str(path)
+    if path.endswith('.bz2'):
+        return bz2.open(path, mode)
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def entity_lines(file, ids):
+    """Yield the lines of the dump with the entities of the ids, without the comma that ends them."""
+    for line in file:
+        match = ENTITY_ID.search(line)
+        if match and match[1].decode() in ids:
+            yield line.rstrip().rstrip(b',')
+
+
+def best_value(claims, property_id):
+    """The value of the preferred statement of the property, or else of the first normal one, or None."""
+    statements = [statement for statement in claims.get(property_id, [])
+                  if statement.get('rank') != 'deprecated' and statement['mainsnak'].get('snaktype') == 'value']
+    statements.sort(key=lambda statement: statement.get('rank') != 'preferred')
+    return statements[0]['mainsnak']['datavalue']['value'] if statements else None
+
+
+def julian_to_gregorian(year, month, day):
+    """The Gregorian date of a date in the Julian calendar."""
+    a = (14 - month) // 12
+    y, m = year + 4800 - a, month + 12 * a - 3
+    return date.fromordinal(day + (153 * m + 2) // 5 + 365 * y + y // 4 - 32083 - ORDINAL_OFFSET)
+
+
+def wikidata_date(value):
+    """A Wikidata time as a text that luchtmans.dates parses, or '' for times before the common era or vaguer than a
+    decade."""
+    match = value and TIME.match(value['time'])
+    if not match or match[1] == '-' or value['precision'] < DECADE:
+        return ''
+    year, month, day = int(match[2]), int(match[3]), int(match[4])
+    if value['precision'] == DECADE:
+        return f'c. {year // 10 * 10 + 5}'
+    if value['precision'] == YEAR:
+        return f'{year:04d}'
+    if value['precision'] == MONTH:
+        return f'{year:04d}-{month:02d}'
+    if value.get('calendarmodel') == JULIAN_CALENDAR:
+        return julian_to_gregorian(year, month, day).isoformat()
+    return f'{year:04d}-{month:02d}-{day:02d}'
+
+
+def parse_entity(line, languages):
+    """Return the id, the labels in the languages, the (latitude, longitude) and the dates of birth and death of the
+    entity on a line of the dump; missing values are None or ''."""
+    entity = json.loads(line)
+    claims = entity.get('claims', {})
+    location = best_value(claims, COORDINATE_LOCATION)
+    if location and location.get('globe', EARTH) != EARTH:
+        location = None
+    return {
+        'id': entity['id'],
+        'labels': {language: entity.get('labels', {}).get(language, {}).get('value', '') for language in languages},
+        'coordinates': (location['latitude'], location['longitude']) if location else None,
+        'birth': wikidata_date(best_value(claims, DATE_OF_BIRTH)),
+        'death': wikidata_date(best_value(claims, DATE_OF_DEATH)),
+    }